@@ -0,0 +1,167 @@
+# autoscale.py
+
+import os
+import time
+import logging
+
+from db import get_conn
+from metrics import AUTOSCALE_DECISIONS, AUTOSCALE_SIGNAL
+from utils import WORKER_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Granice broja radnika koje drži web proces (threadova, odnosno procesa radnika
+# uz --processes); AUTOSCALE_MAX=0 isključuje autoscaling
+AUTOSCALE_MIN = int(os.getenv("AUTOSCALE_MIN", 1))
+AUTOSCALE_MAX = int(os.getenv("AUTOSCALE_MAX", 0))
+
+# Koliko često (u sekundama) se odlučuje i za koji prozor se gleda čekanje u redu
+AUTOSCALE_INTERVAL = float(os.getenv("AUTOSCALE_INTERVAL", 5))
+AUTOSCALE_WINDOW = float(os.getenv("AUTOSCALE_WINDOW", 60))
+
+# Povećanje: spremnih pending zadataka po radniku clustera iznad UP_BACKLOG ili
+# čekanje do preuzimanja (p90, odnosno najstariji spremni zadatak) iznad UP_WAIT
+# sekundi. Smanjenje: oboje ispod DOWN_* praga. Između pragova se ništa ne mijenja.
+AUTOSCALE_UP_BACKLOG = float(os.getenv("AUTOSCALE_UP_BACKLOG", 32))
+AUTOSCALE_UP_WAIT = float(os.getenv("AUTOSCALE_UP_WAIT", 5))
+AUTOSCALE_DOWN_BACKLOG = float(os.getenv("AUTOSCALE_DOWN_BACKLOG", 2))
+AUTOSCALE_DOWN_WAIT = float(os.getenv("AUTOSCALE_DOWN_WAIT", 1))
+
+# Iznad ovog udjela zauzetog CPU-a novi radnici ne bi ništa ubrzali
+AUTOSCALE_CPU_HIGH = float(os.getenv("AUTOSCALE_CPU_HIGH", 0.9))
+
+# Histereza: odluka mora vrijediti toliko uzastopnih provjera (smanjenje sporije
+# od povećanja), a nakon promjene se COOLDOWN sekundi ništa ne mijenja
+AUTOSCALE_UP_CHECKS = int(os.getenv("AUTOSCALE_UP_CHECKS", 2))
+AUTOSCALE_DOWN_CHECKS = int(os.getenv("AUTOSCALE_DOWN_CHECKS", 6))
+AUTOSCALE_COOLDOWN = float(os.getenv("AUTOSCALE_COOLDOWN", 30))
+
+
+class CpuMeter:
+    """Udio zauzetog CPU-a (0..1) između dva poziva, iz /proc/stat; bez njega loadavg / broj jezgri."""
+
+    def __init__(self):
+        self._last = self._read()
+
+    @staticmethod
+    def _read():
+        try:
+            with open("/proc/stat") as f:
+                fields = [float(x) for x in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)   # idle + iowait
+        return sum(fields), idle
+
+    def usage(self) -> float:
+        now = self._read()
+        if now is None or self._last is None:
+            return min(os.getloadavg()[0] / (os.cpu_count() or 1), 1.0)
+        total, idle = now[0] - self._last[0], now[1] - self._last[1]
+        self._last = now
+        return 1 - idle / total if total > 0 else 0.0
+
+
+def load_sample(window: float = AUTOSCALE_WINDOW) -> dict:
+    """
+    Stanje reda za odluku: spremni pending zadaci, živi radnici clustera i
+    latencija preuzimanja, tj. koliko spreman zadatak čeka radnika (p90 u
+    zadnjih `window` sekundi ili starost najstarijeg spremnog zadatka, što je
+    veće; 0 kad je red prazan). Zadatak s odgodom je spreman od available_at.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              SELECT (SELECT count(*) FROM tasks
+                       WHERE status = 'pending'
+                         AND (available_at IS NULL OR available_at <= now())) AS pending,
+                     (SELECT extract(epoch FROM now() - min(coalesce(available_at, created_at)))
+                        FROM tasks
+                       WHERE status = 'pending'
+                         AND (available_at IS NULL OR available_at <= now())) AS oldest,
+                     (SELECT percentile_cont(0.9) WITHIN GROUP (
+                               ORDER BY extract(epoch FROM started_at - coalesce(available_at, created_at)))
+                        FROM tasks
+                       WHERE started_at > now() - make_interval(secs => %s)) AS wait_p90,
+                     (SELECT count(*) FROM worker_status
+                       WHERE last_seen > now() - make_interval(secs => %s)
+                         AND worker_id NOT LIKE '%%dispatch') AS workers;
+            """, (window, WORKER_TIMEOUT))
+            row = cur.fetchone()
+    # prazan red ne čeka, koliko god su dugo čekali nedavno preuzeti zadaci
+    wait = max(float(row["oldest"] or 0), float(row["wait_p90"] or 0)) if row["pending"] else 0.0
+    return {"pending": row["pending"], "workers": row["workers"], "wait": round(wait, 3)}
+
+
+class Autoscaler:
+    """
+    Odlučuje koliko radnika (threadova ili procesa) web proces drži, između
+    `minimum` i `maximum`. Povećava se za pola trenutnog broja (barem 1),
+    smanjuje za jednog; histereza je u razmaku pragova, broju uzastopnih
+    provjera i cooldownu nakon promjene.
+    """
+
+    def __init__(self, minimum: int, maximum: int, kind: str = "threads"):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.kind = kind
+        self.cpu = CpuMeter()
+        self.last_sample = {}
+        self.last_decision = None
+        self._streak = 0        # > 0 uzastopne provjere za povećanje, < 0 za smanjenje
+        self._changed_at = 0.0
+        self._checked_at = 0.0
+
+    def due(self) -> bool:
+        return time.monotonic() - self._checked_at >= AUTOSCALE_INTERVAL
+
+    def _wanted(self, s: dict) -> int:
+        backlog = s["pending"] / max(s["workers"], 1)
+        if backlog > AUTOSCALE_UP_BACKLOG or s["wait"] > AUTOSCALE_UP_WAIT:
+            return 1
+        if backlog < AUTOSCALE_DOWN_BACKLOG and s["wait"] < AUTOSCALE_DOWN_WAIT:
+            return -1
+        return 0
+
+    def decide(self, current: int, sample: dict = None) -> tuple:
+        """(ciljani broj radnika, razlog); cilj == current znači bez promjene."""
+        self._checked_at = time.monotonic()
+        if current < self.minimum or current > self.maximum:
+            return min(max(current, self.minimum), self.maximum), "bounds"
+        s = dict(sample if sample is not None else load_sample(), cpu=round(self.cpu.usage(), 3))
+        self.last_sample = s
+        for name in ("pending", "wait", "cpu"):
+            AUTOSCALE_SIGNAL.set(s[name], signal=name)
+
+        wanted = self._wanted(s)
+        if wanted > 0 and s["cpu"] >= AUTOSCALE_CPU_HIGH:
+            wanted = 0   # CPU je zasićen: novi radnici bi samo čekali na jezgru
+        if wanted == 0 or (wanted > 0) != (self._streak > 0):
+            self._streak = wanted
+        else:
+            self._streak += wanted
+
+        if time.monotonic() - self._changed_at < AUTOSCALE_COOLDOWN:
+            return current, "cooldown"
+        if self._streak >= AUTOSCALE_UP_CHECKS and current < self.maximum:
+            target, reason = min(current + max(current // 2, 1), self.maximum), "backlog"
+        elif -self._streak >= AUTOSCALE_DOWN_CHECKS and current > self.minimum:
+            target, reason = current - 1, "idle"
+        else:
+            return current, "steady"
+        self._streak = 0
+        return target, reason
+
+    def record(self, current: int, target: int, reason: str):
+        """Zapisuje izvedenu promjenu (log + metrike) i pokreće cooldown."""
+        self._changed_at = time.monotonic()
+        direction = "up" if target > current else "down"
+        self.last_decision = {"at": time.time(), "from": current, "to": target,
+                              "reason": reason, "sample": self.last_sample}
+        AUTOSCALE_DECISIONS.inc(direction=direction, reason=reason)
+        logger.info(f"[Autoscale] {self.kind} {current} → {target} ({reason}; "
+                    + ", ".join(f"{k}={v}" for k, v in self.last_sample.items()) + ")")
+
+    def status(self) -> dict:
+        return {"kind": self.kind, "min": self.minimum, "max": self.maximum,
+                "sample": self.last_sample, "last_decision": self.last_decision}
@@ -0,0 +1,186 @@
+# bench/bench_batch.py
+#
+# Usporedba propusnosti: stari worker_loop (zadatak po zadatak), batch način
+# (svaki radnik preuzima iz baze) i dispatch (lider puni prefetch buffer).
+# Pokreće se nad PRAZNOM testnom bazom, jer troši sve pending zadatke:
+#   DATABASE_URL=postgres://... python bench/bench_batch.py --tasks 5000 --workers 3
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from psycopg2.extras import execute_values
+
+from db import get_conn, init_db
+from tasks import execute_task
+from taskqueue import claim_tasks, complete_tasks, BatchSizer, PrefetchBuffer, FairScheduler
+from utils import BATCH_TARGET_SECONDS
+
+
+def enqueue(n, ttype):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+              INSERT INTO tasks(type, parameters, status, created_at, updated_at)
+              VALUES %s;
+            """, [(ttype, f"payload-{i}", "pending") for i in range(n)],
+               template="(%s, %s, %s, now(), now())")
+        conn.commit()
+
+
+def heartbeat(worker_id):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              INSERT INTO worker_status(worker_id, status, last_seen, last_active)
+              VALUES (%s,'Alive',now(),now())
+              ON CONFLICT(worker_id) DO UPDATE SET last_seen = now();
+            """, (worker_id,))
+        conn.commit()
+
+
+def single_loop(worker_id, done):
+    """Stari worker_loop: heartbeat, SELECT FOR UPDATE LIMIT 1, UPDATE rezultata."""
+    while True:
+        heartbeat(worker_id)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  SELECT * FROM tasks
+                   WHERE status = 'pending'
+                   ORDER BY created_at
+                   FOR UPDATE SKIP LOCKED
+                   LIMIT 1;
+                """)
+                task = cur.fetchone()
+                if task:
+                    cur.execute("""
+                      UPDATE tasks SET status='in_progress', worker_id=%s, updated_at=now()
+                       WHERE id=%s;
+                    """, (worker_id, task["id"]))
+                conn.commit()
+        if not task:
+            return
+        out = execute_task(SimpleNamespace(**task))
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  UPDATE tasks SET status='completed', result=%s, updated_at=now()
+                   WHERE id=%s;
+                """, (out, task["id"]))
+                cur.execute(
+                  "UPDATE worker_status SET last_active = now() WHERE worker_id = %s;",
+                  (worker_id,)
+                )
+            conn.commit()
+        done[worker_id] += 1
+
+
+def batch_loop(worker_id, done, batch_max, waits):
+    sizer = BatchSizer(batch_max, BATCH_TARGET_SECONDS)
+    while True:
+        heartbeat(worker_id)
+        start = time.perf_counter()
+        batch = claim_tasks(worker_id, sizer.size)
+        waits.append(time.perf_counter() - start)
+        if not batch:
+            return
+        start = time.monotonic()
+        results = [(t["id"], execute_task(SimpleNamespace(**t)), False, t["started_at"])
+                   for t in batch]
+        complete_tasks(worker_id, results)
+        sizer.observe(len(batch), time.monotonic() - start)
+        done[worker_id] += len(results)
+
+
+def dispatcher(buffer, owner):
+    """Kao dispatch_loop u main.py: puni buffer dok ima pending zadataka."""
+    scheduler = FairScheduler()
+    buffer.activate(owner)
+    while True:
+        want = buffer.deficit()
+        if not want:
+            buffer.wait_for_demand(0.05)
+            continue
+        start = time.perf_counter()
+        batch = scheduler.claim(owner, want)
+        buffer.put(owner, batch, time.perf_counter() - start)
+        if not batch:
+            break
+    while len(buffer):
+        buffer.wait_for_demand(0.05)
+    buffer.deactivate(owner)
+
+
+def prefetch_loop(worker_id, done, batch_max, buffer, waits):
+    sizer = BatchSizer(batch_max, BATCH_TARGET_SECONDS)
+    while True:
+        heartbeat(worker_id)
+        start = time.perf_counter()
+        batch = buffer.take(sizer.size, 1)
+        waits.append(time.perf_counter() - start)
+        if not batch:
+            if not buffer.active:
+                return
+            continue
+        start = time.monotonic()
+        results = [(t["id"], execute_task(SimpleNamespace(**t)), False, t["started_at"])
+                   for t in batch]
+        complete_tasks(worker_id, results)
+        sizer.observe(len(batch), time.monotonic() - start)
+        done[worker_id] += len(results)
+
+
+def run(mode, n, workers, ttype, batch_max):
+    enqueue(n, ttype)
+    done = {f"bench-{mode}-{i}": 0 for i in range(workers)}
+    waits = []
+    if mode == "single":
+        threads = [threading.Thread(target=single_loop, args=(w, done)) for w in done]
+    elif mode == "batch":
+        threads = [threading.Thread(target=batch_loop, args=(w, done, batch_max, waits)) for w in done]
+    else:
+        buffer = PrefetchBuffer(max_size=batch_max * workers * 4)
+        buffer.activate(f"bench-{mode}-leader")
+        threads = [threading.Thread(target=dispatcher, args=(buffer, f"bench-{mode}-leader"))]
+        threads += [threading.Thread(target=prefetch_loop, args=(w, done, batch_max, buffer, waits))
+                    for w in done]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = sum(done.values())
+    # claim_avg_ms: koliko radnik prosječno čeka na batch (preuzimanje iz baze ili buffera)
+    return {"mode": mode, "tasks": total, "seconds": round(elapsed, 3),
+            "tasks_per_sec": round(total / elapsed, 1) if elapsed else None,
+            "claim_avg_ms": round(1000 * sum(waits) / len(waits), 2) if waits else None}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", type=int, default=2000)
+    ap.add_argument("--workers", type=int, default=3)
+    ap.add_argument("--type", default="reverse")
+    ap.add_argument("--batch-max", type=int, default=32)
+    args = ap.parse_args()
+
+    init_db()
+    results = [run(mode, args.tasks, args.workers, args.type, args.batch_max)
+               for mode in ("single", "batch", "dispatch")]
+    for r in results:
+        print(json.dumps(r))
+    if results[0]["tasks_per_sec"]:
+        for r in results[1:]:
+            print(f"{r['mode']} speedup: {r['tasks_per_sec'] / results[0]['tasks_per_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
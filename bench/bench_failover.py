@@ -0,0 +1,96 @@
+# bench/bench_failover.py
+#
+# Failover lidera clustera: pokreće nekoliko lokalnih instanci main.py nad
+# istom bazom, ubija onu koja drži lease i mjeri koliko prođe dok ga ne
+# preuzme druga. Očekivano najviše LEADER_TIMEOUT + HEARTBEAT_INTERVAL
+# (uz --graceful, SIGTERM predaje lease pa je failover gotovo odmah).
+#   DATABASE_URL=postgres://... python bench/bench_failover.py --instances 3 --rounds 3
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASE_PORT = 5100
+
+
+def start_instance(i):
+    env = dict(os.environ, PORT=str(BASE_PORT + i), INSTANCE_ID=f"bench-{i}")
+    return subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def leader_status(i):
+    try:
+        return requests.get(f"http://127.0.0.1:{BASE_PORT + i}/api/leader", timeout=1).json()
+    except requests.RequestException:
+        return None
+
+
+def wait_for(predicate, timeout, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        found = predicate()
+        if found is not None:
+            return found
+        time.sleep(interval)
+    return None
+
+
+def current_leader(alive):
+    for i in alive:
+        st = leader_status(i)
+        if st and st["is_leader"]:
+            return i
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--instances", type=int, default=3)
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--graceful", action="store_true", help="SIGTERM umjesto SIGKILL")
+    ap.add_argument("--timeout", type=float, default=30)
+    args = ap.parse_args()
+
+    procs = {i: start_instance(i) for i in range(args.instances)}
+    results = []
+    try:
+        if wait_for(lambda: all(leader_status(i) for i in procs) or None, args.timeout) is None:
+            raise SystemExit("instances did not start")
+        for rnd in range(args.rounds):
+            leader = wait_for(lambda: current_leader(procs), args.timeout)
+            if leader is None:
+                raise SystemExit("no cluster leader")
+            procs[leader].send_signal(signal.SIGTERM if args.graceful else signal.SIGKILL)
+            killed_at = time.monotonic()
+            procs.pop(leader).wait()
+            new = wait_for(lambda: current_leader(procs), args.timeout)
+            failover = time.monotonic() - killed_at
+            results.append({"round": rnd, "killed": f"bench-{leader}",
+                            "new_leader": f"bench-{new}" if new is not None else None,
+                            "failover_seconds": round(failover, 2) if new is not None else None})
+            print(json.dumps(results[-1]))
+            procs[leader] = start_instance(leader)
+            wait_for(lambda: leader_status(leader), args.timeout)
+    finally:
+        for p in procs.values():
+            p.kill()
+            p.wait()
+
+    times = [r["failover_seconds"] for r in results if r["failover_seconds"] is not None]
+    if times:
+        print(json.dumps({"mode": "graceful" if args.graceful else "kill",
+                          "rounds": len(results), "failed": len(results) - len(times),
+                          "failover_avg": round(sum(times) / len(times), 2),
+                          "failover_max": max(times)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench/bench_fetch.py
+#
+# Usporedba dohvata: blokirajući requests.get jedan za drugim (stari način)
+# i asinkroni fetch engine (fetch.py) nad lokalnim stub serverom.
+#   python bench/bench_fetch.py --urls 200 --delay 0.05
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests
+
+from fetch import get_engine
+from stub_server import start_stub_server
+
+
+def bench_sequential(urls):
+    start = time.perf_counter()
+    for u in urls:
+        requests.get(u, timeout=10).raise_for_status()
+    return time.perf_counter() - start
+
+
+def bench_engine(urls):
+    engine = get_engine()
+    engine.fetch(urls[0])   # zagrijavanje sesije
+    start = time.perf_counter()
+    results = engine.fetch_many(urls)
+    elapsed = time.perf_counter() - start
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--urls", type=int, default=200)
+    ap.add_argument("--delay", type=float, default=0.05)
+    args = ap.parse_args()
+
+    _, base = start_stub_server(delay=args.delay)
+    urls = [f"{base}/page/{i}" for i in range(args.urls)]
+
+    seq = bench_sequential(urls)
+    eng = bench_engine(urls)
+    for mode, t in (("sequential", seq), ("async_engine", eng)):
+        print(json.dumps({"mode": mode, "urls": len(urls), "seconds": round(t, 3),
+                          "urls_per_sec": round(len(urls) / t, 1)}))
+    print(f"speedup: {seq / eng:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
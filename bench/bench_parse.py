@@ -0,0 +1,102 @@
+# bench/bench_parse.py
+#
+# Vrijeme parsiranja po stranici: stari parse_site (html.parser, dva prolaza,
+# selektori kompilirani pri svakom pozivu) i precompilirani extractori
+# (extractors.py) nad spremljenim HTML stranicama iz bench/fixtures.
+#   python bench/fixtures/make_fixtures.py
+#   python bench/bench_parse.py --repeat 20
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bs4 import BeautifulSoup
+
+from sites_config import SITES
+from extractors import HTML_PARSER, get_extractor
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+QUERIES = {
+    "Links": "Logitech G Pro X2 Lightspeed",
+    "Instar": "Sony WH-1000XM5",
+    "SkinPort": "USP-S | Kill Confirmed",
+    "SkinBaron": "Desert Eagle | Blaze",
+}
+
+
+def _title(it, cfg):
+    if cfg.get("title_attr"):
+        return it.get(cfg["title_attr"], "").lower()
+    if cfg.get("title_in_span"):
+        span = it.select_one("span")
+        return span.get_text(strip=True).lower() if span else ""
+    return ""
+
+
+def legacy_parse(html, search_url, cfg, full_phrase, keywords):
+    """Kopija parse_site prije extractors.py, kao referenca."""
+    soup = BeautifulSoup(html, "html.parser")
+    items = soup.select(cfg["item_selector"])
+    if not items:
+        return None, search_url
+    match = next((it for it in items if full_phrase in _title(it, cfg)), None)
+    if not match:
+        match = next((it for it in items if all(k in _title(it, cfg) for k in keywords)), None)
+    if not match:
+        return None, search_url
+    href = match.get("href", "")
+    link = href if href.startswith("http") else cfg["url_prefix"].rstrip("/") + href
+    price_elem = match.select_one(cfg["price_selector"])
+    price_text = price_elem.get_text(strip=True) if price_elem else None
+    if not price_text:
+        nxt = match.find_next(string=re.compile(r"€"))
+        price_text = nxt.strip() if nxt else None
+    if not price_text:
+        return None, link
+    clean = re.sub(r"[^\d,\.]", "", price_text).replace(".", "").replace(",", ".")
+    try:
+        return float(clean), link
+    except ValueError:
+        return None, link
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    for name, cfg in SITES.items():
+        path = os.path.join(FIXTURES, f"{name}.html")
+        if not os.path.exists(path):
+            print(f"{name}: nema {path}, pokreni bench/fixtures/make_fixtures.py")
+            continue
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        phrase = QUERIES.get(name, "").lower()
+        keywords = phrase.split()
+        ext = get_extractor(cfg)
+
+        old_t, old_r = timed(lambda: legacy_parse(html, path, cfg, phrase, keywords), args.repeat)
+        new_t, new_r = timed(lambda: ext.extract(html, path, phrase, keywords), args.repeat)
+        if old_r != new_r:
+            raise SystemExit(f"{name}: rezultati se razlikuju {old_r} != {new_r}")
+        print(json.dumps({"site": name, "kb": len(html) // 1024, "parser": HTML_PARSER,
+                          "legacy_ms": round(old_t * 1000, 2), "extractor_ms": round(new_t * 1000, 2),
+                          "speedup": round(old_t / new_t, 2), "result": new_r}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# bench/fixtures/make_fixtures.py
+#
+# Generira sintetske stranice pretrage sa strukturom kakvu očekuje sites_config
+# (isti selektori), s puno artikala i ostatkom stranice (navigacija, skripte).
+# Prave spremljene stranice mogu se staviti pored njih kao <Site>.html.
+#   python bench/fixtures/make_fixtures.py --items 120
+
+import os
+import random
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PRODUCTS = ["Logitech G Pro X2 Lightspeed", "Razer DeathAdder V3", "Apple iPhone 16 128GB",
+            "Samsung Galaxy S24", "Logitech MX Master 3S", "Sony WH-1000XM5"]
+SKINS = ["AK-47 | Redline (Field-Tested)", "AWP | Asiimov (Battle-Scarred)",
+         "M4A1-S | Printstream", "Desert Eagle | Blaze", "USP-S | Kill Confirmed"]
+
+ITEM = {
+    "Links": lambda i, t, p: (
+        f'<div class="card"><a class="card-link" title="{t}" href="/hr/product-{i}">'
+        f'<img src="/img/{i}.jpg"/><span class="price-new">{p} €</span></a></div>'),
+    "Instar": lambda i, t, p: (
+        f'<div class="product"><a class="productEntityClick" href="/p/{i}">'
+        f'<span>{t}</span><div class="price">{p} €</div></a></div>'),
+    "SkinPort": lambda i, t, p: (
+        f'<div class="CatalogPage-item"><a class="ItemPreview-link" title="{t}" href="/item/{i}">'
+        f'<div class="ItemPreview-price"><div class="Tooltip-link">{p} €</div></div></a></div>'),
+    "SkinBaron": lambda i, t, p: (
+        f'<div class="item listing"><div class="click-wrapper" title="{t}" href="/offer/{i}">'
+        f'<div class="price"><item>{p} €</item></div></div></div>'),
+}
+
+def page(site, items, rnd):
+    names = SKINS if site.startswith("Skin") else PRODUCTS
+    body = []
+    for i in range(items):
+        price = rnd.choice([f"{rnd.randint(5, 999)}", f"{rnd.randint(1, 2)}.{rnd.randint(100, 999)}"])
+        price += f",{rnd.randint(10, 99)}"
+        body.append(ITEM[site](i, f"{rnd.choice(names)} #{i}", price))
+    nav = "".join(f'<li><a href="/cat/{i}">Kategorija {i}</a></li>' for i in range(200))
+    script = "<script>" + "var x=1;" * 2000 + "</script>"
+    return (f"<!DOCTYPE html><html><head><title>{site} search</title>{script}</head>"
+            f"<body><nav><ul>{nav}</ul></nav><main>{''.join(body)}</main>"
+            f"<footer>{'<p>footer</p>' * 100}</footer></body></html>")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=120)
+    args = ap.parse_args()
+    rnd = random.Random(42)
+    for site in ITEM:
+        path = os.path.join(HERE, f"{site}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(page(site, args.items, rnd))
+        print(f"wrote {path}")
@@ -0,0 +1,320 @@
+# bench/loadgen.py
+#
+# Benchmark cijelog sustava: pokreće aplikaciju (main.py) nad lokalnim
+# Postgresom, šalje zadani miks zadataka kroz /api/add_task zadanom brzinom
+# i mjeri end-to-end latenciju (created_at -> završetak), propusnost, broj
+# DB konekcija i CPU aplikacije. scrape_url zadaci idu na lokalni stub
+# server, a compare_offers na snimljene stranice iz bench/fixtures koje se
+# prije pokretanja upišu u http_cache (pa ne ovise o vanjskim siteovima).
+# Rezultat se sprema kao JSON (bench/results/) za usporedbu među promjenama.
+#   DATABASE_URL=postgres://... python bench/loadgen.py \
+#       --mix reverse=50,count_primes=10,scrape_url=30,compare_offers=10 \
+#       --rate 100 --duration 30
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import subprocess
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests
+from psycopg2.extras import execute_values
+
+from db import get_conn, init_db
+from sites_config import SITES
+from stub_server import start_stub_server
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+RESULTS = os.path.join(ROOT, "bench", "results")
+
+# proizvodi iz bench/fixtures/make_fixtures.py
+PRODUCTS = ["Logitech G Pro X2 Lightspeed", "Razer DeathAdder V3", "Apple iPhone 16 128GB",
+            "Samsung Galaxy S24", "Logitech MX Master 3S", "Sony WH-1000XM5"]
+COMPARE_SITES = ("Links", "Instar")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def seed_fixtures():
+    """Snimljene stranice pretrage za compare_offers upisuje u http_cache (TTL 1 dan)."""
+    rows = []
+    for site in COMPARE_SITES:
+        with open(os.path.join(FIXTURES, f"{site}.html"), encoding="utf-8") as f:
+            body = f.read()
+        for product in PRODUCTS:
+            url = SITES[site]["search_url"].format(query="+".join(product.split()))
+            rows.append((hashlib.md5(url.encode("utf-8")).digest(), url, body))
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+              INSERT INTO http_cache(url_hash, url, status, body, fetched_at, expires_at)
+              VALUES %s
+              ON CONFLICT (url_hash) DO UPDATE
+                 SET body = EXCLUDED.body, status = 200, fetched_at = now(),
+                     expires_at = EXCLUDED.expires_at, filling_until = NULL;
+            """, rows, template="(%s, %s, 200, %s, now(), now() + interval '1 day')")
+        conn.commit()
+
+
+def make_params(ttype, stub_url, run_id, n):
+    if ttype in ("reverse", "uppercase"):
+        return f"loadgen-{run_id}-{n}"
+    if ttype == "count_primes":
+        return str(random.randint(100_000, 2_000_000))
+    if ttype == "scrape_url":
+        return f"{stub_url}/page/{n}?run={run_id}"
+    if ttype == "compare_offers":
+        return random.choice(PRODUCTS)
+    raise SystemExit(f"unsupported task type in mix: {ttype}")
+
+
+# ---- mjerenje resursa ----
+def _proc_tree(root_pid):
+    """root_pid i svi njegovi potomci (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def cpu_seconds(root_pid):
+    total = 0.0
+    tick = os.sysconf("SC_CLK_TCK")
+    for pid in _proc_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / tick   # utime + stime
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+
+def db_connections():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              SELECT count(*) AS n FROM pg_stat_activity
+               WHERE datname = current_database() AND pid <> pg_backend_pid();
+            """)
+            return cur.fetchone()["n"]
+
+
+class Sampler(threading.Thread):
+    """Svakih `interval` sekundi bilježi broj DB konekcija i CPU aplikacije."""
+
+    def __init__(self, app_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.app_pid = app_pid
+        self.interval = interval
+        self.samples = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.samples.append({"t": time.monotonic(), "db_connections": db_connections(),
+                                 "cpu_seconds": cpu_seconds(self.app_pid)})
+
+
+# ---- pokretanje ----
+def start_app(port, env_extra):
+    env = dict(os.environ, PORT=str(port), INSTANCE_ID=f"loadgen-{port}", **env_extra)
+    proc = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/pool", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("app did not start")
+
+
+def submit_load(base, mix, rate, duration, stub_url, run_id, clients):
+    """Otvoreni model: zadatak se šalje u svoje vrijeme neovisno o odgovorima."""
+    types, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    submitted, errors = [], 0
+    lock = threading.Lock()
+
+    def send(n, ttype):
+        nonlocal errors
+        try:
+            r = session.post(f"{base}/api/add_task", timeout=10, json={
+                "type": ttype, "parameters": make_params(ttype, stub_url, run_id, n)})
+            r.raise_for_status()
+            with lock:
+                submitted.append((r.json()["task_id"], ttype))
+        except requests.RequestException:
+            with lock:
+                errors += 1
+
+    start = time.monotonic()
+    total = int(rate * duration)
+    with ThreadPoolExecutor(clients) as pool:
+        for n in range(total):
+            delay = start + n / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, n, random.choices(types, weights)[0])
+    return submitted, errors, time.monotonic() - start
+
+
+def wait_done(ids, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  SELECT count(*) AS n FROM tasks
+                   WHERE id = ANY(%s) AND status IN ('pending', 'in_progress');
+                """, (ids,))
+                if cur.fetchone()["n"] == 0:
+                    return True
+        time.sleep(0.5)
+    return False
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100 * (len(sorted_vals) - 1)))))
+    return round(sorted_vals[k], 4)
+
+
+def latency_summary(vals):
+    vals = sorted(vals)
+    return {"count": len(vals), "p50": percentile(vals, 50), "p95": percentile(vals, 95),
+            "p99": percentile(vals, 99), "max": round(vals[-1], 4) if vals else None}
+
+
+def collect(ids):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              SELECT type, status, cache_hit,
+                     extract(epoch FROM updated_at - created_at) AS latency,
+                     extract(epoch FROM started_at - created_at) AS queue_wait,
+                     created_at, updated_at
+                FROM tasks WHERE id = ANY(%s);
+            """, (ids,))
+            return cur.fetchall()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mix", default="reverse=50,count_primes=10,scrape_url=30,compare_offers=10")
+    ap.add_argument("--rate", type=float, default=50, help="zadataka u sekundi")
+    ap.add_argument("--duration", type=float, default=20, help="sekundi slanja")
+    ap.add_argument("--clients", type=int, default=16, help="paralelnih HTTP klijenata")
+    ap.add_argument("--port", type=int, default=5200)
+    ap.add_argument("--stub-delay", type=float, default=0.05)
+    ap.add_argument("--drain-timeout", type=float, default=120)
+    ap.add_argument("--env", action="append", default=[],
+                    help="KEY=VALUE za aplikaciju (npr. --env PREFETCH=0)")
+    ap.add_argument("--out", help="JSON datoteka (zadano bench/results/<vrijeme>.json)")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    app_env = dict(e.split("=", 1) for e in args.env)
+    run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+
+    init_db()
+    if "compare_offers" in mix:
+        seed_fixtures()
+    _, stub_url = start_stub_server(delay=args.stub_delay)
+    app = start_app(args.port, app_env)
+    sampler = Sampler(app.pid)
+    cpu_start = cpu_seconds(app.pid)
+    sampler.start()
+    try:
+        submitted, submit_errors, submit_seconds = submit_load(
+            f"http://127.0.0.1:{args.port}", mix, args.rate, args.duration,
+            stub_url, run_id, args.clients)
+        ids = [tid for tid, _ in submitted]
+        drained = wait_done(ids, args.drain_timeout)
+        wall = time.monotonic() - sampler.samples[0]["t"] if sampler.samples else submit_seconds
+        cpu_used = cpu_seconds(app.pid) - cpu_start
+    finally:
+        sampler.stop.set()
+        app.terminate()
+        app.wait()
+
+    rows = collect(ids)
+    done = [r for r in rows if r["status"] not in ("pending", "in_progress")]
+    by_type = {}
+    for r in done:
+        by_type.setdefault(r["type"], []).append(float(r["latency"]))
+    first_created = min((r["created_at"] for r in done), default=None)
+    last_done = max((r["updated_at"] for r in done), default=None)
+    span = (last_done - first_created).total_seconds() if done else 0
+    conns = [s["db_connections"] for s in sampler.samples]
+
+    result = {
+        "run_id": run_id,
+        "git": git_revision(),
+        "config": {"mix": mix, "rate": args.rate, "duration": args.duration,
+                   "clients": args.clients, "stub_delay": args.stub_delay, "app_env": app_env},
+        "submitted": len(submitted),
+        "submit_errors": submit_errors,
+        "submit_rate": round(len(submitted) / submit_seconds, 1) if submit_seconds else None,
+        "completed": len(done),
+        "drained": drained,
+        "by_status": {s: sum(1 for r in rows if r["status"] == s) for s in {r["status"] for r in rows}},
+        "cache_hits": sum(1 for r in done if r["cache_hit"]),
+        "tasks_per_sec": round(len(done) / span, 1) if span else None,
+        "latency": latency_summary([float(r["latency"]) for r in done]),
+        "queue_wait": latency_summary([float(r["queue_wait"]) for r in done if r["queue_wait"] is not None]),
+        "latency_by_type": {t: latency_summary(v) for t, v in by_type.items()},
+        "db_connections": {"avg": round(sum(conns) / len(conns), 1) if conns else None,
+                           "max": max(conns, default=None)},
+        "cpu": {"seconds": round(cpu_used, 2),
+                "avg_cores": round(cpu_used / wall, 2) if wall else None},
+    }
+
+    out = args.out or os.path.join(RESULTS, f"{run_id}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# bench/stub_server.py
+#
+# Lokalni HTTP stub za benchmarke: svaka stranica ima <title>, nekoliko linkova
+# i umjetnu latenciju, tako da mjerenja ne ovise o vanjskim siteovima.
+#   python bench/stub_server.py --port 8099 --delay 0.05
+
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.05
+    links = 20
+    pad = 0
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        base = f"http://{self.headers.get('Host', 'localhost')}"
+        anchors = "".join(f'<a href="{base}/page/{i}">p{i}</a>' for i in range(self.links))
+        body = (f"<html><head><title>Stub {self.path}</title></head>"
+                f"<body>{anchors}{'x' * self.pad}</body></html>").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(port=0, delay=0.05, links=20, pad=0):
+    """Pokreće stub u pozadinskom threadu; vraća (server, base_url)."""
+    handler = type("Handler", (StubHandler,), {"delay": delay, "links": links, "pad": pad})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--delay", type=float, default=0.05)
+    ap.add_argument("--links", type=int, default=20)
+    ap.add_argument("--pad", type=int, default=0, help="dodatnih bajtova po stranici")
+    args = ap.parse_args()
+    server, url = start_stub_server(args.port, args.delay, args.links, args.pad)
+    print(f"stub server on {url}")
+    threading.Event().wait()
@@ -1,59 +1,571 @@
-# db.py
-
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from contextlib import contextmanager
-
-# Čita konekcijski string iz varijable okoline DATABASE_URL
-DATABASE_URL = os.getenv('DATABASE_URL')
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL environment variable is not set")
-
-@contextmanager
-def get_conn():
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_db():
-    """
-    Kreira tablice ako ne postoje, i dodaje last_active u worker_status.
-    """
-    ddl = """
-    CREATE TABLE IF NOT EXISTS tasks (
-        id SERIAL PRIMARY KEY,
-        type VARCHAR NOT NULL,
-        parameters TEXT NOT NULL,
-        status VARCHAR NOT NULL,
-        worker_id VARCHAR,
-        result TEXT,
-        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-    );
-
-    CREATE TABLE IF NOT EXISTS worker_status (
-        id SERIAL PRIMARY KEY,
-        worker_id VARCHAR UNIQUE NOT NULL,
-        status VARCHAR NOT NULL,
-        last_seen TIMESTAMPTZ NOT NULL,
-        last_active TIMESTAMPTZ NOT NULL DEFAULT now()
-    );
-
-    CREATE TABLE IF NOT EXISTS leader_status (
-        leader_id VARCHAR PRIMARY KEY,
-        last_seen TIMESTAMPTZ NOT NULL
-    );
-    """
-    alter = """
-    ALTER TABLE worker_status
-      ADD COLUMN IF NOT EXISTS last_active TIMESTAMPTZ NOT NULL DEFAULT now();
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(ddl)
-            cur.execute(alter)
-        conn.commit()
+# db.py
+
+import os
+import time
+import logging
+import threading
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from psycopg2.extras import RealDictCursor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Čita konekcijski string iz varijable okoline DATABASE_URL
+DATABASE_URL = os.getenv('DATABASE_URL')
+if not DATABASE_URL:
+    raise RuntimeError("DATABASE_URL environment variable is not set")
+
+# Veličina poola konekcija (po procesu) i koliko dugo se čeka na slobodnu konekciju
+DB_POOL_MIN     = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX     = int(os.getenv('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+
+# Konekcija koja je u poolu stajala dulje od ovoga se prije posudbe provjeri sa SELECT 1
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))
+
+
+class PoolTimeout(PoolError):
+    """Nijedna konekcija nije postala slobodna unutar zadanog timeouta."""
+
+
+class ConnectionPool:
+    """
+    Ograničeni, thread-safe pool konekcija.
+    Posudba čeka (uz timeout) kad su sve konekcije zauzete, a svaka se konekcija
+    prije posudbe provjeri; mrtve se odbacuju i po potrebi otvaraju nove.
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, vrijeme vraćanja)], LIFO
+        self._size = 0         # otvorene konekcije (slobodne + posuđene)
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        # tekst (i COPY) uvijek kao UTF-8, neovisno o kodiranju baze i PGCLIENTENCODING
+        return psycopg2.connect(self.dsn, cursor_factory=RealDictCursor, client_encoding="UTF8")
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - idle_since < DB_POOL_PING_AFTER:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            conn = idle_since = None
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.maxconn:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeout(
+                                f"no free connection within {timeout:.1f}s "
+                                f"(pool size {self._size}/{self.maxconn})"
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["wait_total"] += waited
+                self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+            return conn
+
+    def putconn(self, conn):
+        if not conn.closed:
+            try:
+                # kao i close(): nekomitana transakcija se poništava
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                pass
+        if conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                waiting=self._waiting,
+                min=self.minconn,
+                max=self.maxconn,
+            )
+        s["wait_avg_ms"] = round(1000 * s["wait_total"] / s["checkouts"], 3) if s["checkouts"] else 0.0
+        s["wait_max_ms"] = round(1000 * s.pop("wait_max"), 3)
+        s["wait_total_ms"] = round(1000 * s.pop("wait_total"), 3)
+        return s
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """
+    Vraća pool ovog procesa (lijeno kreiran; nakon fork-a se kreira novi,
+    jer konekcije roditelja ne smiju dijeliti dva procesa).
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+                _pool_pid = pid
+    return _pool
+
+@contextmanager
+def get_conn():
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+# Verzionirane migracije sheme: (verzija, opis, [SQL naredbe], transakcijska?).
+# Nove promjene sheme dodaju se na kraj liste; već primijenjene se ne mijenjaju.
+# Netransakcijske migracije (CREATE INDEX CONCURRENTLY) ne blokiraju upise
+# nad postojećom, velikom tablicom tasks.
+MIGRATIONS = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            type VARCHAR NOT NULL,
+            parameters TEXT NOT NULL,
+            status VARCHAR NOT NULL,
+            worker_id VARCHAR,
+            result TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS worker_status (
+            id SERIAL PRIMARY KEY,
+            worker_id VARCHAR UNIQUE NOT NULL,
+            status VARCHAR NOT NULL,
+            last_seen TIMESTAMPTZ NOT NULL,
+            last_active TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS leader_status (
+            leader_id VARCHAR PRIMARY KEY,
+            last_seen TIMESTAMPTZ NOT NULL
+        );
+        """,
+        """
+        ALTER TABLE worker_status
+          ADD COLUMN IF NOT EXISTS last_active TIMESTAMPTZ NOT NULL DEFAULT now();
+        """,
+    ], True),
+
+    (2, "task indexes", [
+        # claim: WHERE status='pending' ORDER BY created_at
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_pending_created_idx
+            ON tasks (created_at, id) WHERE status = 'pending';
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_worker_status_idx
+            ON tasks (worker_id, status);
+        """,
+        # dashboard: ORDER BY created_at DESC
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_created_at_idx
+            ON tasks (created_at);
+        """,
+    ], False),
+
+    (3, "tasks history", [
+        # cijeli arhivirani red je u `data`, pa arhiva ne ovisi o kasnijim stupcima tablice tasks
+        """
+        CREATE TABLE IF NOT EXISTS tasks_history (
+            id INTEGER PRIMARY KEY,
+            type VARCHAR NOT NULL,
+            status VARCHAR NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            data JSONB NOT NULL
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS tasks_history_archived_at_idx
+            ON tasks_history (archived_at);
+        """,
+    ], True),
+
+    (4, "subtask linkage and url dedup", [
+        """
+        ALTER TABLE tasks
+          ADD COLUMN IF NOT EXISTS parent_id INTEGER,
+          ADD COLUMN IF NOT EXISTS url_hash BYTEA;
+        """,
+        # postojeći scrape_url redovi: hash dobiva samo prvo pojavljivanje URL-a
+        """
+        UPDATE tasks AS t
+           SET url_hash = decode(md5(t.parameters), 'hex')
+          FROM (SELECT min(id) AS id FROM tasks
+                 WHERE type = 'scrape_url' GROUP BY parameters) AS first
+         WHERE t.id = first.id AND t.url_hash IS NULL;
+        """,
+    ], True),
+
+    (5, "subtask indexes", [
+        """
+        CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS tasks_url_hash_key
+            ON tasks (url_hash);
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_parent_status_idx
+            ON tasks (parent_id, status) WHERE parent_id IS NOT NULL;
+        """,
+    ], False),
+
+    (6, "http response cache", [
+        # filling_until: neka instanca upravo dohvaća URL (single-flight među instancama)
+        """
+        CREATE TABLE IF NOT EXISTS http_cache (
+            url_hash BYTEA PRIMARY KEY,
+            url TEXT NOT NULL,
+            status INTEGER,
+            body TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at TIMESTAMPTZ,
+            expires_at TIMESTAMPTZ,
+            filling_until TIMESTAMPTZ
+        );
+        """,
+    ], True),
+
+    (7, "result cache flag", [
+        """
+        ALTER TABLE tasks
+          ADD COLUMN IF NOT EXISTS cache_hit BOOLEAN NOT NULL DEFAULT false;
+        """,
+    ], True),
+
+    (8, "priorities and named queues", [
+        # queue NULL = red nazvan po tipu zadatka (vidi taskqueue.QUEUE_EXPR);
+        # started_at je trenutak preuzimanja, za vrijeme čekanja u redu
+        """
+        ALTER TABLE tasks
+          ADD COLUMN IF NOT EXISTS priority SMALLINT NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS queue VARCHAR,
+          ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ;
+        """,
+    ], True),
+
+    (9, "queue indexes", [
+        # claim po redu: WHERE status='pending' AND red=... ORDER BY priority DESC, created_at
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_pending_queue_idx
+            ON tasks ((COALESCE(queue, type)), priority DESC, created_at, id)
+            WHERE status = 'pending';
+        """,
+        # zauzeće redova (capovi): WHERE status='in_progress' GROUP BY red
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_running_queue_idx
+            ON tasks ((COALESCE(queue, type))) WHERE status = 'in_progress';
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_started_at_idx
+            ON tasks (started_at) WHERE started_at IS NOT NULL;
+        """,
+    ], False),
+
+    (10, "leader lease", [
+        # leader_status do sad nije korištena; sada drži jedan lease red po imenu
+        "DELETE FROM leader_status;",
+        """
+        ALTER TABLE leader_status
+          ADD COLUMN IF NOT EXISTS lease VARCHAR NOT NULL DEFAULT 'leader',
+          ADD COLUMN IF NOT EXISTS token BIGINT NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS leader_status_lease_key
+            ON leader_status (lease);
+        """,
+    ], True),
+
+    (11, "task leases and retries", [
+        # lease_until: do kada preuzeti zadatak pripada radniku (visibility timeout);
+        # available_at: vraćeni zadatak se ne preuzima prije (backoff);
+        # status 'dead' = iscrpljeni pokušaji (dead-letter)
+        """
+        ALTER TABLE tasks
+          ADD COLUMN IF NOT EXISTS attempts SMALLINT NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ,
+          ADD COLUMN IF NOT EXISTS available_at TIMESTAMPTZ;
+        """,
+    ], True),
+
+    (12, "worker progress", [
+        """
+        ALTER TABLE worker_status
+          ADD COLUMN IF NOT EXISTS current_task INTEGER,
+          ADD COLUMN IF NOT EXISTS progress VARCHAR;
+        """,
+    ], True),
+
+    (13, "bulk insert idempotency keys", [
+        # odgovor /api/add_tasks po Idempotency-Key: broj zadataka i rasponi id-jeva
+        """
+        CREATE TABLE IF NOT EXISTS task_batches (
+            idempotency_key VARCHAR PRIMARY KEY,
+            count INTEGER,
+            ids JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+    ], True),
+
+    (14, "per-host rate limits", [
+        # token bucket po hostu (ratelimit.HostLimiter): tokens u trenutku updated_at,
+        # punjenje rate tokena/s do concurrency; blocked_until nakon 429/503
+        """
+        CREATE TABLE IF NOT EXISTS host_limits (
+            host VARCHAR PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            rate DOUBLE PRECISION NOT NULL,
+            concurrency DOUBLE PRECISION NOT NULL,
+            latency DOUBLE PRECISION,
+            base_latency DOUBLE PRECISION,
+            blocked_until TIMESTAMPTZ,
+            throttled INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        # zadatak vraćen u red s već rezerviranim tokenom svog hosta
+        """
+        ALTER TABLE tasks
+          ADD COLUMN IF NOT EXISTS token_reserved BOOLEAN NOT NULL DEFAULT false;
+        """,
+    ], True),
+
+    (15, "result storage", [
+        # compare rezultati kao JSONB; result_size je duljina punog rezultata
+        # (tasks.result za velike rezultate drži samo početak)
+        """
+        ALTER TABLE tasks
+          ADD COLUMN IF NOT EXISTS result_json JSONB,
+          ADD COLUMN IF NOT EXISTS result_size INTEGER;
+        """,
+        # postojeći compare rezultati (json.dumps ili poruka o grešci)
+        """
+        UPDATE tasks
+           SET result_json = result::jsonb, result_size = char_length(result), result = NULL
+         WHERE type LIKE 'compare%' AND result LIKE '{%}';
+        """,
+        # veliki rezultati izvan reda tasks, zlib komprimirani (taskqueue.pack_result)
+        """
+        CREATE TABLE IF NOT EXISTS task_results (
+            task_id INTEGER PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE,
+            body BYTEA NOT NULL
+        );
+        """,
+    ], True),
+
+    (16, "held tasks in worker heartbeat", [
+        # zadaci koje je radnik zadnje prijavio (i oni uzeti iz prefetch buffera lidera)
+        """
+        ALTER TABLE worker_status
+          ADD COLUMN IF NOT EXISTS held INTEGER[];
+        """,
+    ], True),
+
+    (17, "url dedup across archive", [
+        # url_hash svakog ikad dodanog scrape_url zadatka; archive_tasks ga ne briše,
+        # pa se arhivirani URL ne dodaje ponovno
+        """
+        CREATE TABLE IF NOT EXISTS task_urls (
+            url_hash BYTEA PRIMARY KEY,
+            task_id INTEGER NOT NULL
+        );
+        """,
+        """
+        INSERT INTO task_urls(url_hash, task_id)
+        SELECT url_hash, id FROM tasks WHERE url_hash IS NOT NULL
+        ON CONFLICT (url_hash) DO NOTHING;
+        """,
+        # to_jsonb zapisuje bytea kao '\x<hex>'
+        """
+        INSERT INTO task_urls(url_hash, task_id)
+        SELECT decode(substr(data->>'url_hash', 3), 'hex'), id
+          FROM tasks_history WHERE data->>'url_hash' IS NOT NULL
+        ON CONFLICT (url_hash) DO NOTHING;
+        """,
+    ], True),
+
+    (18, "result size of migrated compare results", [
+        # baze na kojima je migracija 15 premjestila rezultate bez result_size
+        """
+        UPDATE tasks
+           SET result_size = char_length(result_json::text)
+         WHERE result_json IS NOT NULL AND result_size IS NULL;
+        """,
+    ], True),
+]
+
+# Ključ advisory locka pod kojim se migracije izvode (jedna instanca odjednom)
+SCHEMA_LOCK_KEY = 0x7A5C_0001
+# Koliko se čeka (sekunde) prije ponovnog pokušaja uzimanja tog locka
+SCHEMA_LOCK_RETRY = 0.5
+
+_schema_ready = False
+
+def _drop_invalid_indexes(cur, statements):
+    # prekinuti CREATE INDEX CONCURRENTLY ostavlja nevaljan indeks koji bi IF NOT EXISTS preskočio
+    cur.execute("""
+      SELECT c.relname AS name
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+       WHERE NOT i.indisvalid;
+    """)
+    for row in cur.fetchall():
+        if any(row["name"] in st for st in statements):
+            cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{row["name"]}";')
+
+def init_db():
+    """
+    Primjenjuje migracije iz MIGRATIONS koje još nisu zabilježene u
+    schema_migrations. Sigurno je za istovremeni poziv iz više radnika i
+    instanci; u istom procesu se nakon prvog uspjeha ne ponavlja.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+
+    with get_conn() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # pg_try_advisory_lock u petlji: instanca koja čeka na pg_advisory_lock
+            # drži snapshot, a CREATE INDEX CONCURRENTLY druge instance čeka da
+            # se takvi snapshotovi završe (deadlock pri istovremenom pokretanju)
+            while True:
+                cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (SCHEMA_LOCK_KEY,))
+                if cur.fetchone()["locked"]:
+                    break
+                time.sleep(SCHEMA_LOCK_RETRY)
+            try:
+                cur.execute("""
+                  CREATE TABLE IF NOT EXISTS schema_migrations (
+                      version INTEGER PRIMARY KEY,
+                      name VARCHAR NOT NULL,
+                      applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                  );
+                """)
+                cur.execute("SELECT version FROM schema_migrations;")
+                applied = {r["version"] for r in cur.fetchall()}
+
+                for version, name, statements, transactional in MIGRATIONS:
+                    if version in applied:
+                        continue
+                    logger.info(f"[DB] applying migration {version}: {name}")
+                    if transactional:
+                        conn.autocommit = False
+                    else:
+                        _drop_invalid_indexes(cur, statements)
+                    try:
+                        for st in statements:
+                            cur.execute(st)
+                        cur.execute(
+                            "INSERT INTO schema_migrations(version, name) VALUES (%s, %s);",
+                            (version, name)
+                        )
+                        if transactional:
+                            conn.commit()
+                    except Exception:
+                        if transactional:
+                            conn.rollback()
+                        raise
+                    finally:
+                        conn.autocommit = True
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (SCHEMA_LOCK_KEY,))
+
+    _schema_ready = True
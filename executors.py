@@ -0,0 +1,275 @@
+# executors.py
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from fetch import get_engine
+from metrics import TASK_SECONDS
+from procpool import get_process_runner, PROCESS_WORKERS, PROCESS_RECYCLE_AFTER
+from tasks import execute_task, execute_task_async
+
+logger = logging.getLogger(__name__)
+
+# Threadovi za I/O zadatke (HTTP, baza)
+IO_THREADS = int(os.getenv("IO_THREADS", 32))
+
+# Politika po tipu zadatka: gdje se izvršava, koliko ih smije raditi istovremeno
+# (po procesu) i timeout u sekundama.
+#   inline  - odmah u worker threadu (trivijalni zadaci)
+#   thread  - zajednički thread pool (I/O)
+#   async   - korutina na loopu fetch engine-a (čisti HTTP, stotine u letu)
+# Thread se ne može ubiti, pa je za thread zadatke timeout samo koliko radnik
+# čeka rezultat, osim gdje ga zadatak i sam poštuje:
+# count_primes ide u thread pool jer sito (primes.py) segmente već samo dijeli
+# na svoj pool procesa i pritom ne drži GIL; timeout mu se predaje, pa sito
+# nakon njega otkazuje preostale segmente. compare_* zadaci dohvaćaju stranice
+# u ovom procesu (zajednički HTTP cache, timeouti dohvata u fetch.py) i samo
+# parsiranje šalju u pool procesa, gdje se proces ubija nakon tasks.PARSE_TIMEOUT.
+TASK_POLICIES = {
+    "reverse":             {"executor": "inline",  "limit": None, "timeout": None},
+    "uppercase":           {"executor": "inline",  "limit": None, "timeout": None},
+    "count_primes":        {"executor": "thread",  "limit": 2,    "timeout": 900},
+    "scrape":              {"executor": "thread",  "limit": 4,    "timeout": 120},
+    "scrape_url":          {"executor": "async",   "limit": 256,  "timeout": 60},
+    "compare_offers":      {"executor": "thread",  "limit": 8,    "timeout": 120},
+    "compare_skin_offers": {"executor": "thread",  "limit": 8,    "timeout": 120},
+}
+DEFAULT_POLICY = {"executor": "inline", "limit": None, "timeout": None}
+
+
+def _norm_int(params):
+    return str(int(params.strip()))
+
+def _norm_text(params):
+    return params.strip()
+
+def _norm_phrase(params):
+    return " ".join(params.lower().split())
+
+# Idempotentni tipovi čiji se rezultat pamti: normalizacija parametara u ključ,
+# koliko sekundi rezultat vrijedi i koliko ih se najviše pamti (po procesu).
+MEMO_POLICIES = {
+    "count_primes":        {"key": _norm_int,    "ttl": 24 * 3600, "size": 1024},
+    "reverse":             {"key": _norm_text,   "ttl": 3600,      "size": 4096},
+    "uppercase":           {"key": _norm_text,   "ttl": 3600,      "size": 4096},
+    "compare_offers":      {"key": _norm_phrase, "ttl": 300,       "size": 512},
+    "compare_skin_offers": {"key": _norm_phrase, "ttl": 300,       "size": 512},
+}
+
+
+def memo_key(task):
+    policy = MEMO_POLICIES.get(task.type)
+    if not policy:
+        return None
+    try:
+        return policy["key"](task.parameters)
+    except ValueError:
+        return None
+
+
+def _is_error(result):
+    # compare_* neuspjele dohvate navode u "errors"; takav rezultat se ne pamti
+    if isinstance(result, dict):
+        return bool(result.get("errors"))
+    return isinstance(result, str) and result.startswith("Error")
+
+
+def _done_future(value) -> Future:
+    fut = Future()
+    fut.set_running_or_notify_cancel()
+    fut.set_result(value)
+    return fut
+
+
+class ResultMemo:
+    """
+    Pamti rezultate idempotentnih zadataka po (tip, normalizirani parametri).
+    Duplikat unutar TTL-a dobiva gotov rezultat, a istovremeni duplikati
+    čekaju isto izvršavanje. Greške se ne pamte.
+    """
+
+    def __init__(self, policies: dict):
+        self.policies = policies
+        self._lock = threading.Lock()
+        self._entries = {t: OrderedDict() for t in policies}   # key -> (expires, result)
+        self._inflight = {}                                    # (type, key) -> Future
+        self._stats = {t: {"hits": 0, "coalesced": 0, "misses": 0} for t in policies}
+
+    def claim(self, ttype, key):
+        """
+        Vraća (future, owner). owner=True znači da pozivatelj mora pokrenuti
+        zadatak i predati ga s follow(); inače future već ima ili će imati rezultat.
+        """
+        with self._lock:
+            entries = self._entries[ttype]
+            entry = entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                entries.move_to_end(key)
+                self._stats[ttype]["hits"] += 1
+                return _done_future(entry[1]), False
+            fut = self._inflight.get((ttype, key))
+            if fut is not None:
+                self._stats[ttype]["coalesced"] += 1
+                return fut, False
+            self._stats[ttype]["misses"] += 1
+            fut = Future()
+            fut.set_running_or_notify_cancel()
+            self._inflight[(ttype, key)] = fut
+            return fut, True
+
+    def follow(self, ttype, key, placeholder: Future, source: Future):
+        policy = self.policies[ttype]
+
+        def done(src):
+            exc = CancelledError() if src.cancelled() else src.exception()
+            result = None if exc else src.result()
+            with self._lock:
+                self._inflight.pop((ttype, key), None)
+                if exc is None and not _is_error(result):
+                    entries = self._entries[ttype]
+                    entries[key] = (time.monotonic() + policy["ttl"], result)
+                    entries.move_to_end(key)
+                    while len(entries) > policy["size"]:
+                        entries.popitem(last=False)
+            if exc is None:
+                placeholder.set_result(result)
+            else:
+                placeholder.set_exception(exc)
+
+        source.add_done_callback(done)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {t: dict(s, entries=len(self._entries[t])) for t, s in self._stats.items()}
+
+
+class TaskExecutor:
+    """
+    Usmjerava zadatke prema TASK_POLICIES. Ograničenje istovremenosti po tipu
+    je semafor koji se uzima pri predaji, pa pun tip usporava samo radnika
+    koji ga predaje.
+    """
+
+    def __init__(self):
+        self._threads = ThreadPoolExecutor(IO_THREADS, thread_name_prefix="io")
+        self._procs = get_process_runner()
+        self._limits = {
+            t: threading.BoundedSemaphore(p["limit"])
+            for t, p in TASK_POLICIES.items() if p["limit"]
+        }
+        self._memo = ResultMemo(MEMO_POLICIES)
+
+    def submit(self, task):
+        """
+        Vraća (future, cache_hit). Za idempotentne tipove rezultat može doći
+        iz ResultMemo-a bez izvršavanja (cache_hit=True).
+        """
+        key = memo_key(task)
+        if key is None:
+            return self._start(task), False
+        fut, owner = self._memo.claim(task.type, key)
+        if not owner:
+            return fut, True
+        try:
+            source = self._start(task)
+        except BaseException as e:
+            source = Future()
+            source.set_running_or_notify_cancel()
+            source.set_exception(e)
+        self._memo.follow(task.type, key, fut, source)
+        return fut, False
+
+    def _start(self, task) -> Future:
+        policy = TASK_POLICIES.get(task.type, DEFAULT_POLICY)
+        if policy["executor"] == "inline":
+            with TASK_SECONDS.time(type=task.type):
+                return _done_future(execute_task(task))
+
+        sem = self._limits.get(task.type)
+        if sem:
+            sem.acquire()
+        started = time.perf_counter()
+        try:
+            if policy["executor"] == "async":
+                fut = get_engine().submit(execute_task_async(task))
+            else:
+                fut = self._threads.submit(execute_task, task, policy["timeout"])
+        except BaseException:
+            # zadatak nije predan, pa ga nitko neće ni otpustiti
+            if sem:
+                sem.release()
+            raise
+        fut.add_done_callback(
+            lambda _: TASK_SECONDS.observe(time.perf_counter() - started, type=task.type))
+        if sem:
+            fut.add_done_callback(lambda _: sem.release())
+        return fut
+
+    def result(self, task, fut: Future, submitted_at: float):
+        policy = TASK_POLICIES.get(task.type, DEFAULT_POLICY)
+        timeout = policy["timeout"]
+        wait = None
+        if timeout and policy["executor"] in ("thread", "async"):
+            wait = max(0.0, submitted_at + timeout - time.monotonic())
+        try:
+            return fut.result(timeout=wait)
+        except FutureTimeout:
+            # korutina se otkazuje; thread se ne može ubiti, pa radnik samo prestaje čekati
+            fut.cancel()
+            return f"Error while executing {task.type}: timed out after {timeout}s"
+        except Exception as e:
+            return f"Error while executing {task.type}: {e}"
+
+    def run_batch(self, tasks: list, stop_evt: threading.Event = None, on_progress=None):
+        """
+        Predaje sve zadatke batcha odjednom i čeka rezultate redom.
+        Vraća ([(task, result, cache_hit)], [nepokrenuti zadaci]); nakon
+        stop_evt se zadaci koji još nisu krenuli otkazuju. on_progress(task, done)
+        se poziva prije čekanja na svaki zadatak (za heartbeat).
+        """
+        submitted = []
+        for task in tasks:
+            if stop_evt is not None and stop_evt.is_set():
+                break
+            fut, cache_hit = self.submit(task)
+            submitted.append((task, fut, cache_hit, time.monotonic()))
+
+        done, unstarted = [], [t for t in tasks[len(submitted):]]
+        for task, fut, cache_hit, at in submitted:
+            if on_progress is not None:
+                on_progress(task, len(done))
+            if stop_evt is not None and stop_evt.is_set() and fut.cancel():
+                unstarted.append(task)
+                continue
+            try:
+                done.append((task, self.result(task, fut, at), cache_hit))
+            except CancelledError:
+                unstarted.append(task)
+        return done, unstarted
+
+    def stats(self) -> dict:
+        return {
+            "process": dict(self._procs.stats, size=PROCESS_WORKERS,
+                            recycle_after=PROCESS_RECYCLE_AFTER),
+            "io_threads": IO_THREADS,
+            "policies": TASK_POLICIES,
+            "memo": self._memo.stats(),
+        }
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> TaskExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = TaskExecutor()
+            _executor_pid = os.getpid()
+    return _executor
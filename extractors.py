@@ -0,0 +1,146 @@
+# extractors.py
+
+import re
+from html.parser import HTMLParser
+import soupsieve
+from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+
+from sites_config import SITES
+
+# lxml parser je višestruko brži od html.parser; ako lxml nije instaliran, koristi se html.parser
+HTML_PARSER = "lxml" if builder_registry.lookup("lxml") else "html.parser"
+
+EURO_RE        = re.compile(r"€")
+PRICE_CLEAN_RE = re.compile(r"[^\d,\.]")
+
+
+class SiteExtractor:
+    """
+    Unaprijed kompiliran scraper jednog sitea iz sites_config: selektori se
+    kompiliraju jednom, naslov svakog artikla čita se jednom, a full-phrase
+    i keyword podudaranje računaju se u istom prolazu.
+    """
+
+    def __init__(self, cfg: dict):
+        self.item_sel = soupsieve.compile(cfg["item_selector"])
+        self.price_sel = soupsieve.compile(cfg["price_selector"])
+        self.title_attr = cfg.get("title_attr")
+        self.title_in_span = cfg.get("title_in_span")
+        self.url_prefix = cfg["url_prefix"].rstrip("/")
+
+    def title_of(self, item) -> str:
+        if self.title_attr:
+            return item.get(self.title_attr, "").lower()
+        if self.title_in_span:
+            span = item.find("span")
+            return span.get_text(strip=True).lower() if span else ""
+        return ""
+
+    def find_match(self, items, full_phrase: str, keywords: list):
+        """Prvi artikl s cijelom frazom u naslovu, inače prvi sa svim ključnim riječima."""
+        keyword_match = None
+        for it in items:
+            title = self.title_of(it)
+            if full_phrase in title:
+                return it
+            if keyword_match is None and all(k in title for k in keywords):
+                keyword_match = it
+        return keyword_match
+
+    def extract(self, html: str, search_url: str, full_phrase: str, keywords: list):
+        """Vraća (float price or None, product_url)."""
+        soup = BeautifulSoup(html, HTML_PARSER)
+        items = self.item_sel.select(soup)
+        if not items:
+            return None, search_url
+
+        match = self.find_match(items, full_phrase, keywords)
+        if match is None:
+            return None, search_url
+
+        href = match.get("href", "")
+        link = href if href.startswith("http") else self.url_prefix + href
+
+        price_elem = self.price_sel.select_one(match)
+        price_text = price_elem.get_text(strip=True) if price_elem else None
+        if not price_text:
+            nxt = match.find_next(string=EURO_RE)
+            price_text = nxt.strip() if nxt else None
+        if not price_text:
+            return None, link
+
+        clean = PRICE_CLEAN_RE.sub("", price_text).replace(".", "").replace(",", ".")
+        try:
+            return float(clean), link
+        except ValueError:
+            return None, link
+
+
+def _cfg_key(cfg: dict):
+    return (cfg["item_selector"], cfg["price_selector"], cfg.get("title_attr"),
+            bool(cfg.get("title_in_span")), cfg["url_prefix"])
+
+# Kompilirano jednom, pri importu (i u svakom procesu iz poola procesa)
+EXTRACTORS = {name: SiteExtractor(cfg) for name, cfg in SITES.items()}
+_by_cfg = {_cfg_key(cfg): EXTRACTORS[name] for name, cfg in SITES.items()}
+
+def get_extractor(cfg: dict) -> SiteExtractor:
+    """Extractor za konfiguraciju sitea; nepoznate konfiguracije se kompiliraju i pamte."""
+    key = _cfg_key(cfg)
+    ext = _by_cfg.get(key)
+    if ext is None:
+        ext = _by_cfg[key] = SiteExtractor(cfg)
+    return ext
+
+
+# ---- Inkrementalni parseri (scrape_url, scrape) ----
+# Hrane se dijelovima stranice kako stižu s mreže (FetchEngine.stream), pa se
+# ni tijelo ni stablo dokumenta ne drže u memoriji.
+
+class TitleParser(HTMLParser):
+    """Tekst prvog <title> (None ako ga nema); done postaje True čim se naslov zatvori."""
+
+    def __init__(self):
+        super().__init__()
+        self.title = None
+        self.done = False
+        self._parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self._parts is None:
+            self._parts = []
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._parts is not None and not self.done:
+            self.done = True
+
+    def handle_data(self, data):
+        if self._parts is not None and not self.done:
+            self._parts.append(data)
+
+    def feed_chunk(self, text: str) -> bool:
+        """Hrani parser dok naslov nije pronađen; vraća True kad više ne treba podataka."""
+        if not self.done:
+            self.feed(text)
+        if self._parts is not None:
+            self.title = "".join(self._parts).strip()
+        return self.done
+
+
+class LinkParser(HTMLParser):
+    """Skup apsolutnih (http/https) href-ova iz <a> elemenata."""
+
+    def __init__(self):
+        super().__init__()
+        self.links = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value and value.startswith(("http://", "https://")):
+                    self.links.add(value)
+
+    def feed_chunk(self, text: str) -> bool:
+        self.feed(text)
+        return False
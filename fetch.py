@@ -0,0 +1,139 @@
+# fetch.py
+
+import os
+import time
+import codecs
+import asyncio
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import HTTP_FETCH_SECONDS
+from sites_config import SITES
+
+# Najviše otvorenih konekcija ukupno i prema jednom hostu (po procesu)
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", 256))
+FETCH_PER_HOST_LIMIT  = int(os.getenv("FETCH_PER_HOST_LIMIT", 8))
+
+FETCH_TIMEOUT = 10
+
+# Streamani dohvat (FetchEngine.stream): veličina dijela koji se čita s mreže
+# i najviše bajtova tijela koje se pročita (ostatak se odbacuje, truncated=True)
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", 64 * 1024))
+FETCH_MAX_BYTES  = int(os.getenv("FETCH_MAX_BYTES", 10 * 1024 * 1024))
+
+FetchResult = namedtuple("FetchResult", "url status text headers elapsed")
+StreamResult = namedtuple("StreamResult", "url status length truncated elapsed")
+
+# host -> ime sitea iz sites_config, za labelu latencije (ostali hostovi su "other")
+SITE_BY_HOST = {urlsplit(cfg["search_url"]).hostname: name for name, cfg in SITES.items()}
+
+
+def _decoder(charset):
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+class FetchEngine:
+    """
+    Asinkroni HTTP klijent: jedan event loop u pozadinskom threadu i jedna
+    aiohttp sesija s keep-alive poolom konekcija i ograničenjem po hostu.
+    Sinkroni kod ga koristi kroz fetch()/fetch_many(), a async zadaci kroz submit().
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True, name="fetch-loop").start()
+        self._session = self.run(self._make_session())
+
+    async def _make_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=FETCH_MAX_CONNECTIONS,
+            limit_per_host=FETCH_PER_HOST_LIMIT,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def get(self, url: str, timeout: float = FETCH_TIMEOUT, headers: dict = None) -> FetchResult:
+        """GET s raise_for_status (>= 400); 304 na uvjetni zahtjev vraća se kao takav."""
+        start = time.monotonic()
+        try:
+            async with self._session.get(url, headers=headers,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                resp.raise_for_status()
+                text = await resp.text(errors="replace")
+                return FetchResult(str(resp.url), resp.status, text, resp.headers,
+                                   time.monotonic() - start)
+        finally:
+            HTTP_FETCH_SECONDS.observe(time.monotonic() - start,
+                                       site=SITE_BY_HOST.get(urlsplit(url).hostname, "other"))
+
+    async def stream(self, url: str, feed, timeout: float = FETCH_TIMEOUT,
+                     max_bytes: int = FETCH_MAX_BYTES, offload: bool = False) -> StreamResult:
+        """
+        GET koji tijelo ne sprema: dekodirane dijelove predaje feed(text) dok
+        feed ne vrati True, a ostatak samo broji (length je u znakovima, kao
+        len(text)). Čita najviše max_bytes bajtova. offload=True poziva feed
+        izvan event loopa, za parsere koji obrađuju cijelu stranicu.
+        """
+        start = time.monotonic()
+        try:
+            async with self._session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                resp.raise_for_status()
+                decoder = _decoder(resp.charset)
+                length, read, truncated, feeding = 0, 0, False, True
+                async for chunk in resp.content.iter_chunked(FETCH_CHUNK_SIZE):
+                    if read + len(chunk) > max_bytes:
+                        chunk, truncated = chunk[:max_bytes - read], True
+                    read += len(chunk)
+                    text = decoder.decode(chunk)
+                    length += len(text)
+                    if feeding:
+                        stop = await asyncio.to_thread(feed, text) if offload else feed(text)
+                        feeding = not stop
+                    if truncated:
+                        break
+                text = decoder.decode(b"", final=True)
+                length += len(text)
+                if feeding and text:
+                    feed(text)
+                return StreamResult(str(resp.url), resp.status, length, truncated,
+                                    time.monotonic() - start)
+        finally:
+            HTTP_FETCH_SECONDS.observe(time.monotonic() - start,
+                                       site=SITE_BY_HOST.get(urlsplit(url).hostname, "other"))
+
+    async def get_many(self, urls: list, timeout: float = FETCH_TIMEOUT) -> list:
+        return await asyncio.gather(*(self.get(u, timeout) for u in urls), return_exceptions=True)
+
+    def submit(self, coro):
+        """Pokreće korutinu na loopu engine-a; vraća concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def fetch(self, url: str, timeout: float = FETCH_TIMEOUT) -> FetchResult:
+        return self.run(self.get(url, timeout))
+
+    def fetch_many(self, urls: list, timeout: float = FETCH_TIMEOUT) -> list:
+        """Dohvaća sve URL-ove istovremeno; neuspjeli su u listi kao iznimke."""
+        return self.run(self.get_many(urls, timeout))
+
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> FetchEngine:
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = FetchEngine()
+            _engine_pid = os.getpid()
+    return _engine
@@ -0,0 +1,272 @@
+# httpcache.py
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+from db import get_conn
+from fetch import get_engine, FetchResult
+
+# Broj stranica u memorijskom LRU-u (po procesu)
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", 512))
+
+# Drugi, zajednički sloj cachea u Postgresu (tablica http_cache), dijeljen među instancama
+HTTP_CACHE_DB = os.getenv("HTTP_CACHE_DB", "1") == "1"
+
+# Koliko dugo se čeka druga instanca koja već dohvaća isti URL
+HTTP_CACHE_FILL_WAIT = 10
+
+# Istekli redovi http_cache čuvaju se još ovoliko sati radi revalidacije
+# (ETag / Last-Modified), a onda ih lider briše (prune_http_cache)
+HTTP_CACHE_KEEP_STALE_HOURS = float(os.getenv("HTTP_CACHE_KEEP_STALE_HOURS", 24))
+
+
+def _key(url: str) -> bytes:
+    return hashlib.md5(url.encode("utf-8")).digest()
+
+
+class HttpCache:
+    """
+    Cache odgovora po URL-u: memorijski LRU, pa Postgres, pa mreža.
+    Istekli unos se revalidira uvjetnim zahtjevom (ETag / Last-Modified).
+    Istovremeni zahtjevi za isti URL čekaju jedan dohvat: unutar procesa
+    preko zajedničkog futurea, među instancama preko http_cache.filling_until.
+    Sve metode osim fetch_many()/stats() izvršavaju se na loopu fetch engine-a.
+    """
+
+    def __init__(self, engine, max_entries: int, use_db: bool):
+        self.engine = engine
+        self.max_entries = max_entries
+        self.use_db = use_db
+        self._mem = OrderedDict()   # url -> {"result", "etag", "last_modified", "expires"}
+        self._inflight = {}         # url -> asyncio.Future
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("mem_hits", "db_hits", "misses", "revalidated", "coalesced", "bypass", "errors", "db_errors"), 0)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats, entries=len(self._mem), max_entries=self.max_entries, db_tier=self.use_db)
+        lookups = s["mem_hits"] + s["db_hits"] + s["coalesced"] + s["revalidated"] + s["misses"]
+        s["hit_ratio"] = round((lookups - s["misses"]) / lookups, 3) if lookups else 0.0
+        return s
+
+    def _remember(self, url, entry):
+        with self._lock:
+            self._mem[url] = entry
+            self._mem.move_to_end(url)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    async def get(self, url: str, ttl: float) -> FetchResult:
+        if ttl <= 0:
+            self._count("bypass")
+            return await self.engine.get(url)
+
+        with self._lock:
+            entry = self._mem.get(url)
+            if entry:
+                self._mem.move_to_end(url)
+        if entry and entry["expires"] > time.time():
+            self._count("mem_hits")
+            return entry["result"]
+
+        inflight = self._inflight.get(url)
+        if inflight is not None:
+            self._count("coalesced")
+            return await asyncio.shield(inflight)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[url] = fut
+        try:
+            result = await self._fill(url, ttl, entry)
+            fut.set_result(result)
+            return result
+        except Exception as e:
+            self._count("errors")
+            fut.set_exception(e)
+            fut.exception()   # označi kao pročitano ako nitko ne čeka
+            raise
+        finally:
+            del self._inflight[url]
+
+    async def _fill(self, url, ttl, stale):
+        key = _key(url)
+        claim = None
+        if self.use_db:
+            row = await self._db(self._db_load, key)
+            if row and row["fresh"]:
+                self._count("db_hits")
+                return self._store_mem(url, row)
+            if row and row["body"] is not None and stale is None:
+                stale = self._entry_from_row(url, row)
+            claim = await self._db(self._db_claim, key, url)
+            if claim is False:
+                # netko drugi upravo dohvaća isti URL
+                row = await self._wait_for_fill(key)
+                if row:
+                    self._count("coalesced")
+                    return self._store_mem(url, row)
+
+        headers = {}
+        if stale and stale["etag"]:
+            headers["If-None-Match"] = stale["etag"]
+        if stale and stale["last_modified"]:
+            headers["If-Modified-Since"] = stale["last_modified"]
+        try:
+            resp = await self.engine.get(url, headers=headers or None)
+        except Exception:
+            if self.use_db and claim:
+                await self._db(self._db_release, key, claim)
+            raise
+
+        if resp.status == 304 and stale:
+            self._count("revalidated")
+            result = stale["result"]
+            etag = resp.headers.get("ETag") or stale["etag"]
+            last_modified = resp.headers.get("Last-Modified") or stale["last_modified"]
+        else:
+            self._count("misses")
+            result = resp
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+        self._remember(url, {"result": result, "etag": etag, "last_modified": last_modified,
+                             "expires": time.time() + ttl})
+        if self.use_db:
+            await self._db(self._db_store, key, url, result, etag, last_modified, ttl)
+        return result
+
+    def _entry_from_row(self, url, row):
+        return {
+            "result": FetchResult(url, row["status"], row["body"], {}, 0.0),
+            "etag": row["etag"],
+            "last_modified": row["last_modified"],
+            "expires": row["expires_at"].timestamp() if row["expires_at"] else 0,
+        }
+
+    def _store_mem(self, url, row):
+        entry = self._entry_from_row(url, row)
+        self._remember(url, entry)
+        return entry["result"]
+
+    async def _wait_for_fill(self, key):
+        deadline = time.monotonic() + HTTP_CACHE_FILL_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            row = await self._db(self._db_load, key)
+            if row is None or not row["filling"]:
+                return row if row and row["fresh"] else None
+        return None
+
+    # ---- Postgres sloj (sinkrono, izvršava se u threadu preko _db) ----
+    async def _db(self, fn, *args):
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception:
+            # cache u bazi je samo ubrzanje; bez njega se ide na mrežu
+            self._count("db_errors")
+            return None
+
+    def _db_load(self, key):
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  SELECT status, body, etag, last_modified, expires_at,
+                         coalesce(expires_at > now(), false) AS fresh,
+                         coalesce(filling_until > now(), false) AS filling
+                    FROM http_cache WHERE url_hash = %s;
+                """, (key,))
+                return cur.fetchone()
+
+    def _db_claim(self, key, url):
+        """filling_until zauzetog reda (token za _db_release) ili False ako URL dohvaća netko drugi."""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  INSERT INTO http_cache(url_hash, url, filling_until)
+                  VALUES (%s, %s, now() + make_interval(secs => %s))
+                  ON CONFLICT (url_hash) DO UPDATE
+                     SET filling_until = EXCLUDED.filling_until
+                   WHERE http_cache.filling_until IS NULL
+                      OR http_cache.filling_until < now()
+                  RETURNING filling_until;
+                """, (key, url, HTTP_CACHE_FILL_WAIT))
+                row = cur.fetchone()
+            conn.commit()
+        return row["filling_until"] if row else False
+
+    def _db_release(self, key, claim):
+        # samo vlastiti claim: ako je istekao, red je možda već zauzela druga instanca
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  UPDATE http_cache SET filling_until = NULL
+                   WHERE url_hash = %s AND filling_until = %s;
+                """, (key, claim))
+            conn.commit()
+
+    def _db_store(self, key, url, result, etag, last_modified, ttl):
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  INSERT INTO http_cache(url_hash, url, status, body, etag, last_modified,
+                                         fetched_at, expires_at, filling_until)
+                  VALUES (%s, %s, %s, %s, %s, %s, now(), now() + make_interval(secs => %s), NULL)
+                  ON CONFLICT (url_hash) DO UPDATE
+                     SET status = EXCLUDED.status, body = EXCLUDED.body,
+                         etag = EXCLUDED.etag, last_modified = EXCLUDED.last_modified,
+                         fetched_at = now(), expires_at = EXCLUDED.expires_at,
+                         filling_until = NULL;
+                """, (key, url, result.status, result.text, etag, last_modified, ttl))
+            conn.commit()
+
+    # ---- sinkroni ulaz ----
+    async def get_many(self, items):
+        return await asyncio.gather(*(self.get(u, ttl) for u, ttl in items), return_exceptions=True)
+
+    def fetch_many(self, items) -> list:
+        """items: [(url, ttl)]; dohvaća istovremeno, neuspjeli su u listi kao iznimke."""
+        return self.engine.run(self.get_many(items))
+
+
+def prune_http_cache(keep_stale_hours: float, batch_size: int) -> int:
+    """
+    Briše do `batch_size` redova http_cache isteklih prije više od
+    `keep_stale_hours` sati (i ostatke claimova bez tijela) koje nitko ne
+    puni. Vraća broj obrisanih redova.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              DELETE FROM http_cache
+               WHERE url_hash IN (
+                     SELECT url_hash FROM http_cache
+                      WHERE coalesce(expires_at, '-infinity')
+                                < now() - make_interval(secs => %s)
+                        AND (filling_until IS NULL OR filling_until < now())
+                      LIMIT %s);
+            """, (keep_stale_hours * 3600, batch_size))
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+def get_http_cache() -> HttpCache:
+    global _cache, _cache_pid
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = HttpCache(get_engine(), HTTP_CACHE_SIZE, HTTP_CACHE_DB)
+            _cache_pid = os.getpid()
+    return _cache
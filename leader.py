@@ -0,0 +1,106 @@
+# leader.py
+
+import time
+import logging
+
+from db import get_conn
+from metrics import LEADER_CHANGES
+from utils import INSTANCE_ID, LEADER_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Ime lease reda u leader_status (jedan lider za cijeli cluster)
+LEASE_NAME = "leader"
+
+# Uvjet za upise koje smije raditi samo lider: drži li lease još uvijek
+# token kojim je upis pokrenut. Bivši lider s isteklim leaseom (npr. nakon
+# duge GC/IO pauze) tako ne može ništa promijeniti. Parametar je %(token)s.
+FENCE_SQL = f"""EXISTS (SELECT 1 FROM leader_status
+                         WHERE lease = '{LEASE_NAME}' AND token = %(token)s AND expires_at > now())"""
+
+
+class LeaderLease:
+    """
+    Lider clustera preko lease reda u leader_status. Instanca koja drži
+    lease produžuje ga svakih HEARTBEAT_INTERVAL sekundi za LEADER_TIMEOUT;
+    kad istekne, preuzima ga prva instanca koja pokuša, a fencing token se
+    pri svakoj promjeni vlasnika poveća za jedan.
+    """
+
+    def __init__(self, instance_id: str = INSTANCE_ID, timeout: float = LEADER_TIMEOUT):
+        self.instance_id = instance_id
+        self.timeout = timeout
+        self.token = None          # token dok smo lider, inače None
+        self.holder = None         # trenutni lider clustera (instance_id)
+        self.changes = 0           # koliko puta je ova instanca postala lider
+        self._valid_until = 0.0    # monotonic; poslije toga lease možda više nije naš
+
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    def renew(self) -> bool:
+        """Preuzima ili produžuje lease; vraća jesmo li lider."""
+        started = time.monotonic()
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                      INSERT INTO leader_status(lease, leader_id, last_seen, token, expires_at)
+                      VALUES (%(lease)s, %(me)s, now(), 1, now() + make_interval(secs => %(ttl)s))
+                      ON CONFLICT (lease) DO UPDATE
+                         SET leader_id = EXCLUDED.leader_id,
+                             last_seen = now(),
+                             expires_at = EXCLUDED.expires_at,
+                             token = CASE WHEN leader_status.leader_id = EXCLUDED.leader_id
+                                          THEN leader_status.token
+                                          ELSE leader_status.token + 1 END
+                       WHERE leader_status.leader_id = EXCLUDED.leader_id
+                          OR leader_status.expires_at < now()
+                      RETURNING token;
+                    """, {"lease": LEASE_NAME, "me": self.instance_id, "ttl": self.timeout})
+                    row = cur.fetchone()
+                    if row is None:
+                        cur.execute("SELECT leader_id FROM leader_status WHERE lease = %s;",
+                                    (LEASE_NAME,))
+                        other = cur.fetchone()
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"[Leader] lease renewal failed: {e}")
+            if not self.is_leader:
+                self.token = None
+            return self.is_leader
+
+        if row is None:
+            if self.token is not None:
+                logger.info(f"[Leader] lost lease to {other['leader_id'] if other else '?'}")
+            self.token = None
+            self.holder = other["leader_id"] if other else None
+            return False
+
+        if self.token != row["token"]:
+            self.changes += 1
+            LEADER_CHANGES.inc(scope="cluster")
+            logger.info(f"[Leader] {self.instance_id} is cluster leader (token {row['token']})")
+        self.token = row["token"]
+        self.holder = self.instance_id
+        # računa se od početka pokušaja: baza je lease produžila najkasnije tada
+        self._valid_until = started + self.timeout
+        return True
+
+    def release(self):
+        """Predaje lease (gašenje instance) da ga druga instanca odmah preuzme."""
+        if self.token is None:
+            return
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  UPDATE leader_status SET expires_at = now()
+                   WHERE lease = %s AND leader_id = %s AND token = %s;
+                """, (LEASE_NAME, self.instance_id, self.token))
+            conn.commit()
+        self.token = None
+
+    def status(self) -> dict:
+        return {"instance": self.instance_id, "cluster_leader": self.holder,
+                "is_leader": self.is_leader, "token": self.token, "leader_changes": self.changes}
@@ -1,235 +1,926 @@
-# main.py
-
-import os
-import time
-import threading
-import json
-import uuid
-import logging
-from types import SimpleNamespace
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-from db import init_db, get_conn
-from tasks import execute_task
-from utils import HEARTBEAT_INTERVAL
-
-# ---- Logging setup ----
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-logger = logging.getLogger(__name__)
-
-app = Flask(__name__)
-
-# ---- Configuration ----
-NUM_WORKERS    = 3
-worker_threads = {}    # wid -> Thread
-shutdown_flags = {}    # wid -> Event
-leader_lock    = threading.Lock()
-leader_id      = None  # e.g. "w1"
-
-# ---- Election Functions ----
-def elect_initial_leader():
-    global leader_id
-    with leader_lock:
-        for wid, thr in worker_threads.items():
-            if thr.is_alive():
-                leader_id = wid
-                logger.info(f"[Election] Initial leader: {leader_id}")
-                return
-
-def election_loop():
-    global leader_id
-    while True:
-        time.sleep(HEARTBEAT_INTERVAL)
-        with leader_lock:
-            if leader_id is None or not worker_threads.get(leader_id).is_alive():
-                prev = leader_id
-                for wid, thr in worker_threads.items():
-                    if thr.is_alive():
-                        leader_id = wid
-                        logger.info(f"[Election] Leader {prev} dead → new leader: {leader_id}")
-                        break
-
-# ---- Worker Monitor (auto-restart) ----
-def monitor_workers():
-    while True:
-        time.sleep(HEARTBEAT_INTERVAL)
-        for wid, thr in list(worker_threads.items()):
-            if not thr.is_alive():
-                logger.info(f"[Monitor] Worker {wid} died → restarting")
-                evt = threading.Event()
-                shutdown_flags[wid] = evt
-                new_thr = threading.Thread(target=worker_loop, args=(wid, evt), daemon=True)
-                worker_threads[wid] = new_thr
-                new_thr.start()
-
-# ---- Worker Loop ----
-def worker_loop(worker_id: str, stop_evt: threading.Event):
-    logger.info(f"[Worker {worker_id}] started")
-    init_db()
-    while not stop_evt.is_set():
-        # heartbeat / registration
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                  INSERT INTO worker_status(worker_id, status, last_seen, last_active)
-                  VALUES (%s,'Alive',now(),now())
-                  ON CONFLICT(worker_id) DO UPDATE SET last_seen = now();
-                """, (worker_id,))
-            conn.commit()
-
-        # fetch one pending task
-        task = None
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                  SELECT * FROM tasks
-                   WHERE status = 'pending'
-                   ORDER BY created_at
-                   FOR UPDATE SKIP LOCKED
-                   LIMIT 1;
-                """)
-                task = cur.fetchone()
-                if task:
-                    cur.execute("""
-                      UPDATE tasks
-                         SET status='in_progress',
-                             worker_id=%s,
-                             updated_at=now()
-                       WHERE id=%s;
-                    """, (worker_id, task["id"]))
-                conn.commit()
-
-        if task:
-            task_obj = SimpleNamespace(**task)
-            res = execute_task(task_obj)
-            out = res if isinstance(res, str) else json.dumps(res)
-            with get_conn() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                      UPDATE tasks
-                         SET status='completed',
-                             result=%s,
-                             updated_at=now()
-                       WHERE id=%s;
-                    """, (out, task["id"]))
-                    cur.execute(
-                      "UPDATE worker_status SET last_active = now() WHERE worker_id = %s;",
-                      (worker_id,)
-                    )
-                conn.commit()
-        else:
-            time.sleep(1)
-
-    # cleanup on intentional shutdown
-    logger.info(f"[Worker {worker_id}] stopping")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM worker_status WHERE worker_id=%s;", (worker_id,))
-        conn.commit()
-
-# ---- Flask Routes ----
-@app.route("/", methods=["GET", "POST"])
-def index():
-    if request.method == "POST":
-        ttype = request.form.get("task_type")
-        params = request.form.get("parameters")
-        if ttype and params:
-            with get_conn() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                      INSERT INTO tasks(type, parameters, status, created_at, updated_at)
-                      VALUES (%s, %s, 'pending', now(), now());
-                    """, (ttype, params))
-                conn.commit()
-        return redirect(url_for("index"))
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM tasks ORDER BY created_at DESC;")
-            tasks = cur.fetchall()
-            cur.execute("SELECT * FROM worker_status;")
-            workers = cur.fetchall()
-
-    # parse JSON results
-    for t in tasks:
-        if t["result"] and t["type"].startswith("compare"):
-            try:
-                t["parsed"] = json.loads(t["result"])
-            except:
-                t["parsed"] = None
-        else:
-            t["parsed"] = None
-
-    return render_template(
-        "index.html",
-        tasks=tasks,
-        workers=workers,
-        leader=leader_id,
-        now=datetime.utcnow()
-    )
-
-@app.route("/api/add_task", methods=["POST"])
-def api_add_task():
-    data = request.get_json() or {}
-    ttype = data.get("type")
-    params = data.get("parameters")
-    if not ttype or not params:
-        return jsonify(success=False, error="type i parameters required"), 400
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-              INSERT INTO tasks(type, parameters, status, created_at, updated_at)
-              VALUES (%s, %s, 'pending', now(), now()) RETURNING id;
-            """, (ttype, params))
-            tid = cur.fetchone()["id"]
-        conn.commit()
-
-    return jsonify(success=True, task_id=tid)
-
-@app.route("/api/status", methods=["GET"])
-def api_status():
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM tasks ORDER BY id;")
-            ts = cur.fetchall()
-            cur.execute("SELECT * FROM worker_status;")
-            ws = cur.fetchall()
-    return jsonify(tasks=ts, workers=ws)
-
-# test-kill endpoint
-@app.route("/api/kill/<worker_id>", methods=["POST"])
-def api_kill(worker_id):
-    evt = shutdown_flags.get(worker_id)
-    if not evt:
-        return jsonify(success=False, error=f"No such worker {worker_id}"), 404
-    evt.set()
-    return jsonify(success=True, killed=worker_id)
-
-# ---- Startup ----
-if __name__ == "__main__":
-    init_db()
-
-    # spawn initial workers
-    for i in range(1, NUM_WORKERS + 1):
-        wid = f"w{i}"
-        evt = threading.Event()
-        shutdown_flags[wid] = evt
-        thr = threading.Thread(target=worker_loop, args=(wid, evt), daemon=True)
-        worker_threads[wid] = thr
-        thr.start()
-
-    elect_initial_leader()
-
-    # start election and monitor threads
-    threading.Thread(target=election_loop, daemon=True).start()
-    threading.Thread(target=monitor_workers, daemon=True).start()
-
-    app.run(host="0.0.0.0", port=5000, debug=False, use_reloader=False)
+# main.py
+
+import os
+import sys
+import time
+import signal
+import threading
+import json
+import uuid
+import logging
+import argparse
+import multiprocessing
+from types import SimpleNamespace
+from datetime import datetime
+from flask import (
+    Flask, render_template, request, redirect, url_for, jsonify,
+    Response, stream_with_context,
+)
+
+from db import init_db, get_conn, get_pool
+from executors import get_executor
+from httpcache import get_http_cache, prune_http_cache, HTTP_CACHE_KEEP_STALE_HOURS
+from leader import LeaderLease
+from ratelimit import Throttled, get_host_limiter
+from autoscale import Autoscaler, AUTOSCALE_MIN, AUTOSCALE_MAX
+import metrics
+from metrics import Gauge, DB_QUERY_SECONDS, TASKS_COMPLETED, LEADER_CHANGES
+from taskqueue import (
+    complete_tasks, release_tasks, defer_tasks, claims, BatchSizer, get_scheduler, queue_stats,
+    notify_new_tasks, get_notifier, archive_tasks, reap_stale_tasks, QUEUE_EXPR,
+    get_prefetch_buffer, PREFETCH_ENABLED, get_heartbeat, insert_task, insert_tasks, id_ranges, requeue_lost_tasks,
+    claim_idempotency_key, store_idempotency_key, expire_idempotency_keys,
+    BULK_CHUNK_SIZE, IDEMPOTENCY_TTL_HOURS, RESULT_PREVIEW_CHARS, unpack_result,
+)
+from utils import (
+    HEARTBEAT_INTERVAL, WORKER_TIMEOUT, INSTANCE_ID,
+    MAX_ATTEMPTS, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, BATCH_MAX_SIZE, BATCH_TARGET_SECONDS, IDLE_POLL_INTERVAL,
+    ARCHIVE_AFTER_HOURS, ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE,
+    WORKER_PROCESSES, WORKER_THREADS, WORKER_STOP_TIMEOUT,
+)
+
+# ---- Logging setup ----
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+
+# ---- Configuration ----
+worker_threads = {}    # wid -> Thread
+shutdown_flags = {}    # wid -> Event
+worker_procs   = {}    # "p1" -> WorkerProcess (samo u web procesu, uz --processes)
+process_threads = 0    # radnika po procesu radnika; 0 = radnici su threadovi web procesa
+retired        = {}    # ime -> Thread / WorkerProcess koji autoscaler gasi
+autoscaler     = None  # Autoscaler web procesa (AUTOSCALE_MAX > 0)
+stopping       = threading.Event()   # gašenje: monitor i election više ništa ne pokreću
+leader_lock    = threading.Lock()
+leader_id      = None  # e.g. "w1"; lokalni lider, puni prefetch buffer ove instance
+leader_lease   = LeaderLease()   # lider clustera (lease u leader_status)
+
+# U bazi su radnici imenovani po instanci ("<INSTANCE_ID>/w1", u procesu radnika
+# "<INSTANCE_ID>/p1.w1"), da se radnici različitih instanci ne miješaju u
+# worker_status i kod vraćanja zadataka. Zadatke u prefetch bufferu drži
+# DISPATCH_ID (jedan po procesu) dok ih neki radnik ne završi.
+DISPATCH_ID    = f"{INSTANCE_ID}/dispatch"
+
+def worker_name(wid: str) -> str:
+    return f"{INSTANCE_ID}/{wid}"
+
+# ---- Election Functions ----
+def elect_initial_leader():
+    global leader_id
+    with leader_lock:
+        for wid, thr in worker_threads.items():
+            if thr.is_alive():
+                leader_id = wid
+                logger.info(f"[Election] Initial leader: {leader_id}")
+                start_dispatch(wid)
+                return
+
+def election_loop():
+    global leader_id
+    while not stopping.is_set():
+        time.sleep(HEARTBEAT_INTERVAL)
+        with leader_lock:
+            t = worker_threads.get(leader_id)
+            if t is None or not t.is_alive():
+                prev = leader_id
+                for wid, thr in worker_threads.items():
+                    if thr.is_alive():
+                        leader_id = wid
+                        LEADER_CHANGES.inc(scope="local")
+                        logger.info(f"[Election] Leader {prev} dead → new leader: {leader_id}")
+                        start_dispatch(wid)
+                        break
+
+# ---- Cluster leader (lease) ----
+def lease_loop():
+    # lease vrijedi LEADER_TIMEOUT, produžuje se svakih HEARTBEAT_INTERVAL
+    while True:
+        leader_lease.renew()
+        time.sleep(HEARTBEAT_INTERVAL)
+
+# ---- Stale task recovery (samo lider clustera) ----
+def reaper_loop():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        if not leader_lease.is_leader:
+            continue
+        try:
+            reaped = reap_stale_tasks(WORKER_TIMEOUT, MAX_ATTEMPTS, RETRY_BACKOFF_BASE,
+                                      RETRY_BACKOFF_MAX, leader_lease.token)
+            if reaped:
+                logger.info(f"[Reaper] requeued {reaped.get('pending', 0)} stale tasks, "
+                            f"{reaped.get('dead', 0)} dead-lettered")
+        except Exception as e:
+            logger.warning(f"[Reaper] failed: {e}")
+
+# ---- Leader dispatch (prefetch) ----
+def start_dispatch(wid: str):
+    if PREFETCH_ENABLED:
+        threading.Thread(target=dispatch_loop, args=(wid,), daemon=True).start()
+
+def stop_dispatch(wid: str):
+    # nepokrenuti prefetchani zadaci odmah natrag u pending
+    unstarted = get_prefetch_buffer().deactivate(wid)
+    if unstarted:
+        release_tasks(claims(unstarted))
+        logger.info(f"[Dispatch] released {len(unstarted)} prefetched tasks of {wid}")
+
+def dispatch_loop(wid: str):
+    """
+    Dok je `wid` lider, preuzima pending zadatke u prefetch buffer iz kojeg
+    ih uzimaju lokalni radnici; dopunjuje ga kad padne ispod pola cilja.
+    """
+    buffer = get_prefetch_buffer()
+    scheduler = get_scheduler()
+    notifier = get_notifier()
+    stop_evt = None
+    try:
+        while leader_id == wid:
+            if stop_evt is None or stop_evt.is_set():
+                # lider je zaustavljen: pusti njegove zadatke, a ako ga monitor
+                # ponovno pokrene i ostane lider, nastavi puniti buffer
+                stop_dispatch(wid)
+                stop_evt = shutdown_flags[wid]
+                if stop_evt.is_set() or not worker_threads[wid].is_alive():
+                    stop_evt = None
+                    time.sleep(HEARTBEAT_INTERVAL)
+                    continue
+                buffer.activate(wid)
+                logger.info(f"[Dispatch] leader {wid} dispatching")
+            gen = notifier.generation
+            want = buffer.deficit()
+            if not want:
+                buffer.wait_for_demand(HEARTBEAT_INTERVAL)
+                continue
+            start = time.monotonic()
+            with DB_QUERY_SECONDS.time(query="dispatch_claim"):
+                batch = scheduler.claim(DISPATCH_ID, want)
+            if not buffer.put(wid, batch, time.monotonic() - start):
+                release_tasks(claims(batch))
+                continue
+            if not batch:
+                # red je prazan: čekaj NOTIFY kao worker_loop; između se budi samo
+                # radi provjere vodstva i stop_evt, a red bez obavijesti ponovno
+                # provjerava nakon IDLE_POLL_INTERVAL
+                deadline = time.monotonic() + IDLE_POLL_INTERVAL
+                while leader_id == wid and not stop_evt.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or notifier.wait(gen, min(HEARTBEAT_INTERVAL, remaining)):
+                        break
+    except Exception as e:
+        logger.warning(f"[Dispatch] leader {wid} failed: {e}")
+    finally:
+        stop_dispatch(wid)
+
+# ---- Worker Monitor (auto-restart) ----
+def spawn_worker(wid: str):
+    evt = threading.Event()
+    shutdown_flags[wid] = evt
+    thr = threading.Thread(target=worker_loop, args=(wid, evt), daemon=True)
+    worker_threads[wid] = thr
+    thr.start()
+
+def requeue_lost(**where):
+    # radnik pod istim imenom odmah šalje heartbeat, pa zadatke prethodnika vraćamo sami
+    try:
+        requeued = requeue_lost_tasks(MAX_ATTEMPTS, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, **where)
+        if requeued:
+            logger.info(f"[Monitor] requeued {requeued.get('pending', 0)} tasks of a dead worker, "
+                        f"{requeued.get('dead', 0)} dead-lettered")
+    except Exception as e:
+        logger.warning(f"[Monitor] requeue failed, leaving tasks to the reaper: {e}")
+
+def check_workers():
+    """Jedan prolaz monitora: ponovno pokreće umrle radnike i procese radnika."""
+    heartbeat = get_heartbeat(HEARTBEAT_INTERVAL)
+    for wid, thr in list(worker_threads.items()):
+        if not thr.is_alive() and not stopping.is_set():
+            logger.info(f"[Monitor] Worker {wid} died → restarting")
+            requeue_lost(task_ids=heartbeat.held(worker_name(wid)))
+            spawn_worker(wid)
+    for pname, wp in list(worker_procs.items()):
+        if not wp.is_alive() and not stopping.is_set():
+            logger.info(f"[Monitor] Worker process {pname} exited "
+                        f"(code {wp.proc.exitcode}) → restarting")
+            # proces je mrtav: svi zadaci njegovih radnika i dispatchera su izgubljeni
+            requeue_lost(worker_prefix=worker_name(f"{pname}."))
+            wp.start()
+
+def monitor_workers():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        if stopping.is_set():
+            return
+        check_workers()
+        for name, r in list(retired.items()):
+            if not r.is_alive():
+                retired.pop(name)
+        if autoscaler is not None and autoscaler.due():
+            try:
+                scale_workers()
+            except Exception as e:
+                logger.warning(f"[Autoscale] failed: {e}")
+
+def _unit_index(name: str) -> int:
+    return int(name.lstrip("pw"))
+
+def scale_workers():
+    """
+    Jedna odluka autoscalera: dodaje radnike (procese radnika uz --processes)
+    ili gasi one s najvećim brojem; lokalni lider se ne gasi. Ugašeni radnik
+    dovršava započete zadatke kao kod /api/kill, ali ga monitor ne vraća.
+    """
+    units = worker_procs if process_threads else worker_threads
+    current = len(units)
+    target, reason = autoscaler.decide(current)
+    if target == current:
+        return
+    autoscaler.record(current, target, reason)
+    prefix = "p" if process_threads else "w"
+    for _ in range(target - current):
+        i = 1
+        while f"{prefix}{i}" in units or f"{prefix}{i}" in retired:
+            i += 1
+        name = f"{prefix}{i}"
+        if process_threads:
+            worker_procs[name] = WorkerProcess(name, process_threads)
+        else:
+            spawn_worker(name)
+    candidates = sorted((n for n in units if n != leader_id), key=_unit_index, reverse=True)
+    for name in candidates[:max(current - target, 0)]:
+        if process_threads:
+            retired[name] = worker_procs.pop(name)
+            retired[name].stop()
+        else:
+            retired[name] = worker_threads.pop(name)
+            shutdown_flags.pop(name).set()
+
+def start_workers(wids: list):
+    """Radnici ovog procesa, lokalni lider (prefetch) i monitor njihovih threadova."""
+    init_db()
+    # zadatke u prefetch bufferu drži proces dok god živi
+    get_heartbeat(HEARTBEAT_INTERVAL).register(DISPATCH_ID)
+    for wid in wids:
+        spawn_worker(wid)
+    elect_initial_leader()
+    threading.Thread(target=election_loop, daemon=True).start()
+
+def kill_worker(wid: str) -> bool:
+    evt = shutdown_flags.get(wid)
+    if evt is None:
+        return False
+    evt.set()
+    return True
+
+def stop_workers(timeout: float = WORKER_STOP_TIMEOUT):
+    """
+    Gašenje: radnici završavaju započete zadatke i vraćaju nepokrenute u red,
+    procesi radnika dobivaju SIGTERM; na sve se čeka najviše `timeout` sekundi.
+    """
+    stopping.set()
+    for evt in list(shutdown_flags.values()):
+        evt.set()
+    for wp in worker_procs.values():
+        wp.stop()
+    deadline = time.monotonic() + timeout
+    for wid, thr in list(worker_threads.items()):
+        thr.join(max(deadline - time.monotonic(), 0))
+        if thr.is_alive():
+            logger.warning(f"[Shutdown] worker {wid} still busy, leaving its tasks to the reaper")
+    for pname, wp in list(worker_procs.items()) + list(retired.items()):
+        if isinstance(wp, threading.Thread):
+            wp.join(max(deadline - time.monotonic(), 0))
+            continue
+        wp.proc.join(max(deadline - time.monotonic(), 0))
+        if wp.proc.is_alive():
+            logger.warning(f"[Shutdown] worker process {pname} did not stop, killing it")
+            wp.proc.kill()
+    if worker_threads:
+        get_heartbeat(HEARTBEAT_INTERVAL).unregister(DISPATCH_ID)
+
+# ---- Worker processes ----
+# spawn: proces radnika ne nasljeđuje threadove, pool konekcija ni Flask web procesa
+MP = multiprocessing.get_context("spawn")
+
+class WorkerProcess:
+    """
+    Proces s `threads` radnika (worker_process) i cijev kojom web proces
+    šalje naredbe: ("kill", wid), ("metrics",), ("executors",).
+    """
+
+    def __init__(self, name: str, threads: int):
+        self.name = name
+        self.threads = threads
+        self.restarts = -1
+        self.proc = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        with self._lock:
+            self._conn, child_conn = MP.Pipe()
+            self.proc = MP.Process(target=worker_process, name=f"worker-{self.name}",
+                                   args=(self.name, self.threads, child_conn))
+            self.proc.start()
+            child_conn.close()
+            self.restarts += 1
+
+    def is_alive(self) -> bool:
+        return self.proc.is_alive()
+
+    def stop(self):
+        # SIGTERM: worker_process gasi svoje radnike kao stop_workers
+        if self.proc.is_alive():
+            self.proc.terminate()
+
+    def call(self, *msg, timeout: float = 2.0):
+        """Naredba procesu; None ako ne odgovori na vrijeme (npr. upravo se restarta)."""
+        with self._lock:
+            try:
+                while self._conn.poll():   # zakašnjeli odgovor prethodne naredbe
+                    self._conn.recv()
+                self._conn.send(msg)
+                if self._conn.poll(timeout):
+                    return self._conn.recv()
+            except (EOFError, OSError):
+                pass
+        return None
+
+    def status(self) -> dict:
+        return {"pid": self.proc.pid, "alive": self.proc.is_alive(),
+                "threads": self.threads, "restarts": self.restarts}
+
+def control_loop(conn):
+    # naredbe web procesa; kad on nestane (EOF), proces radnika se gasi sam
+    while True:
+        try:
+            cmd, *args = conn.recv()
+        except (EOFError, OSError):
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        if cmd == "kill":
+            reply = kill_worker(args[0])
+        elif cmd == "metrics":
+            reply = metrics.snapshot()
+        elif cmd == "executors":
+            reply = get_executor().stats()
+        else:
+            reply = None
+        conn.send(reply)
+
+def worker_process(pname: str, threads: int, conn):
+    """Ulaz procesa radnika "p1": radnici p1.w1..p1.wT, svoj lokalni lider i prefetch buffer."""
+    global DISPATCH_ID
+    DISPATCH_ID = f"{INSTANCE_ID}/{pname}.dispatch"
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    # Ctrl+C stiže cijeloj grupi procesa; radnike gasi web proces
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start_workers([f"{pname}.w{i}" for i in range(1, threads + 1)])
+    threading.Thread(target=monitor_workers, daemon=True).start()
+    threading.Thread(target=control_loop, args=(conn,), daemon=True).start()
+    logger.info(f"[Process {pname}] pid {os.getpid()} running {threads} workers")
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        pass
+    logger.info(f"[Process {pname}] stopping")
+    stop_workers()
+
+# ---- Archival of completed tasks ----
+# lider uz arhiviranje (ARCHIVE_AFTER_HOURS > 0) briše i istekle Idempotency-Key
+# odgovore i stare redove http_cache
+def archive_loop():
+    while True:
+        time.sleep(ARCHIVE_INTERVAL)
+        if not leader_lease.is_leader:
+            continue
+        try:
+            while ARCHIVE_AFTER_HOURS > 0:
+                moved = archive_tasks(ARCHIVE_AFTER_HOURS, ARCHIVE_BATCH_SIZE, leader_lease.token)
+                if moved:
+                    logger.info(f"[Archive] moved {moved} completed tasks to tasks_history")
+                if moved < ARCHIVE_BATCH_SIZE:
+                    break
+            expire_idempotency_keys(IDEMPOTENCY_TTL_HOURS)
+            while True:
+                pruned = prune_http_cache(HTTP_CACHE_KEEP_STALE_HOURS, ARCHIVE_BATCH_SIZE)
+                if pruned:
+                    logger.info(f"[Archive] pruned {pruned} expired http_cache rows")
+                if pruned < ARCHIVE_BATCH_SIZE:
+                    break
+        except Exception as e:
+            logger.warning(f"[Archive] failed: {e}")
+
+# ---- Worker Loop ----
+def worker_loop(worker_id: str, stop_evt: threading.Event):
+    logger.info(f"[Worker {worker_id}] started (batch max {BATCH_MAX_SIZE})")
+    name = worker_name(worker_id)
+    init_db()
+    sizer = BatchSizer(BATCH_MAX_SIZE, BATCH_TARGET_SECONDS)
+    notifier = get_notifier()
+    scheduler = get_scheduler()
+    prefetch = get_prefetch_buffer()
+    executor = get_executor()
+    # heartbeat šalje zaseban thread (taskqueue.Heartbeat), i za vrijeme dugih zadataka
+    heartbeat = get_heartbeat(HEARTBEAT_INTERVAL)
+    heartbeat.register(name, threading.current_thread())
+    while not stop_evt.is_set():
+        # take a batch from the leader's prefetch buffer, or claim one
+        # directly (fairly across queues) when no leader is dispatching
+        gen = notifier.generation
+        if prefetch.active:
+            batch = prefetch.take(sizer.size, HEARTBEAT_INTERVAL)
+            if not batch:
+                continue
+        else:
+            with DB_QUERY_SECONDS.time(query="claim"):
+                batch = scheduler.claim(name, sizer.size)
+        if batch:
+            start = time.monotonic()
+            tasks = [SimpleNamespace(**t) for t in batch]
+            held = [t.id for t in tasks]
+            # od sada su zadaci prijavljeni kao njegovi (monitor ih vraća ako thread umre)
+            heartbeat.update(name, held=held)
+            done, unstarted = executor.run_batch(
+                tasks, stop_evt,
+                on_progress=lambda t, n: heartbeat.update(name, t.id, f"{n}/{len(tasks)}", held),
+            )
+            # vrati nepokrenute zadatke drugim radnicima
+            if unstarted:
+                with DB_QUERY_SECONDS.time(query="release"):
+                    release_tasks(claims(unstarted))
+            # host je odbio zahtjev (429/503): zadatak čeka Retry-After, dok ima pokušaja
+            throttled = {t.id: res.retry_after for t, res, _ in done
+                         if isinstance(res, Throttled) and t.attempts + 1 < MAX_ATTEMPTS}
+            if throttled:
+                with DB_QUERY_SECONDS.time(query="defer"):
+                    defer_tasks(throttled, dict(claims(tasks)), count_attempt=True)
+                done = [d for d in done if d[0].id not in throttled]
+            # dict/list (compare) ide u JSONB, ostalo kao tekst (taskqueue.pack_result)
+            results = [
+                (t.id, str(res) if isinstance(res, Throttled) else res, cache_hit, t.started_at)
+                for t, res, cache_hit in done
+            ]
+            with DB_QUERY_SECONDS.time(query="complete"):
+                complete_tasks(name, results)
+            TASKS_COMPLETED.inc(len(results), worker=name)
+            heartbeat.update(name)
+            sizer.observe(len(batch), time.monotonic() - start)
+        else:
+            sizer.observe(0, 0)
+            # čekaj NOTIFY; između se budi samo radi provjere stop_evt,
+            # a red bez obavijesti ponovno provjerava nakon IDLE_POLL_INTERVAL
+            deadline = time.monotonic() + IDLE_POLL_INTERVAL
+            while not stop_evt.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or notifier.wait(gen, min(HEARTBEAT_INTERVAL, remaining)):
+                    break
+
+    # cleanup on intentional shutdown
+    logger.info(f"[Worker {worker_id}] stopping")
+    stop_dispatch(worker_id)
+    heartbeat.unregister(name)
+
+# ---- Task listing ----
+MAX_PAGE_SIZE        = 500
+TASK_FILTERS         = {"status": "status", "type": "type", "queue": QUEUE_EXPR,
+                        "worker": "worker_id", "parent": "parent_id"}
+# stupci koje čitaju dashboard i API (bez SELECT *, da se ne vuku nepotrebni stupci)
+WORKER_COLUMNS       = "worker_id, status, last_seen, last_active, current_task, progress"
+EXPORT_COLUMNS       = ("t.id, t.type, t.parameters, t.status, t.worker_id, t.created_at, "
+                        "t.updated_at, t.started_at, t.parent_id, t.url_hash, t.cache_hit, "
+                        "t.priority, t.queue, t.attempts, t.available_at, t.lease_until, "
+                        "t.token_reserved, t.result_size")
+
+def task_filters(args):
+    clauses, params = [], []
+    for arg, col in TASK_FILTERS.items():
+        if args.get(arg):
+            clauses.append(f"{col} = %s")
+            params.append(args[arg])
+    return clauses, params
+
+def fetch_tasks(cur, args, default_order="asc", default_limit=100, full=False):
+    """
+    Keyset paginacija po id-u. Bez `full` se dohvaća samo početak rezultata
+    (compare rezultati su u result_json i idu cijeli); uz `full` se veliki
+    rezultati čitaju i raspakiraju iz task_results.
+    """
+    clauses, params = task_filters(args)
+    order = "desc" if args.get("order", default_order) == "desc" else "asc"
+    cursor_arg, op = ("before_id", "<") if order == "desc" else ("after_id", ">")
+    if args.get(cursor_arg, type=int) is not None:
+        clauses.append(f"id {op} %s")
+        params.append(args.get(cursor_arg, type=int))
+    limit = min(max(args.get("limit", default_limit, type=int), 1), MAX_PAGE_SIZE)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    # tasks.result je za velike rezultate već samo početak; puni tekst je u task_results
+    result_col = "result, body" if full else f"left(result, {RESULT_PREVIEW_CHARS}) AS result"
+    join = "LEFT JOIN task_results ON task_id = id" if full else ""
+    cur.execute(f"""
+      SELECT id, type, parameters, status, worker_id, created_at, updated_at, cache_hit,
+             priority, {QUEUE_EXPR} AS queue,
+             coalesce(result_size, char_length(result)) AS result_size,
+             {result_col}, result_json
+        FROM tasks {join} {where}
+       ORDER BY id {order}
+       LIMIT %s;
+    """, params + [limit])
+    rows = cur.fetchall()
+    if full:
+        for r in rows:
+            r["result"] = unpack_result(r.pop("body"), r["result"])
+    return rows
+
+def task_counts(cur):
+    cur.execute("SELECT type, status, count(*) AS n FROM tasks GROUP BY type, status;")
+    by_status, by_type = {}, {}
+    for r in cur.fetchall():
+        by_status[r["status"]] = by_status.get(r["status"], 0) + r["n"]
+        by_type[r["type"]] = by_type.get(r["type"], 0) + r["n"]
+    return {"total": sum(by_status.values()), "by_status": by_status, "by_type": by_type}
+
+# ---- Flask Routes ----
+@app.route("/", methods=["GET", "POST"])
+def index():
+    if request.method == "POST":
+        ttype = request.form.get("task_type")
+        params = request.form.get("parameters")
+        if ttype and params:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    _, created = insert_task(cur, ttype, params)
+                    if created:
+                        notify_new_tasks(cur)
+                conn.commit()
+        return redirect(url_for("index"))
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            tasks = fetch_tasks(cur, request.args, default_order="desc", default_limit=50)
+            counts = task_counts(cur)
+            cur.execute(f"SELECT {WORKER_COLUMNS} FROM worker_status;")
+            workers = cur.fetchall()
+
+    # compare rezultati stižu kao JSONB (psycopg2 ih već vraća kao dict)
+    for t in tasks:
+        t["parsed"] = t["result_json"] if t["type"].startswith("compare") else None
+
+    return render_template(
+        "index.html",
+        tasks=tasks,
+        workers=workers,
+        counts=counts,
+        filters={k: request.args.get(k, "") for k in TASK_FILTERS},
+        next_before_id=tasks[-1]["id"] if tasks else None,
+        preview_chars=RESULT_PREVIEW_CHARS,
+        leader=leader_id,
+        cluster=leader_lease.status(),
+        now=datetime.utcnow()
+    )
+
+def parse_task(data):
+    """
+    Provjerava jedan zadatak iz /api/add_task(s); vraća
+    ((type, parameters, priority, queue), None) ili (None, poruka greške).
+    """
+    if not isinstance(data, dict):
+        return None, "task must be an object"
+    ttype = data.get("type")
+    params = data.get("parameters")
+    if not ttype or not params:
+        return None, "type i parameters required"
+    priority = data.get("priority", 0)
+    queue = data.get("queue") or None
+    if not isinstance(ttype, str) or not isinstance(params, str):
+        return None, "type and parameters must be strings"
+    # bool je podklasa int-a, ali true nije prioritet
+    if isinstance(priority, bool) or not isinstance(priority, int) \
+            or not -32768 <= priority <= 32767:
+        return None, "priority must be a smallint"
+    if queue is not None and not isinstance(queue, str):
+        return None, "queue must be a string"
+    # Postgres text ne može sadržavati NUL
+    if any("\x00" in v for v in (ttype, params, queue or "")):
+        return None, "strings must not contain NUL characters"
+    return (ttype, params, priority, queue), None
+
+@app.route("/api/add_task", methods=["POST"])
+def api_add_task():
+    """
+    Dodaje zadatak: {"type", "parameters"} te opcionalno "priority" (veći se
+    preuzima prije unutar reda) i "queue" (imenovani red; inače red tipa).
+    scrape_url za URL koji već ima zadatak vraća taj zadatak (duplicate=true).
+    """
+    row, error = parse_task(request.get_json() or {})
+    if error:
+        return jsonify(success=False, error=error), 400
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            tid, created = insert_task(cur, *row)
+            if created:
+                notify_new_tasks(cur)
+        conn.commit()
+
+    return jsonify(success=True, task_id=tid, duplicate=not created)
+
+# Veličina bloka (bajtova) u kojem se čita NDJSON tijelo /api/add_tasks
+BULK_READ_SIZE = 1 << 16
+
+def _bulk_items():
+    """Zadaci iz tijela /api/add_tasks: JSON lista ili NDJSON čitan redak po redak."""
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        # čita se u blokovima (iteracija po recima streama je spora), pa se dijeli na retke
+        rest = b""
+        while True:
+            block = request.stream.read(BULK_READ_SIZE)
+            lines = (rest + block).split(b"\n")
+            rest = lines.pop() if block else b""
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            if not block:
+                break
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            raise ValueError("body must be a JSON array or NDJSON")
+        yield from items
+
+@app.route("/api/add_tasks", methods=["POST"])
+def api_add_tasks():
+    """
+    Masovno dodavanje: JSON lista ili NDJSON (Content-Type application/x-ndjson)
+    objekata kao za /api/add_task. Sve ide u jednoj transakciji kroz COPY u
+    komadima od BULK_CHUNK_SIZE; vraća broj zadataka i raspone id-jeva
+    [[prvi, zadnji], ...]. S zaglavljem Idempotency-Key ponovljeni zahtjev
+    vraća isti odgovor (duplicate=true) bez novih zadataka. scrape_url zadaci
+    za URL-ove koji već postoje se preskaču (skipped).
+    """
+    key = request.headers.get("Idempotency-Key")
+    ids = []
+    total = 0
+    with get_conn() as conn:
+        try:
+            with conn.cursor() as cur:
+                if key:
+                    previous = claim_idempotency_key(cur, key)
+                    if previous is not None:
+                        conn.rollback()
+                        return jsonify(success=True, duplicate=True,
+                                       count=previous["count"], ids=previous["ids"])
+                chunk = []
+                for n, item in enumerate(_bulk_items()):
+                    row, error = parse_task(item)
+                    if error:
+                        conn.rollback()
+                        return jsonify(success=False, error=f"task {n}: {error}"), 400
+                    chunk.append(row)
+                    total += 1
+                    if len(chunk) >= BULK_CHUNK_SIZE:
+                        ids += insert_tasks(cur, chunk)
+                        chunk = []
+                ids += insert_tasks(cur, chunk)
+                ranges = id_ranges(ids)
+                if key:
+                    store_idempotency_key(cur, key, len(ids), ranges)
+                notify_new_tasks(cur, len(ids))
+            conn.commit()
+        except ValueError as e:
+            # i json.JSONDecodeError
+            conn.rollback()
+            return jsonify(success=False, error=str(e)), 400
+
+    return jsonify(success=True, duplicate=False, count=len(ids), ids=ranges,
+                   skipped=total - len(ids))
+
+@app.route("/api/status", methods=["GET"])
+def api_status():
+    """
+    Stranica zadataka: ?after_id=&limit= (ili ?order=desc&before_id=),
+    filtri ?status= &type= &worker=. Tijelo rezultata je skraćeno osim
+    za compare zadatke i uz ?full=1; cijeli rezultat je na /api/tasks/<id>/result.
+    """
+    full = request.args.get("full") == "1"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            ts = fetch_tasks(cur, request.args, full=full)
+            counts = task_counts(cur)
+            cur.execute(f"SELECT {WORKER_COLUMNS} FROM worker_status;")
+            ws = cur.fetchall()
+    cursor_key = "next_before_id" if request.args.get("order") == "desc" else "next_after_id"
+    return jsonify(tasks=ts, workers=ws, counts=counts,
+                   **{cursor_key: ts[-1]["id"] if ts else None})
+
+def _json_default(o):
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, memoryview):   # bytea (url_hash)
+        return o.hex()
+    return str(o)
+
+@app.route("/api/status/stream", methods=["GET"])
+def api_status_stream():
+    """
+    NDJSON izvoz svih zadataka (uz iste filtre kao /api/status), s punim
+    rezultatom; redovi se čitaju server-side kursorom pa memorija ostaje mala.
+    """
+    clauses, params = task_filters(request.args)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    def generate():
+        with get_conn() as conn:
+            with conn.cursor(name="tasks_export") as cur:
+                cur.itersize = 1000
+                cur.execute(f"""
+                  SELECT {EXPORT_COLUMNS}, t.result, t.result_json, r.body
+                    FROM tasks AS t
+                    LEFT JOIN task_results AS r ON r.task_id = t.id
+                   {where} ORDER BY t.id;
+                """, params)
+                for row in cur:
+                    row["result"] = unpack_result(row.pop("body"), row["result"])
+                    yield json.dumps(row, default=_json_default) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/api/tasks/<int:task_id>/result", methods=["GET"])
+def api_task_result(task_id):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              SELECT t.id, t.result, t.result_json, r.body
+                FROM tasks AS t
+                LEFT JOIN task_results AS r ON r.task_id = t.id
+               WHERE t.id = %s;
+            """, (task_id,))
+            row = cur.fetchone()
+    if not row:
+        return jsonify(success=False, error=f"No such task {task_id}"), 404
+    row["result"] = unpack_result(row.pop("body"), row["result"])
+    return jsonify(row)
+
+@app.route("/api/tasks/<int:task_id>/progress", methods=["GET"])
+def api_task_progress(task_id):
+    """Napredak scrape zadatka po statusima njegovih subtaskova (indeks na parent_id)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              SELECT status, count(*) AS n FROM tasks
+               WHERE parent_id = %s
+               GROUP BY status;
+            """, (task_id,))
+            by_status = {r["status"]: r["n"] for r in cur.fetchall()}
+    total = sum(by_status.values())
+    return jsonify(task_id=task_id, total=total, by_status=by_status,
+                   done=by_status.get("completed", 0))
+
+@app.route("/api/queues", methods=["GET"])
+def api_queues():
+    """Redovi: pending/in_progress, težina i cap te čekanje u redu p50/p99 (?window= sekundi)."""
+    window = request.args.get("window", 900, type=float)
+    return jsonify(window=window, queues=queue_stats(window))
+
+# ---- Metrics ----
+def _queue_depth():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT status, count(*) AS n FROM tasks GROUP BY status;")
+            return {(r["status"],): r["n"] for r in cur.fetchall()}
+
+Gauge("tasks_queue_depth", "Broj zadataka po statusu.", ("status",), collect=_queue_depth)
+Gauge("cluster_leader", "1 ako ova instanca drži lease lidera clustera.",
+      collect=lambda: {(): int(leader_lease.is_leader)})
+Gauge("prefetch_buffered", "Zadaci u prefetch bufferu lokalnog lidera.",
+      collect=lambda: {(): len(get_prefetch_buffer())})
+Gauge("workers_running", "Radnici (threadovi) i procesi radnika koje drži web proces.", ("kind",),
+      collect=lambda: {("threads",): sum(t.is_alive() for t in worker_threads.values()),
+                       ("processes",): sum(wp.is_alive() for wp in worker_procs.values())})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # counteri i histogrami procesa radnika zbrajaju se s onima web procesa
+    extra = [snap for snap in (wp.call("metrics") for wp in worker_procs.values()) if snap]
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/leader", methods=["GET"])
+def api_leader():
+    return jsonify(local_leader=leader_id, **leader_lease.status())
+
+@app.route("/api/hosts", methods=["GET"])
+def api_hosts():
+    return jsonify(get_host_limiter().status())
+
+@app.route("/api/dispatch", methods=["GET"])
+def api_dispatch():
+    return jsonify(get_prefetch_buffer().stats())
+
+@app.route("/api/tasks/<int:task_id>/retry", methods=["POST"])
+def api_task_retry(task_id):
+    """Vraća zadatak iz dead-letter statusa ('dead') u red s novim brojačem pokušaja."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              UPDATE tasks
+                 SET status='pending', attempts=0, available_at=NULL,
+                     result=NULL, result_json=NULL, result_size=NULL, updated_at=now()
+               WHERE id = %s AND status = 'dead'
+              RETURNING id;
+            """, (task_id,))
+            row = cur.fetchone()
+            if row:
+                cur.execute("DELETE FROM task_results WHERE task_id = %s;", (task_id,))
+                notify_new_tasks(cur)
+        conn.commit()
+    if not row:
+        return jsonify(success=False, error=f"No dead task {task_id}"), 404
+    return jsonify(success=True, task_id=task_id)
+
+@app.route("/api/cache", methods=["GET"])
+def api_cache():
+    return jsonify(get_http_cache().stats())
+
+@app.route("/api/pool", methods=["GET"])
+def api_pool():
+    return jsonify(get_pool().stats())
+
+@app.route("/api/executors", methods=["GET"])
+def api_executors():
+    if worker_procs:
+        return jsonify(processes={n: wp.call("executors") for n, wp in worker_procs.items()})
+    return jsonify(get_executor().stats())
+
+@app.route("/api/processes", methods=["GET"])
+def api_processes():
+    return jsonify(processes={n: wp.status() for n, wp in worker_procs.items()},
+                   threads=sorted(w for w, t in worker_threads.items() if t.is_alive()),
+                   retiring=sorted(retired),
+                   autoscale=autoscaler.status() if autoscaler else None)
+
+# test-kill endpoint
+@app.route("/api/kill/<path:worker_id>", methods=["POST"])
+def api_kill(worker_id):
+    # "w1" / "p1.w1" ili puno ime iz worker_status ("<INSTANCE_ID>/p1.w1") radnika
+    # ove instance; "p1" gasi cijeli proces radnika (monitor ga zatim pokreće ponovno)
+    instance, _, wid = worker_id.rpartition("/")
+    pname = wid.partition(".")[0]
+    if instance not in ("", INSTANCE_ID):
+        killed = False
+    elif wid in worker_procs:
+        worker_procs[wid].stop()
+        killed = True
+    elif pname in worker_procs:
+        killed = bool(worker_procs[pname].call("kill", wid))
+    else:
+        killed = kill_worker(wid)
+    if not killed:
+        return jsonify(success=False, error=f"No such worker {worker_id}"), 404
+    return jsonify(success=True, killed=worker_id)
+
+# ---- Startup ----
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Web aplikacija i radnici task queuea")
+    ap.add_argument("--processes", type=int, default=WORKER_PROCESSES,
+                    help="procesi radnika odvojeni od weba (0 = radnici u web procesu)")
+    ap.add_argument("--threads", type=int, default=WORKER_THREADS,
+                    help="radnika (threadova) po procesu")
+    args, _ = ap.parse_known_args()   # Dockerfile prosljeđuje i --leader
+
+    init_db()
+    start_units = args.processes if args.processes > 0 else args.threads
+    if AUTOSCALE_MAX > 0:
+        autoscaler = Autoscaler(AUTOSCALE_MIN, AUTOSCALE_MAX,
+                                "processes" if args.processes > 0 else "threads")
+        start_units = min(max(start_units, autoscaler.minimum), autoscaler.maximum)
+    if args.processes > 0:
+        # web proces samo nadzire procese radnika; svaki ima svoje radnike i lidera.
+        # Procesi radnika nasljeđuju INSTANCE_ID (inače bi ga izveli iz svog pid-a)
+        os.environ["INSTANCE_ID"] = INSTANCE_ID
+        process_threads = args.threads
+        for i in range(1, start_units + 1):
+            worker_procs[f"p{i}"] = WorkerProcess(f"p{i}", args.threads)
+        logger.info(f"[Startup] {start_units} worker processes × {args.threads} workers")
+    else:
+        start_workers([f"w{i}" for i in range(1, start_units + 1)])
+
+    # start lease, monitor and recovery threads
+    threading.Thread(target=lease_loop, daemon=True).start()
+    threading.Thread(target=monitor_workers, daemon=True).start()
+    threading.Thread(target=reaper_loop, daemon=True).start()
+    threading.Thread(target=archive_loop, daemon=True).start()
+
+    # docker stop šalje SIGTERM: izađi kroz finally da se lease preda odmah
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=False, use_reloader=False)
+    finally:
+        leader_lease.release()
+        stop_workers()
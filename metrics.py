@@ -0,0 +1,177 @@
+# metrics.py
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Granice histograma vremena (sekunde), od brzih upita do dugih zadataka
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Zajednički dio: ime, opis, imena labela i vrijednosti po kombinaciji labela."""
+
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def _samples(self, extra=()):
+        raise NotImplementedError
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [(k, list(v) if isinstance(v, list) else v) for k, v in self._values.items()]
+
+    def _merged(self, extra) -> list:
+        """Vlastite vrijednosti zbrojene s vrijednostima iz snapshotova drugih procesa."""
+        values = dict(self.snapshot())
+        for snap in extra:
+            for key, v in snap.get(self.name, ()):
+                key = tuple(key)
+                if key not in values:
+                    values[key] = v
+                elif isinstance(v, list):
+                    values[key] = [a + b for a, b in zip(values[key], v)]
+                else:
+                    values[key] += v
+        return list(values.items())
+
+    def render(self, extra=()) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {value:g}" for name, labels, value in self._samples(extra)]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, extra=()):
+        return [(self.name, _labels(self.label_names, k), v) for k, v in self._merged(extra)]
+
+
+class Gauge(_Metric):
+    """Gauge s ručno postavljenom vrijednošću ili funkcijom koja se poziva pri scrapeu."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect   # () -> {label_tuple: value}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self, extra=()):
+        # gauge opisuje proces koji ga iscrtava; vrijednosti drugih procesa se ne zbrajaju
+        if self.collect is not None:
+            try:
+                items = list(self.collect().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [(self.name, _labels(self.label_names, k), v) for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # [brojač po bucketu..., +Inf, suma]
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Mjeri trajanje bloka: with DB_QUERY_SECONDS.time(query="claim"): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, extra=()):
+        out = []
+        for key, counts in self._merged(extra):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = f'le="{bound if bound == "+Inf" else f"{bound:g}"}"'
+                out.append((f"{self.name}_bucket", _labels(self.label_names, key, (le,)), cumulative))
+            out.append((f"{self.name}_sum", _labels(self.label_names, key), counts[-1]))
+            out.append((f"{self.name}_count", _labels(self.label_names, key), cumulative))
+        return out
+
+
+def snapshot() -> dict:
+    """Counteri i histogrami ovog procesa; web proces ih zbraja sa svojima (render(extra))."""
+    return {m.name: m.snapshot() for m in REGISTRY if not isinstance(m, Gauge)}
+
+
+def render(extra=()) -> str:
+    """Sve metrike u Prometheus text formatu (za /metrics), uz snapshotove procesa radnika."""
+    return "\n".join(m.render(extra) for m in REGISTRY) + "\n"
+
+
+# ---- Metrike aplikacije ----
+TASK_SECONDS = Histogram(
+    "task_execution_seconds", "Trajanje izvršavanja zadatka po tipu (bez memo pogodaka).", ("type",))
+QUEUE_WAIT_SECONDS = Histogram(
+    "task_queue_wait_seconds", "Vrijeme od created_at do preuzimanja zadatka, po redu.", ("queue",))
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Trajanje upita iz worker_loopa i dispatchera, po upitu.", ("query",))
+HTTP_FETCH_SECONDS = Histogram(
+    "http_fetch_seconds", "Latencija HTTP dohvata po siteu (ostali hostovi kao 'other').", ("site",))
+TASKS_COMPLETED = Counter(
+    "tasks_completed_total", "Završeni zadaci po radniku (rate() daje zadatke/s).", ("worker",))
+LEADER_CHANGES = Counter(
+    "leader_changes_total", "Promjene lidera: lokalnog (election) i clustera (lease).", ("scope",))
+RATE_LIMITED = Counter(
+    "rate_limited_tasks_total", "Zadaci vraćeni u red zbog ograničenja po hostu (tokens / blocked / throttled).", ("reason",))
+AUTOSCALE_DECISIONS = Counter(
+    "autoscale_decisions_total", "Promjene broja radnika koje je izveo autoscaler, po smjeru i razlogu.",
+    ("direction", "reason"))
+AUTOSCALE_SIGNAL = Gauge(
+    "autoscale_signal", "Zadnje mjerenje autoscalera: spremni pending zadaci, čekanje (s) i udio CPU-a.",
+    ("signal",))
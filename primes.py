@@ -0,0 +1,213 @@
+# primes.py
+
+import os
+import math
+import time
+import heapq
+import bisect
+import itertools
+import threading
+import collections
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Brojeva po segmentu sita; segment zauzima SEGMENT_SIZE/2 bajtova (pamte se samo neparni)
+SEGMENT_SIZE = 1 << 21
+
+# Ispod ove granice sito se radi u procesu pozivatelja (pool se ne isplati)
+PARALLEL_THRESHOLD = 8 * SEGMENT_SIZE
+
+PRIME_PROCESSES = int(os.getenv("PRIME_PROCESSES", os.cpu_count() or 1))
+
+# Koliko segmenata po procesu poola jedan upit drži predanima odjednom
+SEGMENTS_IN_FLIGHT = 2
+
+# Koliko prefiksnih brojača (n -> π(n)) se pamti
+PREFIX_CACHE_SIZE = 4096
+
+
+class SieveTimeout(Exception):
+    pass
+
+
+@lru_cache(maxsize=8)
+def _base_primes(limit: int) -> list:
+    """Neparni prosti brojevi <= limit (obično sito)."""
+    if limit < 3:
+        return []
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0:2] = b"\x00\x00"
+    for p in range(2, math.isqrt(limit) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return [p for p in range(3, limit + 1, 2) if sieve[p]]
+
+
+def _count_segment(lo: int, hi: int) -> int:
+    """
+    Broj prostih u [lo, hi). Segment pamti samo neparne brojeve:
+    indeks i predstavlja broj first + 2*i.
+    """
+    count = 1 if lo <= 2 < hi else 0
+    first = max(lo, 3) | 1
+    if first >= hi:
+        return count
+    size = (hi - first + 1) // 2
+    seg = bytearray([1]) * size
+    for p in _base_primes(math.isqrt(hi - 1)):
+        start = max(p * p, (first + p - 1) // p * p)
+        if start % 2 == 0:
+            start += p
+        if start >= hi:
+            continue
+        idx = (start - first) // 2
+        seg[idx::p] = bytes(len(range(idx, size, p)))
+    return count + seg.count(1)
+
+
+def _segments(k: int, n: int):
+    """
+    [k+1, n] po segmentima [lo, hi); granice su poravnate na SEGMENT_SIZE,
+    da se checkpointi ponovno koriste.
+    """
+    lo = k + 1
+    edge = (k // SEGMENT_SIZE + 1) * SEGMENT_SIZE
+    while edge <= n:
+        if lo < edge:
+            yield lo, edge
+        lo = edge
+        edge += SEGMENT_SIZE
+    yield lo, n + 1
+
+
+class PrimeCounter:
+    """
+    Segmentirano Eratostenovo sito s prefiksnim cacheom: na granicama
+    segmenata pamti π(k), pa se novi upit računa samo od najbližeg manjeg
+    poznatog k. Veliki rasponi se dijele po segmentima na pool procesa.
+    """
+
+    def __init__(self, processes: int = PRIME_PROCESSES):
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._keys = [1]       # sortirani n za koje znamo π(n)
+        self._counts = {1: 0}
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _nearest_below(self, n: int):
+        with self._lock:
+            k = self._keys[bisect.bisect_right(self._keys, n) - 1]
+            return k, self._counts[k]
+
+    def _remember(self, points):
+        with self._lock:
+            for k, c in points:
+                if k not in self._counts:
+                    bisect.insort(self._keys, k)
+                    self._counts[k] = c
+            # izbaci najmanje korisne (najgušće) točke kad se cache prepuni: one
+            # s najmanjim razmakom između susjeda; prva i zadnja točka ostaju
+            excess = len(self._keys) - PREFIX_CACHE_SIZE
+            if excess > 0:
+                keys = self._keys
+                drop = set(heapq.nsmallest(excess, range(1, len(keys) - 1),
+                                           key=lambda i: (keys[i + 1] - keys[i - 1], i)))
+                for i in drop:
+                    del self._counts[keys[i]]
+                self._keys = [k for i, k in enumerate(keys) if i not in drop]
+
+    def _pool(self):
+        # lijeno, kao db.get_pool: dva threada ne smiju pokrenuti dva poola
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def _reset_pool(self, executor):
+        # proces poola je umro (OOM, kill) i pool više ne prima posao:
+        # gasi se, a sljedeći upit otvara novi
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _parallel_counts(self, segments, deadline):
+        """
+        (hi, broj prostih) po segmentima, redom, iz poola procesa. Predano je
+        najviše SEGMENTS_IN_FLIGHT * processes segmenata odjednom, pa memorija
+        ne raste s n; zatvaranje generatora otkazuje predane segmente.
+        """
+        executor = self._pool()
+        window = collections.deque()
+        try:
+            for lo, hi in itertools.islice(segments, SEGMENTS_IN_FLIGHT * self.processes):
+                window.append((hi, executor.submit(_count_segment, lo, hi)))
+            while window:
+                hi, fut = window.popleft()
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                c = fut.result(remaining)
+                for lo, next_hi in itertools.islice(segments, 1):
+                    window.append((next_hi, executor.submit(_count_segment, lo, next_hi)))
+                yield hi, c
+        except BrokenProcessPool:
+            self._reset_pool(executor)
+            raise
+        finally:
+            for _, fut in window:
+                fut.cancel()
+
+    def count(self, n: int, timeout: float = None) -> int:
+        """
+        π(n): broj prostih brojeva <= n. Nakon `timeout` sekundi diže
+        SieveTimeout i otkazuje segmente koji još nisu krenuli; već
+        izračunati prefiksi ostaju zapamćeni.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if n < 2:
+            return 0
+        k, total = self._nearest_below(n)
+        if k == n:
+            return total
+
+        segments = _segments(k, n)
+        parallel = (self.processes > 1 and not _in_pool_worker
+                    and n - k >= PARALLEL_THRESHOLD)
+        if parallel:
+            counts = self._parallel_counts(segments, deadline)
+        else:
+            counts = ((hi, _count_segment(lo, hi)) for lo, hi in segments)
+
+        points = []
+        try:
+            for hi, c in counts:
+                total += c
+                points.append((hi - 1, total))
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError
+        except TimeoutError:
+            counts.close()   # otkazuje segmente predane poolu
+            raise SieveTimeout(f"timed out after {timeout}s") from None
+        finally:
+            self._remember(points)
+        return total
+
+
+# True u procesima koji i sami služe kao pool (bez ugniježđenih poolova)
+_in_pool_worker = False
+
+def mark_pool_worker():
+    global _in_pool_worker
+    _in_pool_worker = True
+
+
+_counter = PrimeCounter()
+
+def count_primes(n: int, timeout: float = None) -> int:
+    return _counter.count(n, timeout)
@@ -0,0 +1,137 @@
+# procpool.py
+
+import os
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import primes
+
+# Broj procesa za CPU posao (parsiranje) i nakon koliko zadataka se proces zamjenjuje
+PROCESS_WORKERS       = int(os.getenv("PROCESS_WORKERS", os.cpu_count() or 1))
+PROCESS_RECYCLE_AFTER = int(os.getenv("PROCESS_RECYCLE_AFTER", 200))
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def _process_main(conn):
+    # u procesu-radniku sito ne smije pokretati vlastiti (ugniježđeni) pool
+    primes.mark_pool_worker()
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        fn, args = msg
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class _ProcessSlot:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_process_main, args=(child,), daemon=True)
+        self.proc.start()
+        child.close()
+        self.served = 0
+
+
+class ProcessRunner:
+    """
+    Pool procesa u kojem svaki poziv ima svoj proces dok traje, pa se
+    poziv koji prekorači timeout može ubiti bez diranja ostalih.
+    Procesi se recikliraju nakon `recycle_after` poziva.
+    """
+
+    def __init__(self, size: int, recycle_after: int):
+        self.size = size
+        self.recycle_after = recycle_after
+        self._ctx = multiprocessing.get_context("spawn")
+        self._sem = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._dispatch = ThreadPoolExecutor(size, thread_name_prefix="proc")
+        self.stats = {"started": 0, "recycled": 0, "killed": 0}
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            self.stats["started"] += 1
+            return _ProcessSlot(self._ctx)
+
+    def _retire(self, slot, kill: bool):
+        if kill:
+            self.stats["killed"] += 1
+            slot.proc.terminate()
+            slot.proc.join(1)
+            if slot.proc.is_alive():
+                slot.proc.kill()
+        else:
+            self.stats["recycled"] += 1
+            try:
+                slot.conn.send(None)
+            except OSError:
+                pass
+        slot.proc.join(1)
+        slot.conn.close()
+
+    def run(self, fn, args, timeout=None):
+        """Izvršava fn(*args) u procesu-radniku; fn mora biti picklable (funkcija modula)."""
+        with self._sem:
+            slot = self._checkout()
+            healthy = False
+            try:
+                slot.conn.send((fn, args))
+                if not slot.conn.poll(timeout):
+                    raise TaskTimeout(f"timed out after {timeout}s (process killed)")
+                ok, value = slot.conn.recv()
+                healthy = True
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"worker process died: {e}")
+            finally:
+                if healthy:
+                    slot.served += 1
+                    if slot.served < self.recycle_after:
+                        self._idle.put(slot)
+                    else:
+                        self._retire(slot, kill=False)
+                else:
+                    self._retire(slot, kill=True)
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def submit(self, fn, args, timeout=None):
+        """Kao run(), ali vraća concurrent.futures.Future."""
+        return self._dispatch.submit(self.run, fn, args, timeout)
+
+    def map(self, fn, argslist, timeout=None) -> list:
+        """Paralelni run() za svaki skup argumenata; neuspjeli su u listi kao iznimke."""
+        futures = [self.submit(fn, args, timeout) for args in argslist]
+        out = []
+        for fut in futures:
+            try:
+                out.append(fut.result())
+            except Exception as e:
+                out.append(e)
+        return out
+
+
+_runner = None
+_runner_pid = None
+_runner_lock = threading.Lock()
+
+def get_process_runner() -> ProcessRunner:
+    global _runner, _runner_pid
+    with _runner_lock:
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = ProcessRunner(PROCESS_WORKERS, PROCESS_RECYCLE_AFTER)
+            _runner_pid = os.getpid()
+    return _runner
@@ -0,0 +1,300 @@
+# ratelimit.py
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from psycopg2.extras import execute_values
+
+from db import get_conn
+from metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+# Tipovi zadataka čiji se dohvati ograničavaju po hostu (fan-out scrape zadatka)
+RATE_LIMITED_TYPES = ("scrape_url",)
+
+# Host iz parametara zadatka u SQL-u (isto što host_of() vraća u Pythonu)
+HOST_EXPR = r"lower(substring(btrim(parameters) from '^https?://(?:[^/@]*@)?([^/:?#]+)'))"
+
+# Početna i granične vrijednosti po hostu: concurrency = zahtjeva u letu koje
+# host podnosi, a brzina punjenja token bucketa je concurrency / latencija
+# (Littleov zakon); kapacitet bucketa je concurrency.
+HOST_CONCURRENCY_START = float(os.getenv("HOST_CONCURRENCY_START", 4))
+HOST_CONCURRENCY_MIN = float(os.getenv("HOST_CONCURRENCY_MIN", 1))
+HOST_CONCURRENCY_MAX = float(os.getenv("HOST_CONCURRENCY_MAX", 32))
+HOST_RATE_MAX = float(os.getenv("HOST_RATE_MAX", 20))
+
+# Latencija iznad ovoliko puta bazne (najmanje izmjerene) znači da host usporava
+HOST_SLOWDOWN_FACTOR = float(os.getenv("HOST_SLOWDOWN_FACTOR", 2))
+
+# Token se zadatku unaprijed rezervira najviše ovoliko sekundi unaprijed;
+# ostali zadaci hosta čekaju u redu bez rezervacije
+HOST_DEFER_MAX = float(os.getenv("HOST_DEFER_MAX", 5))
+
+# Blokada hosta nakon 429/503 bez Retry-After zaglavlja (sekunde)
+HOST_THROTTLE_BACKOFF = float(os.getenv("HOST_THROTTLE_BACKOFF", 10))
+
+# Koliko često (u sekundama) se šalju mjerenja i osvježava popis blokiranih hostova
+HOST_REFRESH_INTERVAL = float(os.getenv("HOST_REFRESH_INTERVAL", 0.5))
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def host_of(url: str):
+    return urlsplit(url.strip()).hostname
+
+
+def retry_after_seconds(headers) -> float:
+    """Retry-After kao broj sekundi ili HTTP datum; None ako ga nema."""
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class Throttled:
+    """
+    Rezultat zadatka koji host nije htio poslužiti (429/503). Radnik ga
+    ne upisuje kao rezultat nego vraća zadatak u red nakon retry_after sekundi.
+    """
+
+    def __init__(self, url: str, status: int, retry_after: float):
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"Error scraping {self.url}: throttled ({self.status}), retry after {self.retry_after:.0f}s"
+
+
+class HostLimiter:
+    """
+    Token bucket po hostu u tablici host_limits, zajednički svim radnicima i
+    instancama. Prije preuzimanja se izbacuju hostovi bez tokena ili s
+    blokadom (blocked()), a preuzeti zadaci troše tokene (acquire()); zadatak
+    bez tokena vraća se u red do svog rezerviranog tokena ili bez rezervacije.
+    Latencije i 429/503 odgovori skupljaju se u memoriji (observe()) i šalju
+    jednim upitom svakih HOST_REFRESH_INTERVAL sekundi; concurrency hosta
+    raste za jedan po "prozoru" uspješnih dohvata, prepolovi se na throttling
+    ili pogrešku, a smanjuje za petinu dok je latencija iznad
+    HOST_SLOWDOWN_FACTOR * bazne.
+    """
+
+    def __init__(self, refresh_interval: float = HOST_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._blocked = []
+        self._refreshed_at = 0.0
+        self._observed = {}      # host -> {"n", "latency", "errors", "throttled", "retry_after"}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # ---- mjerenja (poziva se s loopa fetch engine-a) ----
+    def observe(self, url: str, latency: float = None, status: int = None, headers=None):
+        """
+        Bilježi ishod dohvata. Vraća Throttled ako je host odbio zahtjev,
+        inače None.
+        """
+        host = host_of(url)
+        if not host:
+            return None
+        throttled = None
+        if status in THROTTLE_STATUSES:
+            retry_after = retry_after_seconds(headers)
+            throttled = Throttled(url, status, HOST_THROTTLE_BACKOFF if retry_after is None else retry_after)
+            RATE_LIMITED.inc(reason="throttled")
+        with self._lock:
+            o = self._observed.setdefault(
+                host, {"n": 0, "latency": 0.0, "errors": 0, "throttled": 0, "retry_after": 0.0})
+            if throttled is not None:
+                o["throttled"] += 1
+                o["retry_after"] = max(o["retry_after"], throttled.retry_after)
+            elif latency is not None:
+                o["n"] += 1
+                o["latency"] += latency
+            elif status is None:
+                # timeout ili prekinuta konekcija
+                o["errors"] += 1
+        return throttled
+
+    @staticmethod
+    def _adapt(row, o, now):
+        latency, base = row["latency"], row["base_latency"]
+        if o["n"]:
+            sample = o["latency"] / o["n"]
+            latency = sample if latency is None else 0.8 * latency + 0.2 * sample
+            # bazna latencija je najmanja izmjerena, ali polako prati trajne promjene
+            base = latency if base is None else min(latency, base * 1.01)
+        concurrency, blocked_until, tokens = row["concurrency"], row["blocked_until"], row["tokens"]
+        if o["throttled"]:
+            concurrency /= 2
+            blocked_until = max(filter(None, (blocked_until, now + o["retry_after"])))
+            tokens = 0.0
+        elif o["errors"]:
+            concurrency /= 2
+        elif latency and base and latency > HOST_SLOWDOWN_FACTOR * base:
+            concurrency *= 0.8
+        elif o["n"]:
+            concurrency += o["n"] / concurrency
+        concurrency = min(HOST_CONCURRENCY_MAX, max(HOST_CONCURRENCY_MIN, concurrency))
+        # bez izmjerene latencije pretpostavlja se sekunda po zahtjevu
+        rate = min(HOST_RATE_MAX, concurrency / (latency or 1.0))
+        return (row["host"], tokens, rate, concurrency, latency, base, blocked_until, o["throttled"])
+
+    def _flush(self, cur):
+        with self._lock:
+            observed, self._observed = self._observed, {}
+        if not observed:
+            return
+        hosts = sorted(observed)
+        self._ensure(cur, hosts)
+        cur.execute("""
+          SELECT host, tokens, concurrency, latency, base_latency,
+                 extract(epoch FROM blocked_until)::float8 AS blocked_until,
+                 extract(epoch FROM now())::float8 AS now
+            FROM host_limits WHERE host = ANY(%s)
+           ORDER BY host
+             FOR UPDATE;
+        """, (hosts,))
+        rows = cur.fetchall()
+        updates = [self._adapt(r, observed[r["host"]], r["now"]) for r in rows]
+        execute_values(cur, """
+          UPDATE host_limits AS h
+             SET tokens = least(v.tokens, h.tokens), rate = v.rate, concurrency = v.concurrency,
+                 latency = v.latency, base_latency = v.base_latency,
+                 blocked_until = to_timestamp(v.blocked_until),
+                 throttled = h.throttled + v.throttled
+            FROM (VALUES %s) AS v(host, tokens, rate, concurrency, latency, base_latency,
+                                  blocked_until, throttled)
+           WHERE h.host = v.host;
+        """, updates, template="(%s, %s::float8, %s::float8, %s::float8, %s::float8, %s::float8, %s::float8, %s)")
+
+    def _ensure(self, cur, hosts):
+        execute_values(cur, """
+          INSERT INTO host_limits(host, tokens, rate, concurrency)
+          VALUES %s ON CONFLICT (host) DO NOTHING;
+        """, [(h,) for h in hosts], template=f"(%s, {HOST_CONCURRENCY_START}, "
+                                             f"{HOST_CONCURRENCY_START}, {HOST_CONCURRENCY_START})")
+
+    # ---- preuzimanje ----
+    def blocked(self) -> list:
+        """Hostovi čije se zadatke sada ne preuzima (osvježava se svakih refresh_interval)."""
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return self._blocked
+        with self._refresh_lock:
+            if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                try:
+                    with get_conn() as conn:
+                        with conn.cursor() as cur:
+                            self._flush(cur)
+                            # bez tokena ni do sljedećeg osvježavanja
+                            cur.execute("""
+                              SELECT host FROM host_limits
+                               WHERE blocked_until > now()
+                                  OR tokens + rate * (extract(epoch FROM now() - updated_at)::float8 + %s) < 1;
+                            """, (self.refresh_interval,))
+                            self._blocked = [r["host"] for r in cur.fetchall()]
+                        conn.commit()
+                except Exception as e:
+                    logger.warning(f"[RateLimit] refresh failed: {e}")
+                self._refreshed_at = time.monotonic()
+        return self._blocked
+
+    def acquire(self, tasks: list):
+        """
+        Troši po jedan token hosta za svaki preuzeti zadatak iz RATE_LIMITED_TYPES.
+        Zadatku bez tokena rezervira se jedan od sljedećih tokena (bucket ide u
+        minus) ako stiže unutar HOST_DEFER_MAX sekundi; s rezervacijom se kasnije
+        preuzima bez novog tokena. Vraća (zadaci koji smiju krenuti,
+        {task_id: sekundi do rezerviranog tokena}, [zadaci za vratiti bez rezervacije]).
+        """
+        by_host = {}
+        for t in tasks:
+            if t["type"] in RATE_LIMITED_TYPES and not t.get("token_reserved"):
+                host = host_of(t["parameters"])
+                if host:
+                    by_host.setdefault(host, []).append(t)
+        if not by_host:
+            return tasks, {}, []
+
+        hosts = sorted(by_host)
+        reserved, released, updates = {}, [], []
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                self._ensure(cur, hosts)
+                cur.execute("""
+                  SELECT host, rate,
+                         least(greatest(concurrency, 1),
+                               tokens + rate * extract(epoch FROM now() - updated_at)::float8) AS tokens,
+                         coalesce(blocked_until > now(), false) AS blocked
+                    FROM host_limits WHERE host = ANY(%s)
+                   ORDER BY host
+                     FOR UPDATE;
+                """, (hosts,))
+                for row in cur.fetchall():
+                    host, tokens, rate = row["host"], row["tokens"], max(row["rate"], 1e-3)
+                    for t in by_host[host]:
+                        if row["blocked"]:
+                            released.append(t["id"])
+                        elif tokens >= 1:
+                            tokens -= 1
+                        elif (1 - tokens) / rate <= HOST_DEFER_MAX:
+                            reserved[t["id"]] = (1 - tokens) / rate
+                            tokens -= 1
+                        else:
+                            released.append(t["id"])
+                    updates.append((host, tokens))
+                    if tokens + rate * self.refresh_interval < 1:
+                        # do sljedećeg osvježavanja ovaj proces ne preuzima zadatke hosta
+                        with self._lock:
+                            if host not in self._blocked:
+                                self._blocked = self._blocked + [host]
+                execute_values(cur, """
+                  UPDATE host_limits AS h SET tokens = v.tokens, updated_at = now()
+                    FROM (VALUES %s) AS v(host, tokens) WHERE h.host = v.host;
+                """, updates, template="(%s, %s::float8)")
+            conn.commit()
+
+        if reserved:
+            RATE_LIMITED.inc(len(reserved), reason="tokens")
+        if released:
+            RATE_LIMITED.inc(len(released), reason="blocked")
+        skip = set(reserved) | set(released)
+        return [t for t in tasks if t["id"] not in skip], reserved, released
+
+    def status(self) -> list:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  SELECT host, round(least(greatest(concurrency, 1), tokens
+                                     + rate * extract(epoch FROM now() - updated_at)::float8)::numeric, 2) AS tokens,
+                         round(rate::numeric, 2) AS rate, round(concurrency::numeric, 2) AS concurrency,
+                         round(latency::numeric, 3) AS latency, round(base_latency::numeric, 3) AS base_latency,
+                         blocked_until, throttled, updated_at
+                    FROM host_limits ORDER BY host;
+                """)
+                return cur.fetchall()
+
+
+_limiter = None
+_limiter_pid = None
+_limiter_lock = threading.Lock()
+
+def get_host_limiter() -> HostLimiter:
+    global _limiter, _limiter_pid
+    with _limiter_lock:
+        if _limiter is None or _limiter_pid != os.getpid():
+            _limiter = HostLimiter()
+            _limiter_pid = os.getpid()
+    return _limiter
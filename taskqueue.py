@@ -0,0 +1,1073 @@
+# taskqueue.py
+
+import io
+import os
+import hashlib
+import json
+import time
+import heapq
+import select
+import logging
+import threading
+import zlib
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values, Json
+
+from db import get_conn, DATABASE_URL
+from leader import FENCE_SQL
+from ratelimit import get_host_limiter, HOST_EXPR, RATE_LIMITED_TYPES
+from utils import TASK_LEASE_SECONDS
+from metrics import QUEUE_WAIT_SECONDS, DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Postgres kanal na kojem se javlja da su dodani novi pending zadaci
+NOTIFY_CHANNEL = "new_task"
+
+
+def notify_new_tasks(cur, count: int = 1):
+    """
+    Šalje NOTIFY unutar transakcije koja dodaje zadatke;
+    Postgres ga isporučuje tek nakon commita.
+    """
+    if count > 0:
+        cur.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, str(count)))
+
+
+# Masovno dodavanje (/api/add_tasks): COPY u komadima od BULK_CHUNK_SIZE redova;
+# odgovori po Idempotency-Key čuvaju se IDEMPOTENCY_TTL_HOURS sati
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 5000))
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+
+# sekvenca tasks.id (SERIAL); id-jevi za COPY rezerviraju se iz nje
+TASKS_ID_SEQ = "tasks_id_seq"
+
+def _copy_text(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def id_ranges(ids) -> list:
+    """[1, 2, 3, 7, 8] -> [[1, 3], [7, 8]]"""
+    ranges = []
+    for i in sorted(ids):
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+def url_hash(url: str) -> bytes:
+    """Ključ za deduplikaciju scrape_url zadataka (isto kao md5() u migraciji 4)."""
+    return hashlib.md5(url.encode('utf-8')).digest()
+
+
+def insert_task(cur, ttype: str, params: str, priority: int = 0, queue: str = None) -> tuple:
+    """
+    Dodaje jedan pending zadatak; vraća (id, True). scrape_url zadatak za URL
+    koji je već dodan (isti url_hash u task_urls, i ako je zadatak arhiviran)
+    se ne dodaje, nego vraća (id postojećeg, False). NOTIFY šalje pozivatelj.
+    """
+    if ttype != "scrape_url":
+        cur.execute("""
+          INSERT INTO tasks(type, parameters, status, created_at, updated_at, priority, queue)
+          VALUES (%s, %s, 'pending', now(), now(), %s, %s)
+          RETURNING id;
+        """, (ttype, params, priority, queue))
+        return cur.fetchone()["id"], True
+    key = url_hash(params)
+    cur.execute("""
+      WITH url AS (
+        INSERT INTO task_urls(url_hash, task_id)
+        VALUES (%(key)s, nextval(%(seq)s::regclass))
+        ON CONFLICT (url_hash) DO NOTHING
+        RETURNING task_id
+      )
+      INSERT INTO tasks(id, type, parameters, status, created_at, updated_at, priority, queue, url_hash)
+      SELECT task_id, 'scrape_url', %(params)s, 'pending', now(), now(), %(priority)s, %(queue)s, %(key)s
+        FROM url
+      RETURNING id;
+    """, {"key": key, "seq": TASKS_ID_SEQ, "params": params, "priority": priority, "queue": queue})
+    row = cur.fetchone()
+    if row is not None:
+        return row["id"], True
+    cur.execute("SELECT task_id FROM task_urls WHERE url_hash = %s;", (key,))
+    row = cur.fetchone()
+    return (row["task_id"] if row else None), False
+
+
+def insert_tasks(cur, rows) -> list:
+    """
+    Dodaje pending zadatke iz `rows` [(type, parameters, priority, queue)]
+    jednim COPY-jem. Id-jevi se unaprijed rezerviraju iz sekvence jer COPY
+    ništa ne vraća. COPY ne zna za ON CONFLICT, pa scrape_url zadaci idu
+    višeredčanim INSERT-om s url_hash i URL koji je već dodan se preskače.
+    Vraća id-jeve dodanih zadataka istim redom kao rows. NOTIFY šalje pozivatelj.
+    """
+    if not rows:
+        return []
+    cur.execute("""
+      SELECT array_agg(nextval(%s::regclass)) AS ids FROM generate_series(1, %s);
+    """, (TASKS_ID_SEQ, len(rows)))
+    ids = cur.fetchone()["ids"]
+    buf = io.StringIO()
+    urls = []
+    for tid, (ttype, params, priority, queue) in zip(ids, rows):
+        if ttype == "scrape_url":
+            urls.append((tid, params, priority, queue, url_hash(params)))
+            continue
+        queue = "\\N" if queue is None else _copy_text(queue)
+        buf.write(f"{tid}\t{_copy_text(str(ttype))}\t{_copy_text(str(params))}\tpending\t{priority}\t{queue}\n")
+    if buf.tell():
+        buf.seek(0)
+        cur.copy_expert(
+            "COPY tasks(id, type, parameters, status, priority, queue) FROM STDIN", buf)
+    if not urls:
+        return ids
+    inserted = execute_values(
+        cur,
+        """
+        WITH v(id, parameters, priority, queue, url_hash) AS (VALUES %s),
+        url AS (
+          INSERT INTO task_urls(url_hash, task_id)
+          SELECT url_hash, id FROM v
+          ON CONFLICT (url_hash) DO NOTHING
+          RETURNING task_id
+        )
+        INSERT INTO tasks(id, type, parameters, status, priority, queue, url_hash)
+        SELECT v.id, 'scrape_url', v.parameters, 'pending', v.priority, v.queue, v.url_hash
+          FROM v JOIN url ON url.task_id = v.id
+        RETURNING id
+        """,
+        urls,
+        template="(%s::int, %s::text, %s::smallint, %s::varchar, %s::bytea)",
+        page_size=len(urls),
+        fetch=True,
+    )
+    skipped = {u[0] for u in urls} - {r["id"] for r in inserted}
+    return [tid for tid in ids if tid not in skipped]
+
+
+def claim_idempotency_key(cur, key: str):
+    """
+    Zauzima `key` u transakciji koja dodaje zadatke. Vraća None ako je ključ
+    nov, inače spremljeni odgovor ranijeg zahtjeva ({count, ids}). Istovremeni
+    zahtjev s istim ključem čeka na jedinstvenom indeksu dok prvi ne završi.
+    """
+    cur.execute("""
+      INSERT INTO task_batches(idempotency_key) VALUES (%s)
+      ON CONFLICT (idempotency_key) DO NOTHING
+      RETURNING idempotency_key;
+    """, (key,))
+    if cur.fetchone() is not None:
+        return None
+    cur.execute("SELECT count, ids FROM task_batches WHERE idempotency_key = %s;", (key,))
+    return cur.fetchone()
+
+
+def store_idempotency_key(cur, key: str, count: int, ranges: list):
+    cur.execute("""
+      UPDATE task_batches SET count = %s, ids = %s WHERE idempotency_key = %s;
+    """, (count, json.dumps(ranges), key))
+
+
+def expire_idempotency_keys(older_than_hours: float) -> int:
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              DELETE FROM task_batches
+               WHERE created_at < now() - make_interval(secs => %s);
+            """, (older_than_hours * 3600,))
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+# Red zadatka: imenovani red ako je zadan, inače tip zadatka
+# (isti izraz kao u indeksima tasks_pending_queue_idx i tasks_running_queue_idx)
+QUEUE_EXPR = "COALESCE(queue, type)"
+
+# Politika po redu: težina u fer raspodjeli preuzimanja i cap = najviše
+# in_progress zadataka tog reda u cijelom clusteru (None = bez capa).
+# Interaktivni compare zadaci imaju veću težinu pa ih fan-out scrape_url
+# zadataka ne izgladnjuje; capovi sprječavaju da spori tip zauzme sve radnike.
+QUEUE_POLICIES = {
+    "reverse":             {"weight": 4, "cap": None},
+    "uppercase":           {"weight": 4, "cap": None},
+    "count_primes":        {"weight": 2, "cap": 8},
+    "scrape":              {"weight": 1, "cap": 4},
+    "scrape_url":          {"weight": 1, "cap": 512},
+    "compare_offers":      {"weight": 8, "cap": 32},
+    "compare_skin_offers": {"weight": 8, "cap": 32},
+}
+DEFAULT_QUEUE_POLICY = {"weight": 1, "cap": None}
+
+# Koliko često (u sekundama) scheduler osvježava popis redova s pending zadacima
+QUEUE_REFRESH_INTERVAL = float(os.getenv("QUEUE_REFRESH_INTERVAL", 1))
+
+# Lider preuzima zadatke u prefetch buffer iz kojeg ih uzimaju lokalni radnici
+# (PREFETCH=0 vraća preuzimanje izravno iz baze). Buffer drži otprilike
+# PREFETCH_SECONDS sekundi posla po izmjerenoj brzini trošenja.
+PREFETCH_ENABLED = os.getenv("PREFETCH", "1") == "1"
+PREFETCH_SECONDS = float(os.getenv("PREFETCH_SECONDS", 1))
+PREFETCH_MIN = int(os.getenv("PREFETCH_MIN", 8))
+PREFETCH_MAX = int(os.getenv("PREFETCH_MAX", 256))
+
+
+def claim_tasks(worker_id: str, limit: int, quotas: dict = None, exclude_hosts: list = None) -> list:
+    """
+    Jednim UPDATE ... RETURNING preuzima pending zadatke (SKIP LOCKED da se
+    radnici ne blokiraju). Bez `quotas` uzima do `limit` zadataka iz svih
+    redova po prioritetu pa starosti; s `quotas` ({red: n}) najviše n iz
+    svakog reda, unutar reda po prioritetu pa starosti. Zadaci iz
+    RATE_LIMITED_TYPES prema hostovima iz `exclude_hosts` se preskaču,
+    osim onih koji već imaju rezerviran token (ratelimit.HostLimiter.acquire).
+    """
+    skip_hosts = ""
+    if exclude_hosts:
+        skip_hosts = f"""
+                               AND (token_reserved OR NOT (
+                                        type IN ({", ".join(f"'{t}'" for t in RATE_LIMITED_TYPES)})
+                                        AND {HOST_EXPR} = ANY(%s)))"""
+    host_params = (list(exclude_hosts),) if exclude_hosts else ()
+    if quotas is not None:
+        quotas = {q: n for q, n in quotas.items() if n > 0}
+        if not quotas:
+            return []
+        pick = f"""
+                     SELECT t.id
+                       FROM unnest(%s::varchar[], %s::int[]) AS q(name, quota)
+                      CROSS JOIN LATERAL (
+                            SELECT id FROM tasks
+                             WHERE status = 'pending' AND {QUEUE_EXPR} = q.name
+                               AND (available_at IS NULL OR available_at <= now()){skip_hosts}
+                             ORDER BY priority DESC, created_at, id
+                             FOR UPDATE SKIP LOCKED
+                             LIMIT q.quota) AS t"""
+        params = (worker_id, TASK_LEASE_SECONDS, list(quotas), list(quotas.values())) + host_params
+    else:
+        pick = f"""
+                     SELECT id FROM tasks
+                      WHERE status = 'pending'
+                        AND (available_at IS NULL OR available_at <= now()){skip_hosts}
+                      ORDER BY priority DESC, created_at, id
+                      FOR UPDATE SKIP LOCKED
+                      LIMIT %s"""
+        params = (worker_id, TASK_LEASE_SECONDS) + host_params + (limit,)
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+              UPDATE tasks
+                 SET status='in_progress',
+                     worker_id=%s,
+                     started_at=now(),
+                     lease_until=now() + make_interval(secs => %s),
+                     updated_at=now()
+               WHERE id IN ({pick})
+              RETURNING *, {QUEUE_EXPR} AS queue_name;
+            """, params)
+            tasks = cur.fetchall()
+        conn.commit()
+    for t in tasks:
+        QUEUE_WAIT_SECONDS.observe((t["started_at"] - t["created_at"]).total_seconds(),
+                                   queue=t["queue_name"])
+    # RETURNING ne garantira redoslijed
+    tasks.sort(key=lambda t: (-t["priority"], t["created_at"], t["id"]))
+    return tasks
+
+
+# Rezultati: dict/list (compare zadaci) idu u tasks.result_json (JSONB); tekst dulji
+# od RESULT_INLINE_MAX znakova sprema se zlibom u task_results, a u tasks.result
+# ostaje samo prvih RESULT_PREVIEW_CHARS znakova (koliko prikazuje dashboard)
+RESULT_PREVIEW_CHARS = 300
+RESULT_INLINE_MAX = int(os.getenv("RESULT_INLINE_MAX", 2000))
+
+def pack_result(res):
+    """
+    Rezultat zadatka -> (result, result_json, result_size, body) za upis;
+    body je zlib komprimiran puni tekst ili None ako stane u red.
+    """
+    if isinstance(res, (dict, list)):
+        return None, Json(res), len(json.dumps(res)), None
+    if res is None:
+        return None, None, None, None
+    res = str(res)
+    if len(res) > RESULT_INLINE_MAX:
+        return res[:RESULT_PREVIEW_CHARS], None, len(res), zlib.compress(res.encode())
+    return res, None, len(res), None
+
+
+def unpack_result(body, result):
+    """Puni tekst rezultata: iz task_results.body ako postoji, inače iz tasks.result."""
+    if body is None:
+        return result
+    return zlib.decompress(bytes(body)).decode()
+
+
+def complete_tasks(worker_id: str, results: list):
+    """
+    Upisuje rezultate [(task_id, result, cache_hit, started_at), ...] jednim višeredčanim
+    UPDATE-om. started_at iz preuzimanja je fencing token: ako je zadatak u međuvremenu
+    vraćen u red i ponovno preuzet, zakašnjeli radnik ga više ne može završiti.
+    worker_id zadatka postaje radnik koji ga je izvršio (lider ga je možda preuzeo za njega).
+    Veliki rezultati (vidi pack_result) upisuju se u task_results samo za zadatke
+    koje je UPDATE stvarno završio.
+    """
+    if not results:
+        return
+    rows, bodies = [], {}
+    for tid, res, hit, started_at in results:
+        text, as_json, size, body = pack_result(res)
+        rows.append((tid, started_at, text, as_json, size, hit, worker_id))
+        if body is not None:
+            bodies[tid] = body
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            updated = execute_values(cur, """
+              UPDATE tasks AS t
+                 SET status='completed',
+                     result=v.result,
+                     result_json=v.result_json,
+                     result_size=v.result_size,
+                     cache_hit=v.cache_hit,
+                     worker_id=v.worker_id,
+                     updated_at=now()
+                FROM (VALUES %s) AS v(id, started_at, result, result_json, result_size,
+                                      cache_hit, worker_id)
+               WHERE t.id = v.id AND t.status = 'in_progress'
+                 AND t.started_at = v.started_at
+              RETURNING t.id;
+            """, rows, template="(%s, %s::timestamptz, %s, %s::jsonb, %s::integer, %s, %s)",
+                fetch=True)
+            stored = [(r["id"], bodies[r["id"]]) for r in updated if r["id"] in bodies]
+            if stored:
+                execute_values(cur, """
+                  INSERT INTO task_results(task_id, body) VALUES %s
+                  ON CONFLICT (task_id) DO UPDATE SET body = EXCLUDED.body;
+                """, stored)
+            cur.execute(
+              "UPDATE worker_status SET last_active = now() WHERE worker_id = %s;",
+              (worker_id,)
+            )
+        conn.commit()
+
+
+def claims(tasks) -> list:
+    """[(task_id, started_at)] preuzetih zadataka (dictovi ili objekti s atributima)."""
+    return [(t["id"], t["started_at"]) if isinstance(t, dict) else (t.id, t.started_at)
+            for t in tasks]
+
+
+def release_tasks(claimed: list):
+    """
+    Vraća preuzete, a nepokrenute zadatke [(task_id, started_at)] natrag u
+    pending. Kao kod complete_tasks, started_at je fencing token: zadatak koji
+    je u međuvremenu vraćen u red i preuzet drugdje se ne dira. Rezervirani
+    token hosta (ratelimit) je već potrošen, pa se zadatak ponovno ograničava.
+    """
+    if not claimed:
+        return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            released = execute_values(cur, """
+              UPDATE tasks AS t
+                 SET status='pending',
+                     worker_id=NULL,
+                     started_at=NULL,
+                     lease_until=NULL,
+                     token_reserved=false,
+                     updated_at=now()
+                FROM (VALUES %s) AS v(id, started_at)
+               WHERE t.id = v.id AND t.status = 'in_progress'
+                 AND t.started_at = v.started_at
+              RETURNING t.id;
+            """, claimed, template="(%s, %s::timestamptz)", fetch=True)
+            notify_new_tasks(cur, len(released))
+        conn.commit()
+
+
+def defer_tasks(delays: dict, started: dict, count_attempt: bool = False, reserved: bool = False):
+    """
+    Vraća preuzete zadatke u pending tako da se ne preuzimaju prije isteka
+    odgode: {task_id: sekundi}; started je {task_id: started_at} iz
+    preuzimanja (fencing, kao kod release_tasks). count_attempt=True broji
+    ovo kao pokušaj (zadatak je stvarno pokrenut, npr. host je odgovorio
+    s 429), a reserved=True znači da zadatak već ima token svog hosta (ratelimit).
+    """
+    if not delays:
+        return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+              UPDATE tasks AS t
+                 SET status='pending',
+                     worker_id=NULL,
+                     started_at=NULL,
+                     lease_until=NULL,
+                     attempts=t.attempts + v.attempt,
+                     token_reserved=v.reserved,
+                     available_at=now() + make_interval(secs => v.delay),
+                     updated_at=now()
+                FROM (VALUES %s) AS v(id, started_at, delay, attempt, reserved)
+               WHERE t.id = v.id AND t.status = 'in_progress'
+                 AND t.started_at = v.started_at;
+            """, [(tid, started[tid], delay, int(count_attempt), reserved)
+                  for tid, delay in delays.items()],
+                template="(%s, %s::timestamptz, %s::float8, %s, %s)")
+        conn.commit()
+
+
+class BatchSizer:
+    """
+    Prilagođava veličinu batcha: pun batch znači da je red dubok pa se batch
+    udvostruči, djelomičan ga smanji na ono što je stvarno preuzeto, a prosječno
+    trajanje zadatka ograničava batch na otprilike `target_seconds` posla.
+    """
+
+    def __init__(self, max_size: int, target_seconds: float):
+        self.max_size = max(1, max_size)
+        self.target_seconds = target_seconds
+        self.size = 1
+        self.avg_duration = None
+
+    def observe(self, claimed: int, elapsed: float):
+        if claimed:
+            per_task = elapsed / claimed
+            if self.avg_duration is None:
+                self.avg_duration = per_task
+            else:
+                self.avg_duration = 0.8 * self.avg_duration + 0.2 * per_task
+
+        grow = self.size * 2 if claimed >= self.size else max(claimed, 1)
+        by_time = self.max_size
+        if self.avg_duration:
+            by_time = int(self.target_seconds / self.avg_duration)
+        self.size = max(1, min(self.max_size, by_time, grow))
+
+
+class FairScheduler:
+    """
+    Težinska fer raspodjela preuzimanja među redovima (stride scheduling):
+    svaki red ima "prijeđeni put" koji raste za 1/težina po preuzetom zadatku,
+    a sljedeće mjesto u batchu dobiva aktivni red s najkraćim putem. Red koji
+    tek dobije posao kreće od trenutnog minimuma, pa ne dobiva nadoknadu za
+    vrijeme dok je bio prazan. Jedan scheduler po procesu dijele svi radnici.
+    """
+
+    def __init__(self, policies: dict = None, refresh_interval: float = QUEUE_REFRESH_INTERVAL):
+        self.policies = QUEUE_POLICIES if policies is None else policies
+        self.refresh_interval = refresh_interval
+        self.passes = {}
+        self.pending = set()     # redovi s pending zadacima (pri zadnjem osvježavanju)
+        self.running = {}        # red -> in_progress zadataka u clusteru
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def policy(self, queue: str) -> dict:
+        return self.policies.get(queue, DEFAULT_QUEUE_POLICY)
+
+    def _refresh(self):
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                # skip-scan po indeksu: jedan skok po redu umjesto čitanja svih pending redova
+                cur.execute(f"""
+                  WITH RECURSIVE q(name) AS (
+                    (SELECT {QUEUE_EXPR} FROM tasks WHERE status = 'pending'
+                      ORDER BY 1 LIMIT 1)
+                    UNION ALL
+                    SELECT (SELECT {QUEUE_EXPR} FROM tasks
+                             WHERE status = 'pending' AND {QUEUE_EXPR} > q.name
+                             ORDER BY 1 LIMIT 1)
+                      FROM q WHERE q.name IS NOT NULL
+                  )
+                  SELECT name FROM q WHERE name IS NOT NULL;
+                """)
+                pending = {r["name"] for r in cur.fetchall()}
+                cur.execute(f"""
+                  SELECT {QUEUE_EXPR} AS name, count(*) AS n FROM tasks
+                   WHERE status = 'in_progress'
+                   GROUP BY 1;
+                """)
+                running = {r["name"]: r["n"] for r in cur.fetchall()}
+        self.pending, self.running = pending, running
+        self.refreshed_at = time.monotonic()
+
+    def _floor(self) -> float:
+        # najkraći put među aktivnim redovima koji ga već imaju; novi red ne smije
+        # spustiti minimum na 0 i tako sebi dati nadoknadu
+        return min((self.passes[q] for q in self.pending if q in self.passes), default=0.0)
+
+    def quotas(self, limit: int, force_refresh: bool = False) -> dict:
+        """Raspodjela `limit` mjesta u batchu po redovima ({red: n})."""
+        with self._lock:
+            if force_refresh or time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                self._refresh()
+            if not self.pending:
+                return {}
+            floor = self._floor()
+            passes = {q: max(self.passes.get(q, floor), floor) for q in self.pending}
+            room = {}
+            for q in self.pending:
+                cap = self.policy(q)["cap"]
+                room[q] = limit if cap is None else max(cap - self.running.get(q, 0), 0)
+
+            quotas = {}
+            for _ in range(limit):
+                open_queues = [q for q in passes if room[q] > 0]
+                if not open_queues:
+                    break
+                q = min(open_queues, key=lambda name: (passes[name], name))
+                quotas[q] = quotas.get(q, 0) + 1
+                room[q] -= 1
+                passes[q] += 1.0 / self.policy(q)["weight"]
+            return quotas
+
+    def charge(self, quotas: dict, claimed: list):
+        """Bilježi stvarno preuzete zadatke; red koji nije popunio kvotu je prazan."""
+        counts = {}
+        for t in claimed:
+            counts[t["queue_name"]] = counts.get(t["queue_name"], 0) + 1
+        with self._lock:
+            floor = self._floor()
+            for q, n in counts.items():
+                base = max(self.passes.get(q, floor), floor)
+                self.passes[q] = base + n / self.policy(q)["weight"]
+                self.running[q] = self.running.get(q, 0) + n
+            for q, quota in quotas.items():
+                if counts.get(q, 0) < quota:
+                    self.pending.discard(q)
+
+    def claim(self, worker_id: str, limit: int) -> list:
+        """
+        Preuzima do `limit` zadataka fer raspodijeljenih po redovima. Mjesta
+        koja prazni redovi nisu iskoristili dijele se odmah ostalim redovima.
+        """
+        batch = []
+        limiter = get_host_limiter()
+        for attempt in range(2):
+            quotas = self.quotas(limit - len(batch), force_refresh=attempt == 0 and not self.pending)
+            if not quotas:
+                break
+            claimed = claim_tasks(worker_id, sum(quotas.values()), quotas, limiter.blocked())
+            self.charge(quotas, claimed)
+            batch.extend(claimed)
+            if len(batch) >= limit or len(claimed) == sum(quotas.values()):
+                break
+        # zadaci prema hostovima bez tokena čekaju u redu svoj rezervirani token
+        # ili, bez rezervacije, dok host ponovno ne dobije tokene
+        started = dict(claims(batch))
+        batch, reserved, released = limiter.acquire(batch)
+        if reserved:
+            defer_tasks(reserved, started, reserved=True)
+            get_notifier().wake_after(reserved.values())
+        defer_tasks(dict.fromkeys(released, 0), started)
+        batch.sort(key=lambda t: (-t["priority"], t["created_at"], t["id"]))
+        return batch
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> FairScheduler:
+    """Vraća scheduler ovog procesa."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler()
+    return _scheduler
+
+
+class PrefetchBuffer:
+    """
+    Zadaci koje je lider preuzeo za lokalne radnike. Lider (dispatch_loop u
+    main.py) ga puni velikim batchevima preko FairSchedulera, a radnici iz
+    njega uzimaju bez odlaska u bazu. Ciljana veličina prati izmjerenu brzinu
+    trošenja; kad lider prestane, deactivate() vraća nepokrenute zadatke
+    da ih se odmah vrati u pending.
+    """
+
+    def __init__(self, min_size: int = PREFETCH_MIN, max_size: int = PREFETCH_MAX,
+                 horizon: float = PREFETCH_SECONDS):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.horizon = horizon
+        self.owner = None        # lider koji trenutno puni buffer
+        self.rate = 0.0          # zadataka/s uzetih iz buffera (EWMA)
+        self._tasks = deque()
+        self._taken = 0
+        self._rate_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._stats = {"claims": 0, "claimed": 0, "claim_seconds": 0.0,
+                       "takes": 0, "taken": 0, "take_wait_seconds": 0.0, "released": 0}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    @property
+    def active(self) -> bool:
+        return self.owner is not None
+
+    def activate(self, owner: str):
+        with self._cond:
+            self.owner = owner
+            self.rate = 0.0
+            self._taken = 0
+            self._rate_at = time.monotonic()
+
+    def deactivate(self, owner: str) -> list:
+        """Gasi buffer ako ga puni `owner`; vraća nepokrenute zadatke."""
+        with self._cond:
+            if self.owner != owner:
+                return []
+            self.owner = None
+            unstarted = list(self._tasks)
+            self._tasks.clear()
+            self._stats["released"] += len(unstarted)
+            self._cond.notify_all()
+        return unstarted
+
+    def _update_rate(self):
+        now = time.monotonic()
+        elapsed = now - self._rate_at
+        if elapsed >= 0.2:
+            self.rate = 0.7 * self.rate + 0.3 * (self._taken / elapsed)
+            self._taken = 0
+            self._rate_at = now
+
+    def target(self) -> int:
+        """Koliko zadataka buffer treba držati: PREFETCH_SECONDS posla po trenutnoj brzini."""
+        with self._cond:
+            self._update_rate()
+            return max(self.min_size, min(self.max_size, int(self.rate * self.horizon) + 1))
+
+    def deficit(self) -> int:
+        """Koliko zadataka treba dopuniti; 0 dok je buffer iznad pola cilja."""
+        target = self.target()
+        missing = target - len(self._tasks)
+        return missing if len(self._tasks) <= target // 2 else 0
+
+    def wait_for_demand(self, timeout: float):
+        """Dispatcher čeka da radnici potroše buffer ispod pola cilja."""
+        with self._cond:
+            self._cond.wait(timeout)
+
+    def put(self, owner: str, tasks: list, claim_seconds: float) -> bool:
+        """Dodaje preuzete zadatke; False ako `owner` više ne puni buffer."""
+        with self._cond:
+            self._stats["claims"] += 1
+            self._stats["claim_seconds"] += claim_seconds
+            if self.owner != owner:
+                return False
+            self._stats["claimed"] += len(tasks)
+            self._tasks.extend(tasks)
+            self._cond.notify_all()
+        return True
+
+    def take(self, n: int, timeout: float) -> list:
+        """Uzima do `n` zadataka, čekajući najviše `timeout` sekundi da ih bude."""
+        start = time.monotonic()
+        with self._cond:
+            self._cond.wait_for(lambda: self._tasks or self.owner is None, timeout)
+            batch = [self._tasks.popleft() for _ in range(min(n, len(self._tasks)))]
+            if batch:
+                self._taken += len(batch)
+                self._stats["takes"] += 1
+                self._stats["taken"] += len(batch)
+                self._stats["take_wait_seconds"] += time.monotonic() - start
+                # javi dispatcheru da možda treba dopuniti
+                self._cond.notify_all()
+        return batch
+
+    def stats(self) -> dict:
+        with self._cond:
+            st = dict(self._stats)
+            buffered = len(self._tasks)
+        claim_s, take_s = st.pop("claim_seconds"), st.pop("take_wait_seconds")
+        st.update(
+            enabled=PREFETCH_ENABLED,
+            owner=self.owner,
+            buffered=buffered,
+            target=self.target(),
+            rate=round(self.rate, 1),
+            claim_avg_ms=round(1000 * claim_s / st["claims"], 2) if st["claims"] else None,
+            take_wait_avg_ms=round(1000 * take_s / st["takes"], 2) if st["takes"] else None,
+        )
+        return st
+
+
+_prefetch = None
+_prefetch_lock = threading.Lock()
+
+def get_prefetch_buffer() -> PrefetchBuffer:
+    """Vraća prefetch buffer ovog procesa."""
+    global _prefetch
+    with _prefetch_lock:
+        if _prefetch is None:
+            _prefetch = PrefetchBuffer()
+    return _prefetch
+
+
+def queue_stats(window_seconds: float = 900) -> dict:
+    """
+    Po redu: pending i in_progress zadaci te vrijeme čekanja u redu
+    (started_at - created_at) p50/p99 za zadatke preuzete unutar `window_seconds`.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+              SELECT {QUEUE_EXPR} AS name,
+                     count(*) FILTER (WHERE status = 'pending') AS pending,
+                     count(*) FILTER (WHERE status = 'in_progress') AS in_progress
+                FROM tasks
+               WHERE status IN ('pending', 'in_progress')
+               GROUP BY 1;
+            """)
+            stats = {r["name"]: {"pending": r["pending"], "in_progress": r["in_progress"]}
+                     for r in cur.fetchall()}
+            cur.execute(f"""
+              SELECT {QUEUE_EXPR} AS name,
+                     count(*) AS started,
+                     percentile_cont(0.5) WITHIN GROUP (ORDER BY w) AS wait_p50,
+                     percentile_cont(0.99) WITHIN GROUP (ORDER BY w) AS wait_p99
+                FROM tasks,
+                     LATERAL (SELECT extract(epoch FROM started_at - created_at)) AS x(w)
+               WHERE started_at > now() - make_interval(secs => %s)
+               GROUP BY 1;
+            """, (window_seconds,))
+            for r in cur.fetchall():
+                stats.setdefault(r["name"], {"pending": 0, "in_progress": 0}).update(
+                    started=r["started"],
+                    wait_p50=round(r["wait_p50"], 3),
+                    wait_p99=round(r["wait_p99"], 3),
+                )
+    for name, st in stats.items():
+        st.update(QUEUE_POLICIES.get(name, DEFAULT_QUEUE_POLICY))
+    return stats
+
+
+class Heartbeat:
+    """
+    Heartbeat svih radnika ovog procesa iz jednog threada: svakih `interval`
+    sekundi jedna naredba upisuje last_seen, trenutni zadatak, napredak i
+    zadatke koje drži za sve žive radnike i produžuje lease tim zadacima. Radnik čiji je
+    thread umro više se ne javlja, pa lider nakon WORKER_TIMEOUT vraća
+    njegove zadatke u red.
+    """
+
+    def __init__(self, interval: float, lease_seconds: float = TASK_LEASE_SECONDS):
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.beats = 0
+        self._workers = {}   # ime -> {"thread", "task", "progress", "held"}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def register(self, name: str, thread: threading.Thread = None):
+        with self._lock:
+            self._workers[name] = {"thread": thread, "task": None, "progress": None, "held": []}
+
+    def update(self, name: str, task_id: int = None, progress: str = None, held: list = ()):
+        """Trenutni zadatak, napredak (npr. "3/16") i svi zadaci koje radnik drži."""
+        with self._lock:
+            w = self._workers.get(name)
+            if w is not None:
+                w.update(task=task_id, progress=progress, held=list(held))
+
+    def held(self, name: str) -> list:
+        """Zadaci koje je radnik zadnje prijavio (i nakon što mu je thread umro)."""
+        with self._lock:
+            w = self._workers.get(name)
+            return list(w["held"]) if w else []
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._workers.pop(name, None)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM worker_status WHERE worker_id=%s;", (name,))
+            conn.commit()
+
+    def beat(self):
+        with self._lock:
+            rows = [(name, w["task"], w["progress"], w["held"])
+                    for name, w in self._workers.items()
+                    if w["thread"] is None or w["thread"].is_alive()]
+        if not rows:
+            return
+        with DB_QUERY_SECONDS.time(query="heartbeat"), get_conn() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, f"""
+                  WITH v(worker_id, current_task, progress, held) AS (VALUES %s),
+                  beat AS (
+                    INSERT INTO worker_status(worker_id, status, last_seen, last_active,
+                                              current_task, progress, held)
+                    SELECT worker_id, 'Alive', now(), now(), current_task, progress, held FROM v
+                    ON CONFLICT (worker_id) DO UPDATE
+                       SET status = 'Alive',
+                           last_seen = now(),
+                           current_task = EXCLUDED.current_task,
+                           progress = EXCLUDED.progress,
+                           held = EXCLUDED.held
+                  )
+                  UPDATE tasks
+                     SET lease_until = now() + make_interval(secs => {float(self.lease_seconds)})
+                   WHERE status = 'in_progress'
+                     AND id IN (SELECT unnest(held) FROM v);
+                """, rows, template="(%s, %s::int, %s, %s::int[])")
+            conn.commit()
+        self.beats += 1
+
+    def _loop(self):
+        while True:
+            try:
+                self.beat()
+            except Exception as e:
+                logger.warning(f"[Heartbeat] failed: {e}")
+            time.sleep(self.interval)
+
+
+_heartbeat = None
+_heartbeat_pid = None
+_heartbeat_lock = threading.Lock()
+
+def get_heartbeat(interval: float) -> Heartbeat:
+    """Vraća heartbeat ovog procesa (thread roditelja ne preživi fork)."""
+    global _heartbeat, _heartbeat_pid
+    with _heartbeat_lock:
+        if _heartbeat is None or _heartbeat_pid != os.getpid():
+            _heartbeat = Heartbeat(interval)
+            _heartbeat_pid = os.getpid()
+    return _heartbeat
+
+
+class TaskNotifier:
+    """
+    Jedna LISTEN konekcija po procesu. Pozadinski thread čeka NOTIFY i budi
+    besposlene radnike; dok LISTEN konekcija nije spojena, wait() se ponaša
+    kao obično kratko pollanje.
+    """
+
+    def __init__(self, channel: str = NOTIFY_CHANNEL):
+        self.channel = channel
+        self.generation = 0
+        self.listening = False
+        self._wakeups = []       # heap monotonic trenutaka zakazanih buđenja (wake_after)
+        self._cond = threading.Condition()
+        threading.Thread(target=self._listen_loop, daemon=True).start()
+
+    def _listen_loop(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel};")
+                self.listening = True
+                # zadaci dodani dok nismo slušali
+                self._wake()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self._wake()
+            except Exception as e:
+                logger.warning(f"[Notifier] LISTEN connection lost: {e}")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+            threading.Event().wait(1)
+
+    def _wake(self):
+        with self._cond:
+            self.generation += 1
+            self._cond.notify_all()
+
+    def wake_after(self, delays):
+        """
+        Zakazuje buđenje po jednog besposlenog radnika nakon svake od `delays`
+        sekundi (kad odgođeni zadaci postanu dostupni); bez NOTIFY-a.
+        """
+        now = time.monotonic()
+        with self._cond:
+            for d in delays:
+                heapq.heappush(self._wakeups, now + d)
+            self._cond.notify_all()
+
+    def wait(self, since_generation: int, timeout: float) -> bool:
+        """
+        Čeka obavijest noviju od `since_generation` (najviše `timeout` sekundi).
+        Vraća True ako red treba ponovno provjeriti.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if not self.listening:
+                self._cond.wait(min(timeout, 1))
+                return True
+            while self.generation == since_generation:
+                now = time.monotonic()
+                if self._wakeups and self._wakeups[0] <= now:
+                    while self._wakeups and self._wakeups[0] <= now:
+                        heapq.heappop(self._wakeups)
+                    return True
+                until = min(deadline, self._wakeups[0]) if self._wakeups else deadline
+                if until <= now:
+                    return False
+                self._cond.wait(until - now)
+            return True
+
+
+_notifier = None
+_notifier_pid = None
+_notifier_lock = threading.Lock()
+
+def get_notifier() -> TaskNotifier:
+    """Vraća notifier ovog procesa (thread roditelja ne preživi fork)."""
+    global _notifier, _notifier_pid
+    with _notifier_lock:
+        if _notifier is None or _notifier_pid != os.getpid():
+            _notifier = TaskNotifier()
+            _notifier_pid = os.getpid()
+    return _notifier
+
+
+# Je li izgubljeni zadatak stvarno krenuo: preuzeo ga je sam radnik ili ga je
+# radnik uzeo iz prefetch buffera lidera (prijavio ga je u heartbeatu, held).
+# Zadatak koji je samo čekao u bufferu (worker_id je DISPATCH_ID) nije krenuo.
+TASK_RAN_SQL = """(t.worker_id NOT LIKE '%%dispatch'
+                       OR EXISTS (SELECT 1 FROM worker_status AS h WHERE t.id = ANY(h.held)))"""
+
+# Vraćanje zadatka izgubljenog radnika u red (r.ran iz TASK_RAN_SQL): za zadatak
+# koji je krenuo pokušaj se broji, čeka se eksponencijalni backoff, a nakon
+# max_attempts pokušaja ide u 'dead'; nepokrenuti se samo vraća u pending
+REQUEUE_SET = """
+                     attempts = t.attempts + r.ran::int,
+                     status = CASE WHEN r.ran AND t.attempts + 1 >= %(max_attempts)s
+                                   THEN 'dead' ELSE 'pending' END,
+                     result = CASE WHEN r.ran AND t.attempts + 1 >= %(max_attempts)s
+                                   THEN 'Error: worker lost ' || (t.attempts + 1) || ' times'
+                                   ELSE t.result END,
+                     available_at = CASE WHEN r.ran
+                                         THEN now() + make_interval(secs =>
+                                              least(%(base)s * power(2, t.attempts), %(max)s))
+                                         ELSE t.available_at END,
+                     worker_id = NULL,
+                     started_at = NULL,
+                     lease_until = NULL,
+                     token_reserved = false,
+                     updated_at = now()"""
+
+def reap_stale_tasks(worker_timeout: float, max_attempts: int,
+                     backoff_base: float, backoff_max: float, token: int) -> dict:
+    """
+    Jednim UPDATE-om vraća u red in_progress zadatke čiji radnik nije poslao
+    heartbeat unutar `worker_timeout` sekundi (ili ga nema) ili kojima je
+    istekao lease. Pokušaj se broji; vraćeni zadatak čeka eksponencijalni
+    backoff, a onaj koji je iscrpio `max_attempts` ide u status 'dead'.
+    Radi samo dok lider s tokenom `token` drži lease. Vraća {status: broj}.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+              WITH stale AS (
+                SELECT t.id, {TASK_RAN_SQL} AS ran FROM tasks AS t
+                  LEFT JOIN worker_status AS w ON w.worker_id = t.worker_id
+                 WHERE t.status = 'in_progress'
+                   AND t.started_at < now() - make_interval(secs => %(timeout)s)
+                   AND (t.lease_until < now()
+                        OR w.worker_id IS NULL
+                        OR w.last_seen < now() - make_interval(secs => %(timeout)s))
+                   AND {FENCE_SQL}
+                   FOR UPDATE OF t SKIP LOCKED
+              )
+              UPDATE tasks AS t
+                 SET {REQUEUE_SET}
+                FROM stale AS r
+               WHERE t.id = r.id
+              RETURNING t.status;
+            """, {"timeout": worker_timeout, "max_attempts": max_attempts,
+                  "base": backoff_base, "max": backoff_max, "token": token})
+            reaped = {}
+            for r in cur.fetchall():
+                reaped[r["status"]] = reaped.get(r["status"], 0) + 1
+        conn.commit()
+    return reaped
+
+
+def requeue_lost_tasks(max_attempts: int, backoff_base: float, backoff_max: float,
+                       task_ids: list = (), worker_prefix: str = None) -> dict:
+    """
+    Kao reap_stale_tasks, ali odmah i bez lidera: za radnika ovog procesa za
+    kojeg se zna da je umro (monitor ga upravo ponovno pokreće) vraća u red
+    zadatke koje je držao (`task_ids`), odnosno sve zadatke procesa radnika
+    čija imena počinju s `worker_prefix`. Novi radnik pod istim imenom odmah
+    šalje heartbeat, pa ih reaper ne bi vratio prije isteka TASK_LEASE_SECONDS.
+    `task_ids` su krenuli; od ostalih se pokušaj broji samo po TASK_RAN_SQL.
+    """
+    if not task_ids and not worker_prefix:
+        return {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+              WITH lost AS (
+                SELECT t.id, (t.id = ANY(%(ids)s::int[]) OR {TASK_RAN_SQL}) AS ran
+                  FROM tasks AS t
+                 WHERE t.status = 'in_progress'
+                   AND (t.id = ANY(%(ids)s::int[])
+                        OR left(t.worker_id, char_length(%(prefix)s::text)) = %(prefix)s::text)
+                   FOR UPDATE OF t
+              )
+              UPDATE tasks AS t
+                 SET {REQUEUE_SET}
+                FROM lost AS r
+               WHERE t.id = r.id
+              RETURNING t.status;
+            """, {"ids": list(task_ids), "prefix": worker_prefix,
+                  "max_attempts": max_attempts, "base": backoff_base, "max": backoff_max})
+            requeued = {}
+            for r in cur.fetchall():
+                requeued[r["status"]] = requeued.get(r["status"], 0) + 1
+        conn.commit()
+    return requeued
+
+
+def archive_tasks(older_than_hours: float, batch_size: int, token: int) -> int:
+    """
+    Seli do `batch_size` završenih zadataka starijih od `older_than_hours`
+    iz tasks u tasks_history. Vraća broj preseljenih redova; radi samo dok
+    lider s fencing tokenom `token` još drži lease.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+              WITH moved AS (
+                DELETE FROM tasks
+                 WHERE id IN (
+                       SELECT id FROM tasks
+                        WHERE status = 'completed'
+                          AND updated_at < now() - make_interval(secs => %(secs)s)
+                          AND {FENCE_SQL}
+                        ORDER BY id
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT %(limit)s)
+                RETURNING *
+              )
+              -- task_results se briše kaskadno; veliki rezultat ide u data kao base64 zlib
+              INSERT INTO tasks_history(id, type, status, created_at, updated_at, data)
+              SELECT m.id, m.type, m.status, m.created_at, m.updated_at,
+                     to_jsonb(m) || CASE WHEN r.task_id IS NULL THEN '{{}}'::jsonb
+                                    ELSE jsonb_build_object('result_zlib', encode(r.body, 'base64')) END
+                FROM moved AS m
+                LEFT JOIN task_results AS r ON r.task_id = m.id
+              ON CONFLICT (id) DO NOTHING;
+            """, {"secs": older_than_hours * 3600, "token": token, "limit": batch_size})
+            moved = cur.rowcount
+        conn.commit()
+    return moved
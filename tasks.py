@@ -1,263 +1,276 @@
-# tasks.py
-
-import requests
-from bs4 import BeautifulSoup
-import json
-import re
-from urllib.parse import quote_plus
-
-from db import get_conn
-from sites_config import SITES
-
-
-def execute_task(task):
-    """
-    Prema task.type poziva odgovarajuću funkciju.
-    'task' je objekt s atributima id, type, parameters, itd.
-    """
-    try:
-        t = task.type
-        params = task.parameters.strip()
-
-        if t == 'count_primes':
-            return count_primes(int(params))
-
-        elif t == 'reverse':
-            return params[::-1]
-
-        elif t == 'uppercase':
-            return params.upper()
-
-        elif t == 'scrape':
-            return dispatch_scrape_subtasks(task.id, params)
-
-        elif t == 'scrape_url':
-            return scrape_single_url(params)
-
-        elif t == 'compare_offers':
-            return compare_offers(params)
-
-        elif t == 'compare_skin_offers':
-            return compare_skin_offers(params)
-
-        else:
-            return f"Unknown task type: {t}"
-    except Exception as e:
-        return f"Error while executing {task.type}: {e}"
-
-
-# === 1. count_primes i is_prime ===
-
-def count_primes(n):
-    count = 0
-    for num in range(2, n + 1):
-        if is_prime(num):
-            count += 1
-    return count
-
-def is_prime(x):
-    if x < 2:
-        return False
-    if x == 2:
-        return True
-    if x % 2 == 0:
-        return False
-    limit = int(x**0.5) + 1
-    d = 3
-    while d <= limit:
-        if x % d == 0:
-            return False
-        d += 2
-    return True
-
-
-# === 2. dispatch_scrape_subtasks i scrape_single_url ===
-
-def dispatch_scrape_subtasks(parent_task_id, url):
-    """
-    Scrapea URL i za svaki <a href=...> kreira novi subtask.
-    Parent task se potom označi kao completed s rezultatom.
-    """
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        anchors = soup.find_all('a', href=True)
-
-        links = {a['href'] for a in anchors
-                 if a['href'].startswith(('http://', 'https://'))}
-        count = 0
-
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                for link in links:
-                    cur.execute(
-                        """
-                        INSERT INTO tasks(type, parameters, status, created_at, updated_at)
-                        VALUES (%s, %s, 'pending', now(), now())
-                        """,
-                        ('scrape_url', link)
-                    )
-                    count += 1
-
-                cur.execute(
-                    """
-                    UPDATE tasks
-                       SET status='completed',
-                           result=%s,
-                           updated_at=now()
-                     WHERE id = %s
-                    """,
-                    (f"Dispatched {count} subtasks", parent_task_id)
-                )
-            conn.commit()
-
-        return f"Dispatched {count} subtasks"
-
-    except Exception as e:
-        return f"Error in dispatch_scrape_subtasks: {e}"
-
-
-def scrape_single_url(url):
-    """
-    Scrapea URL i vraća njegov <title> i duljinu HTML sadržaja.
-    """
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        text = resp.text
-        soup = BeautifulSoup(text, 'html.parser')
-        title = soup.find('title')
-        title_text = title.text.strip() if title else '(no title)'
-        return f"Title: {title_text} (length {len(text)} chars)"
-    except Exception as e:
-        return f"Error scraping {url}: {e}"
-
-
-# === 3. compare_offers i generički scraper ===
-
-def compare_offers(product_name: str) -> str:
-    """
-    Scrapea Links i Instar, vraća JSON:
-      { "offers":[{"site",price,url},…], "best":site_name }
-    Preskače sve gdje price=None, best=None ako nema ponuda.
-    """
-    query = re.sub(r'\s+', '+', product_name.strip())
-    full_phrase = product_name.strip().lower()
-    keywords = [w.lower() for w in product_name.strip().split()]
-
-    offers = []
-    for site_name, cfg in SITES.items():
-        if site_name not in ("Links", "Instar"):
-            continue
-
-        search_url = cfg["search_url"].format(query=query)
-        price, link = scrape_site(search_url, cfg, full_phrase, keywords)
-        if price is not None:
-            offers.append({
-                "site": site_name,
-                "price": price,
-                "url": link
-            })
-
-    if not offers:
-        return json.dumps({"offers": [], "best": None})
-
-    best_offer = min(offers, key=lambda o: o["price"])
-    return json.dumps({"offers": offers, "best": best_offer["site"]})
-
-
-def scrape_site(search_url: str, cfg: dict, full_phrase: str, keywords: list):
-    """
-    Generički scraper: koristi cfg['item_selector'] i cfg['price_selector'].
-    Vraća (float price or None, product_url).
-    """
-    try:
-        resp = requests.get(search_url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, 'html.parser')
-
-        # koristi točno onaj selector iz konfiguracije
-        items = soup.select(cfg["item_selector"])
-        if not items:
-            return None, search_url
-
-        # pokušaj prvo full-phrase match
-        match = None
-        for it in items:
-            if cfg.get("title_attr"):
-                title_text = it.get(cfg["title_attr"], "").lower()
-            elif cfg.get("title_in_span"):
-                span = it.select_one("span")
-                title_text = span.get_text(strip=True).lower() if span else ""
-            else:
-                title_text = ""
-            if full_phrase in title_text:
-                match = it
-                break
-
-        # fallback: match po svim ključnim riječima
-        if not match:
-            for it in items:
-                if cfg.get("title_attr"):
-                    title_text = it.get(cfg["title_attr"], "").lower()
-                elif cfg.get("title_in_span"):
-                    span = it.select_one("span")
-                    title_text = span.get_text(strip=True).lower() if span else ""
-                else:
-                    title_text = ""
-                if all(k in title_text for k in keywords):
-                    match = it
-                    break
-
-        if not match:
-            return None, search_url
-
-        href = match.get("href", "")
-        link = href if href.startswith("http") else cfg["url_prefix"].rstrip("/") + href
-
-        # parsaj cijenu
-        price_elem = match.select_one(cfg["price_selector"])
-        price_text = price_elem.get_text(strip=True) if price_elem else None
-        if not price_text:
-            nxt = match.find_next(string=re.compile(r"€"))
-            price_text = nxt.strip() if nxt else None
-
-        if not price_text:
-            return None, link
-
-        # očisti i konvertiraj na float
-        clean = re.sub(r"[^\d,\.]", "", price_text).replace(".", "").replace(",", ".")
-        try:
-            return float(clean), link
-        except ValueError:
-            return None, link
-
-    except Exception:
-        return None, search_url
-
-
-# === 4. helpers za CS2 skinove ===
-
-def scrape_skinbaron(item_name: str) -> list:
-    cfg = SITES["SkinBaron"]
-    query = re.sub(r'\s+', '+', item_name.strip())
-    url = cfg["search_url"].format(query=query)
-    price, link = scrape_site(url, cfg, item_name.lower(), [w.lower() for w in item_name.split()])
-    return [{"site": "SkinBaron", "market_price": price, "url": link}] if price is not None else []
-
-def scrape_skinport(item_name: str) -> list:
-    cfg = SITES["SkinPort"]
-    query = re.sub(r'\s+', '+', item_name.strip())
-    url = cfg["search_url"].format(query=query)
-    price, link = scrape_site(url, cfg, item_name.lower(), [w.lower() for w in item_name.split()])
-    return [{"site": "SkinPort", "market_price": price, "url": link}] if price is not None else []
-
-def compare_skin_offers(item_name: str) -> str:
-    sb = scrape_skinbaron(item_name)
-    sp = scrape_skinport(item_name)
-    all_offers = sb + sp
-    if not all_offers:
-        return json.dumps({"best": None})
-    cheapest = min(all_offers, key=lambda o: o["market_price"])
-    return json.dumps({"best": cheapest})
+# tasks.py
+
+import asyncio
+import re
+
+import aiohttp
+from psycopg2.extras import execute_values
+
+from db import get_conn
+from taskqueue import TASKS_ID_SEQ, notify_new_tasks, url_hash
+from sites_config import SITES
+from fetch import get_engine
+from httpcache import get_http_cache
+from procpool import get_process_runner
+from extractors import get_extractor, TitleParser, LinkParser
+from ratelimit import get_host_limiter
+import primes
+
+
+def execute_task(task, timeout=None):
+    """
+    Prema task.type poziva odgovarajuću funkciju.
+    'task' je objekt s atributima id, type, parameters, itd.
+    timeout (sekunde) prekida count_primes; ostali tipi ga ne koriste.
+    """
+    try:
+        t = task.type
+        params = task.parameters.strip()
+
+        if t == 'count_primes':
+            return count_primes(int(params), timeout)
+
+        elif t == 'reverse':
+            return params[::-1]
+
+        elif t == 'uppercase':
+            return params.upper()
+
+        elif t == 'scrape':
+            return dispatch_scrape_subtasks(task.id, params)
+
+        elif t == 'scrape_url':
+            return scrape_single_url(params)
+
+        elif t == 'compare_offers':
+            return compare_offers(params)
+
+        elif t == 'compare_skin_offers':
+            return compare_skin_offers(params)
+
+        else:
+            return f"Unknown task type: {t}"
+    except Exception as e:
+        return f"Error while executing {task.type}: {e}"
+
+
+async def execute_task_async(task):
+    """
+    Async inačica execute_task za zadatke koji samo čekaju mrežu; izvršava
+    se na loopu fetch engine-a, pa jedan radnik može imati stotine u letu.
+    """
+    try:
+        t = task.type
+        params = task.parameters.strip()
+
+        if t == 'scrape_url':
+            return await scrape_single_url_async(params)
+
+        else:
+            return f"Unknown async task type: {t}"
+    except Exception as e:
+        return f"Error while executing {task.type}: {e}"
+
+
+# === 1. count_primes ===
+
+def count_primes(n, timeout=None):
+    """
+    Broj prostih <= n, segmentiranim sitom (primes.py); veliki n se
+    dijeli na više procesa, a već izračunati prefiksi se pamte.
+    """
+    return primes.count_primes(n, timeout)
+
+
+# === 2. dispatch_scrape_subtasks i scrape_single_url ===
+
+# Broj redova po višeredčanom INSERT-u kod fan-outa
+SUBTASK_CHUNK = 1000
+
+
+def dispatch_scrape_subtasks(parent_task_id, url):
+    """
+    Scrapea URL i za svaki apsolutni <a href=...> kreira novi subtask.
+    Vraća rezultat parent taska, koji radnik upisuje kroz complete_tasks
+    (ponovljeni dispatch preskače već dodane URL-ove).
+    Stranica se parsira inkrementalno kako stiže, bez spremanja tijela.
+    """
+    try:
+        parser = LinkParser()
+        engine = get_engine()
+        engine.run(engine.stream(url, parser.feed_chunk, offload=True))
+        links = parser.links
+
+        # jedan višeredčani INSERT po stranici od SUBTASK_CHUNK linkova;
+        # URL-ovi koji su već dodani kao scrape_url zadatak (isti url_hash u task_urls) se preskaču
+        rows = [(link, parent_task_id, url_hash(link)) for link in sorted(links)]
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                inserted = execute_values(
+                    cur,
+                    f"""
+                    WITH v(parameters, parent_id, url_hash) AS (VALUES %s),
+                    url AS (
+                      INSERT INTO task_urls(url_hash, task_id)
+                      SELECT url_hash, nextval('{TASKS_ID_SEQ}'::regclass) FROM v
+                      ON CONFLICT (url_hash) DO NOTHING
+                      RETURNING url_hash, task_id
+                    )
+                    INSERT INTO tasks(id, type, parameters, status, created_at, updated_at,
+                                      parent_id, url_hash)
+                    SELECT url.task_id, 'scrape_url', v.parameters, 'pending', now(), now(),
+                           v.parent_id, v.url_hash
+                      FROM v JOIN url USING (url_hash)
+                    RETURNING id
+                    """,
+                    rows,
+                    template="(%s::text, %s::int, %s::bytea)",
+                    page_size=SUBTASK_CHUNK,
+                    fetch=True,
+                )
+                count = len(inserted)
+                notify_new_tasks(cur, count)
+            conn.commit()
+
+        return f"Dispatched {count} subtasks ({len(rows) - count} duplicates skipped)"
+
+    except Exception as e:
+        return f"Error in dispatch_scrape_subtasks: {e}"
+
+
+async def scrape_single_url_async(url):
+    """
+    Scrapea URL i vraća njegov <title> i duljinu HTML sadržaja. Tijelo se
+    ne sprema: parser se hrani dijelovima dok ne nađe naslov, a ostatak se
+    samo broji (najviše FETCH_MAX_BYTES). Latencija i 429/503 odgovori idu
+    u ograničenje po hostu; odbijeni dohvat vraća Throttled (zadatak ide u red).
+    """
+    limiter = get_host_limiter()
+    try:
+        parser = TitleParser()
+        try:
+            resp = await get_engine().stream(url, parser.feed_chunk)
+        except aiohttp.ClientResponseError as e:
+            throttled = limiter.observe(url, status=e.status, headers=e.headers)
+            if throttled is not None:
+                return throttled
+            raise
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            limiter.observe(url)
+            raise
+        limiter.observe(url, resp.elapsed)
+        title_text = parser.title if parser.title is not None else '(no title)'
+        if resp.truncated:
+            return f"Title: {title_text} (length >{resp.length} chars, truncated)"
+        return f"Title: {title_text} (length {resp.length} chars)"
+    except Exception as e:
+        return f"Error scraping {url}: {e}"
+
+
+def scrape_single_url(url):
+    return get_engine().run(scrape_single_url_async(url))
+
+
+# === 3. compare_offers i generički scraper ===
+
+# Parsiranje jedne stranice pretrage koje traje dulje od ovoga se prekida
+PARSE_TIMEOUT = 30
+
+def compare_offers(product_name: str) -> dict:
+    """
+    Scrapea Links i Instar, vraća dict (sprema se u tasks.result_json):
+      { "offers":[{"site",price,url},…], "best":site_name }
+    Preskače sve gdje price=None, best=None ako nema ponuda. Siteovi čiji
+    dohvat ili parsiranje nije uspjelo navode se u "errors" ({site: opis}),
+    a takav rezultat se ne pamti (executors.ResultMemo).
+    """
+    offers, errors = [], {}
+    for site_name, price, link, error in scrape_sites(("Links", "Instar"), product_name):
+        if error:
+            errors[site_name] = error
+        elif price is not None:
+            offers.append({
+                "site": site_name,
+                "price": price,
+                "url": link
+            })
+
+    best_offer = min(offers, key=lambda o: o["price"]) if offers else None
+    result = {"offers": offers, "best": best_offer["site"] if best_offer else None}
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+def scrape_sites(site_names, product_name: str) -> list:
+    """
+    Dohvaća stranice pretrage svih navedenih siteova istovremeno, kroz HTTP
+    cache (TTL po siteu: SITES[...]["cache_ttl"]), a parsira ih paralelno u
+    poolu procesa. Vraća [(site_name, float price or None, url, error), ...] istim
+    redom; error je None ili opis neuspjelog dohvata/parsiranja (price je tada None).
+    """
+    query = re.sub(r'\s+', '+', product_name.strip())
+    full_phrase = product_name.strip().lower()
+    keywords = [w.lower() for w in product_name.strip().split()]
+
+    urls = [SITES[name]["search_url"].format(query=query) for name in site_names]
+    pages = get_http_cache().fetch_many(
+        [(url, SITES[name].get("cache_ttl", 0)) for name, url in zip(site_names, urls)])
+
+    fetched = [i for i, page in enumerate(pages) if not isinstance(page, Exception)]
+    parsed = get_process_runner().map(
+        parse_site,
+        [(pages[i].text, urls[i], SITES[site_names[i]], full_phrase, keywords) for i in fetched],
+        PARSE_TIMEOUT,
+    )
+    results = dict(zip(fetched, parsed))
+
+    out = []
+    for i, (name, url) in enumerate(zip(site_names, urls)):
+        res = pages[i] if i not in results else results[i]
+        if isinstance(res, Exception):
+            out.append((name, None, url, f"{type(res).__name__}: {res}"))
+        elif res is None:
+            out.append((name, None, url, "no result"))
+        else:
+            out.append((name, res[0], res[1], None))
+    return out
+
+
+def parse_site(html: str, search_url: str, cfg: dict, full_phrase: str, keywords: list):
+    """
+    Parsira već dohvaćenu stranicu pretrage unaprijed kompiliranim
+    extractorom (extractors.py); vraća (float price or None, product_url).
+    """
+    try:
+        return get_extractor(cfg).extract(html, search_url, full_phrase, keywords)
+    except Exception:
+        return None, search_url
+
+
+# === 4. helpers za CS2 skinove ===
+
+def _skin_offers(site_names, item_name: str) -> tuple:
+    """(ponude s cijenom, {site: opis greške} za neuspjele dohvate)."""
+    offers, errors = [], {}
+    for site, price, link, error in scrape_sites(site_names, item_name):
+        if error:
+            errors[site] = error
+        elif price is not None:
+            offers.append({"site": site, "market_price": price, "url": link})
+    return offers, errors
+
+def scrape_skinbaron(item_name: str) -> list:
+    return _skin_offers(("SkinBaron",), item_name)[0]
+
+def scrape_skinport(item_name: str) -> list:
+    return _skin_offers(("SkinPort",), item_name)[0]
+
+def compare_skin_offers(item_name: str) -> dict:
+    # oba marketa istovremeno
+    all_offers, errors = _skin_offers(("SkinBaron", "SkinPort"), item_name)
+    cheapest = min(all_offers, key=lambda o: o["market_price"]) if all_offers else None
+    result = {"best": cheapest}
+    if errors:
+        result["errors"] = errors
+    return result
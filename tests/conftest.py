@@ -0,0 +1,23 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# moduli čitaju DATABASE_URL pri importu; čisti unit testovi bazu ne otvaraju
+os.environ.setdefault("DATABASE_URL", "postgres://appuser@127.0.0.1:5432/appdb")
+
+
+@pytest.fixture
+def db():
+    """Testovi nad pravim Postgresom (DATABASE_URL); bez njega se preskaču."""
+    import psycopg2
+    from db import DATABASE_URL, init_db
+    try:
+        psycopg2.connect(DATABASE_URL, connect_timeout=2).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres nije dostupan: {e}")
+    init_db()
@@ -0,0 +1,120 @@
+# tests/test_add_tasks.py
+
+import uuid
+
+import pytest
+
+from db import get_conn
+from taskqueue import _copy_text, insert_task, insert_tasks, url_hash
+
+
+@pytest.mark.parametrize("data, error", [
+    ([], "task must be an object"),
+    ({"type": "reverse"}, "type i parameters required"),
+    ({"type": ["reverse"], "parameters": "x"}, "type and parameters must be strings"),
+    ({"type": "reverse", "parameters": {"a": 1}}, "type and parameters must be strings"),
+    ({"type": "count_primes", "parameters": 100}, "type and parameters must be strings"),
+    ({"type": "reverse", "parameters": "x", "priority": True}, "priority must be a smallint"),
+    ({"type": "reverse", "parameters": "x", "priority": 1.5}, "priority must be a smallint"),
+    ({"type": "reverse", "parameters": "x", "priority": 40000}, "priority must be a smallint"),
+    ({"type": "reverse", "parameters": "x", "queue": 7}, "queue must be a string"),
+    ({"type": "reverse", "parameters": "a\x00b"}, "strings must not contain NUL characters"),
+])
+def test_parse_task_rejects(data, error):
+    import main
+    assert main.parse_task(data) == (None, error)
+
+
+def test_parse_task_accepts():
+    import main
+    assert main.parse_task({"type": "reverse", "parameters": "x"}) == \
+        (("reverse", "x", 0, None), None)
+    assert main.parse_task({"type": "reverse", "parameters": "x", "priority": -5, "queue": "q"}) == \
+        (("reverse", "x", -5, "q"), None)
+
+
+def test_add_tasks_endpoint_rejects_bad_types():
+    import main
+    client = main.app.test_client()
+    resp = client.post("/api/add_task", json={"type": "reverse", "parameters": 5})
+    assert resp.status_code == 400
+    resp = client.post("/api/add_tasks", json=[{"type": "reverse", "parameters": "x", "priority": False}])
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "task 0: priority must be a smallint"
+
+
+def test_copy_text_escapes():
+    assert _copy_text("a\tb") == "a\\tb"
+    assert _copy_text("a\nb\rc") == "a\\nb\\rc"
+    assert _copy_text("a\\b") == "a\\\\b"
+    assert _copy_text("\\N") == "\\\\N"
+
+
+VALUES = ["tab\there", "line\nbreak\r\n", "back\\slash", "\\N", "\\\\N\t\\", "čćž €"]
+
+def test_copy_round_trip(db):
+    rows = [("reverse", v, -5, v) for v in VALUES]
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            ids = insert_tasks(cur, rows)
+            cur.execute("SELECT id, parameters, queue FROM tasks WHERE id = ANY(%s) ORDER BY id;", (ids,))
+            got = {r["id"]: (r["parameters"], r["queue"]) for r in cur.fetchall()}
+        conn.rollback()
+    assert [got[i] for i in ids] == [(v, v) for v in VALUES]
+
+
+def test_scrape_url_dedup_on_insert(db):
+    url = f"http://dedup.test/{uuid.uuid4()}"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            tid, created = insert_task(cur, "scrape_url", url, -5)
+            assert created
+            assert insert_task(cur, "scrape_url", url, -5) == (tid, False)
+            # ostali tipovi se ne dedupliciraju
+            assert insert_task(cur, "reverse", url, -5)[1]
+            assert insert_task(cur, "reverse", url, -5)[1]
+
+            rows = [("scrape_url", url, -5, None), ("reverse", "x", -5, None),
+                    ("scrape_url", url + "/b", -5, None), ("scrape_url", url + "/b", -5, None)]
+            ids = insert_tasks(cur, rows)
+            assert len(ids) == 2 and ids == sorted(ids)
+            cur.execute("SELECT type, parameters FROM tasks WHERE id = ANY(%s) ORDER BY id;", (ids,))
+            assert [(r["type"], r["parameters"]) for r in cur.fetchall()] == \
+                [("reverse", "x"), ("scrape_url", url + "/b")]
+        conn.rollback()
+
+
+def test_scrape_url_dedup_survives_archive(db):
+    url = f"http://dedup.test/{uuid.uuid4()}"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            tid, _ = insert_task(cur, "scrape_url", url, -5)
+            # archive_tasks briše red iz tasks, task_urls ostaje
+            cur.execute("DELETE FROM tasks WHERE id = %s;", (tid,))
+            assert insert_task(cur, "scrape_url", url, -5) == (tid, False)
+            assert insert_tasks(cur, [("scrape_url", url, -5, None)]) == []
+        conn.rollback()
+
+
+def test_add_task_endpoints_report_duplicates(db):
+    import main
+    client = main.app.test_client()
+    url = f"http://dedup.test/{uuid.uuid4()}"
+    try:
+        first = client.post("/api/add_task", json={"type": "scrape_url", "parameters": url, "priority": -5})
+        again = client.post("/api/add_task", json={"type": "scrape_url", "parameters": url, "priority": -5})
+        assert first.get_json()["duplicate"] is False
+        assert again.get_json() == dict(first.get_json(), duplicate=True)
+
+        bulk = client.post("/api/add_tasks", json=[
+            {"type": "scrape_url", "parameters": url, "priority": -5},
+            {"type": "scrape_url", "parameters": url + "/2", "priority": -5},
+        ]).get_json()
+        assert bulk["count"] == 1 and bulk["skipped"] == 1
+    finally:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM tasks WHERE parameters LIKE %s;", (url + "%",))
+                cur.execute("DELETE FROM task_urls WHERE url_hash = ANY(%s);",
+                            ([url_hash(url), url_hash(url + "/2")],))
+            conn.commit()
@@ -0,0 +1,82 @@
+# tests/test_autoscale.py
+
+import pytest
+
+import autoscale
+from autoscale import Autoscaler
+
+
+class Cpu:
+    def __init__(self, value=0.2):
+        self.value = value
+
+    def usage(self):
+        return self.value
+
+
+BUSY = {"pending": 500, "workers": 2, "wait": 10.0}
+IDLE = {"pending": 0, "workers": 2, "wait": 0.0}
+BETWEEN = {"pending": 20, "workers": 2, "wait": 2.0}
+
+
+@pytest.fixture
+def scaler(monkeypatch):
+    monkeypatch.setattr(autoscale, "AUTOSCALE_UP_CHECKS", 2)
+    monkeypatch.setattr(autoscale, "AUTOSCALE_DOWN_CHECKS", 3)
+    monkeypatch.setattr(autoscale, "AUTOSCALE_COOLDOWN", 30)
+    a = Autoscaler(1, 8)
+    a.cpu = Cpu()
+    a._changed_at = -1e9
+    return a
+
+
+def test_scale_up_needs_consecutive_checks(scaler):
+    assert scaler.decide(4, BUSY) == (4, "steady")
+    assert scaler.decide(4, BUSY) == (6, "backlog")      # + pola trenutnog broja
+
+
+def test_interrupted_streak_starts_over(scaler):
+    scaler.decide(4, BUSY)
+    scaler.decide(4, BETWEEN)
+    assert scaler.decide(4, BUSY) == (4, "steady")
+    scaler.decide(4, BUSY)
+    scaler.decide(4, IDLE)
+    assert scaler.decide(4, IDLE) == (4, "steady")
+
+
+def test_scale_down_is_slower_and_by_one(scaler):
+    assert [scaler.decide(4, IDLE) for _ in range(3)] == [(4, "steady"), (4, "steady"), (3, "idle")]
+
+
+def test_cooldown_after_recorded_change(scaler):
+    scaler.decide(4, BUSY)
+    target, reason = scaler.decide(4, BUSY)
+    scaler.record(4, target, reason)
+    assert scaler.decide(6, BUSY) == (6, "cooldown")
+    assert scaler.decide(6, BUSY) == (6, "cooldown")
+    scaler._changed_at = -1e9
+    # streak se gradio i tijekom cooldowna
+    assert scaler.decide(6, BUSY) == (8, "backlog")
+    assert scaler.last_decision["to"] == 6
+
+
+def test_saturated_cpu_blocks_scale_up(scaler):
+    scaler.cpu = Cpu(0.95)
+    assert [scaler.decide(4, BUSY) for _ in range(3)] == [(4, "steady")] * 3
+
+
+def test_bounds(scaler):
+    assert scaler.decide(0, BUSY) == (1, "bounds")
+    assert scaler.decide(12, IDLE) == (8, "bounds")
+    scaler.decide(8, BUSY)
+    assert scaler.decide(8, BUSY) == (8, "steady")
+    for _ in range(3):
+        result = scaler.decide(1, IDLE)
+    assert result == (1, "steady")
+
+
+def test_backlog_is_per_cluster_worker(scaler):
+    # 40 pending na 1 radnika je iznad UP_BACKLOG (32), na 10 radnika nije
+    assert scaler._wanted({"pending": 40, "workers": 1, "wait": 0.0}) == 1
+    assert scaler._wanted({"pending": 40, "workers": 10, "wait": 0.0}) == 0
+    assert scaler._wanted({"pending": 40, "workers": 0, "wait": 0.0}) == 1
@@ -0,0 +1,88 @@
+# tests/test_db_pool.py
+
+import os
+import threading
+
+import pytest
+
+import db as dbmod
+from db import DATABASE_URL, ConnectionPool, PoolTimeout, get_pool
+
+
+@pytest.fixture
+def pool(db):
+    p = ConnectionPool(DATABASE_URL, 0, 2, 5)
+    yield p
+    p.closeall()
+
+
+def test_exhausted_pool_times_out(pool):
+    a, b = pool.getconn(), pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.1)
+    assert pool.stats()["timeouts"] == 1 and pool.stats()["in_use"] == 2
+    pool.putconn(a)
+    assert pool.getconn(timeout=0.1) is a
+    pool.putconn(a)
+    pool.putconn(b)
+
+
+def test_waiter_gets_returned_connection(pool):
+    a, b = pool.getconn(), pool.getconn()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.getconn(timeout=5)))
+    t.start()
+    while pool.stats()["waiting"] == 0:
+        t.join(0.01)
+    pool.putconn(b)
+    t.join(5)
+    assert got == [b]
+    pool.putconn(a)
+    pool.putconn(b)
+
+
+def test_putconn_rolls_back_open_transaction(pool):
+    conn = pool.getconn()
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE pool_probe (x int);")
+    pool.putconn(conn)
+    conn = pool.getconn()
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('pg_temp.pool_probe') AS t;")
+        assert cur.fetchone()["t"] is None
+    pool.putconn(conn)
+
+
+def test_dead_connections_are_replaced(pool, monkeypatch):
+    closed = pool.getconn()
+    closed.close()
+    pool.putconn(closed)
+    assert pool.stats()["size"] == 0 and pool.stats()["discarded"] == 1
+
+    # konekciju koju je server prekinuo dok je čekala u poolu otkrije SELECT 1
+    conn = pool.getconn()
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_backend_pid() AS pid;")
+        pid = cur.fetchone()["pid"]
+    conn.rollback()
+    pool.putconn(conn)
+    with dbmod.get_conn() as other:
+        with other.cursor() as cur:
+            cur.execute("SELECT pg_terminate_backend(%s);", (pid,))
+        other.commit()
+    monkeypatch.setattr(dbmod, "DB_POOL_PING_AFTER", 0)
+    fresh = pool.getconn()
+    assert fresh is not conn and not fresh.closed
+    assert pool.stats()["discarded"] == 2 and pool.stats()["size"] == 1
+    pool.putconn(fresh)
+
+
+def test_pool_is_recreated_after_fork(db, monkeypatch):
+    parent = get_pool()
+    monkeypatch.setattr(dbmod, "_pool", parent)
+    # kao da je get_pool pozvan u djetetu nakon fork-a
+    monkeypatch.setattr(dbmod, "_pool_pid", -1)
+    child = get_pool()
+    assert child is not parent and dbmod._pool_pid == os.getpid()
+    assert get_pool() is child
+    child.closeall()
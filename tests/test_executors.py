@@ -0,0 +1,27 @@
+# tests/test_executors.py
+
+import threading
+
+import pytest
+
+from executors import TaskExecutor
+
+
+class T:
+    def __init__(self, type, parameters):
+        self.type, self.parameters = type, parameters
+
+
+class RejectingPool:
+    def submit(self, *args):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+
+def test_failed_submit_releases_limit():
+    executor = TaskExecutor.__new__(TaskExecutor)
+    executor._threads = RejectingPool()
+    sem = threading.BoundedSemaphore(1)
+    executor._limits = {"scrape": sem}
+    with pytest.raises(RuntimeError):
+        executor._start(T("scrape", "x"))
+    assert sem.acquire(blocking=False)
@@ -0,0 +1,77 @@
+# tests/test_fencing.py
+
+import pytest
+
+from db import get_conn
+from taskqueue import claims, complete_tasks, defer_tasks, release_tasks
+
+
+def _sql(query, params=()):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            row = cur.fetchone() if cur.description else None
+        conn.commit()
+    return row
+
+
+def _claim(task_id, worker):
+    """Preuzimanje kao claim_tasks, samo za zadani zadatak."""
+    return _sql("""
+      UPDATE tasks SET status = 'in_progress', worker_id = %s, started_at = clock_timestamp()
+       WHERE id = %s RETURNING id, started_at;
+    """, (worker, task_id))
+
+
+@pytest.fixture
+def task(db):
+    row = _sql("""
+      INSERT INTO tasks(type, parameters, status, priority)
+      VALUES ('reverse', 'fencing', 'pending', -5) RETURNING id;
+    """)
+    yield row["id"]
+    _sql("DELETE FROM tasks WHERE id = %s;", (row["id"],))
+
+
+def _state(task_id):
+    return _sql("SELECT status, worker_id, attempts FROM tasks WHERE id = %s;", (task_id,))
+
+
+def test_stale_claim_cannot_release_defer_or_complete(task):
+    old = _claim(task, "slow")
+    # reaper ga je vratio u red i preuzeo ga je drugi radnik
+    new = _claim(task, "fast")
+    assert old["started_at"] != new["started_at"]
+
+    release_tasks(claims([old]))
+    defer_tasks({task: 30}, dict(claims([old])), count_attempt=True)
+    complete_tasks("slow", [(task, "late", False, old["started_at"])])
+    assert _state(task) == {"status": "in_progress", "worker_id": "fast", "attempts": 0}
+
+    complete_tasks("fast", [(task, "ok", False, new["started_at"])])
+    assert _state(task)["status"] == "completed"
+
+
+def test_current_claim_releases_and_defers(task):
+    claim = _claim(task, "w")
+    release_tasks(claims([claim]))
+    assert _state(task)["status"] == "pending"
+
+    claim = _claim(task, "w")
+    defer_tasks({task: 30}, dict(claims([claim])), count_attempt=True)
+    assert _state(task) == {"status": "pending", "worker_id": None, "attempts": 1}
+
+
+def test_release_and_requeue_drop_token_reservation(task):
+    from taskqueue import requeue_lost_tasks
+
+    reserved = "SELECT token_reserved FROM tasks WHERE id = %s;"
+    claim = _claim(task, "w")
+    _sql("UPDATE tasks SET token_reserved = true WHERE id = %s;", (task,))
+    release_tasks(claims([claim]))
+    assert _sql(reserved, (task,))["token_reserved"] is False
+
+    _claim(task, "w")
+    _sql("UPDATE tasks SET token_reserved = true WHERE id = %s;", (task,))
+    assert requeue_lost_tasks(3, 1, 10, task_ids=[task]) == {"pending": 1}
+    assert _sql(reserved, (task,))["token_reserved"] is False
@@ -0,0 +1,73 @@
+# tests/test_httpcache.py
+
+import datetime
+import uuid
+
+from db import get_conn
+from httpcache import HttpCache, prune_http_cache, _key
+
+
+def _row(key):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT filling_until FROM http_cache WHERE url_hash = %s;", (key,))
+            return cur.fetchone()
+
+
+def _cleanup(*keys):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM http_cache WHERE url_hash = ANY(%s);", (list(keys),))
+        conn.commit()
+
+
+def test_release_only_clears_own_claim(db):
+    cache = HttpCache(None, 8, True)
+    url = f"http://cache.test/{uuid.uuid4()}"
+    key = _key(url)
+    try:
+        claim = cache._db_claim(key, url)
+        assert claim and cache._db_claim(key, url) is False
+
+        # claim je istekao i red je zauzela druga instanca
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                  UPDATE http_cache SET filling_until = now() + interval '1 minute'
+                   WHERE url_hash = %s RETURNING filling_until;
+                """, (key,))
+                other = cur.fetchone()["filling_until"]
+            conn.commit()
+        cache._db_release(key, claim)
+        assert _row(key)["filling_until"] == other
+
+        cache._db_release(key, other)
+        assert _row(key)["filling_until"] is None
+    finally:
+        _cleanup(key)
+
+
+def test_prune_keeps_fresh_and_filling_rows(db):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = {
+        "old": (now - datetime.timedelta(hours=30), None),
+        "recent": (now - datetime.timedelta(hours=1), None),
+        "fresh": (now + datetime.timedelta(hours=1), None),
+        "filling": (None, now + datetime.timedelta(minutes=1)),
+        "abandoned": (None, None),
+    }
+    keys = {name: _key(f"http://cache.test/{uuid.uuid4()}/{name}") for name in rows}
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                for name, (expires, filling) in rows.items():
+                    cur.execute("""
+                      INSERT INTO http_cache(url_hash, url, expires_at, filling_until)
+                      VALUES (%s, %s, %s, %s);
+                    """, (keys[name], name, expires, filling))
+            conn.commit()
+        while prune_http_cache(24, 1000):
+            pass
+        assert {name for name, key in keys.items() if _row(key)} == {"recent", "fresh", "filling"}
+    finally:
+        _cleanup(*keys.values())
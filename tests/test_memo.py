@@ -0,0 +1,84 @@
+from concurrent.futures import Future
+
+import pytest
+
+from executors import ResultMemo, memo_key, _is_error
+
+
+POLICIES = {"compare_offers": {"key": str.strip, "ttl": 300, "size": 2}}
+
+
+class T:
+    def __init__(self, type, parameters):
+        self.type, self.parameters = type, parameters
+
+
+def run(memo, key, result):
+    fut, owner = memo.claim("compare_offers", key)
+    assert owner
+    source = Future()
+    memo.follow("compare_offers", key, fut, source)
+    source.set_result(result)
+    return fut
+
+
+def test_duplicates_coalesce_while_inflight():
+    memo = ResultMemo(POLICIES)
+    fut, owner = memo.claim("compare_offers", "rtx")
+    dup, dup_owner = memo.claim("compare_offers", "rtx")
+    assert owner and not dup_owner and dup is fut
+
+    source = Future()
+    memo.follow("compare_offers", "rtx", fut, source)
+    source.set_result({"offers": [], "best": None})
+    assert dup.result(timeout=1) == {"offers": [], "best": None}
+
+    hit, hit_owner = memo.claim("compare_offers", "rtx")
+    assert not hit_owner and hit.result(timeout=1) == {"offers": [], "best": None}
+    assert memo.stats()["compare_offers"] == {"hits": 1, "coalesced": 1, "misses": 1, "entries": 1}
+
+
+@pytest.mark.parametrize("result", [
+    "Error: boom",
+    {"offers": [], "best": None, "errors": {"Links": "ConnectError: refused"}},
+    {"best": None, "errors": {"SkinPort": "TaskTimeout: "}},
+])
+def test_failed_results_are_not_memoized(result):
+    memo = ResultMemo(POLICIES)
+    assert run(memo, "rtx", result).result(timeout=1) == result
+    _, owner = memo.claim("compare_offers", "rtx")
+    assert owner
+    assert memo.stats()["compare_offers"]["entries"] == 0
+
+
+def test_exception_propagates_and_is_not_memoized():
+    memo = ResultMemo(POLICIES)
+    fut, _ = memo.claim("compare_offers", "rtx")
+    source = Future()
+    memo.follow("compare_offers", "rtx", fut, source)
+    source.set_exception(RuntimeError("boom"))
+    with pytest.raises(RuntimeError):
+        fut.result(timeout=1)
+    assert memo.claim("compare_offers", "rtx")[1]
+
+
+def test_lru_keeps_size_entries():
+    memo = ResultMemo(POLICIES)
+    for key in ("a", "b", "c"):
+        run(memo, key, {"offers": [], "best": None})
+    assert memo.claim("compare_offers", "a")[1]
+    assert not memo.claim("compare_offers", "c")[1]
+
+
+def test_memo_key_normalizes_parameters():
+    assert memo_key(T("compare_offers", "  RTX   4090 ")) == "rtx 4090"
+    assert memo_key(T("count_primes", " 0100 ")) == "100"
+    assert memo_key(T("count_primes", "abc")) is None
+    assert memo_key(T("scrape_url", "http://x")) is None
+
+
+def test_is_error():
+    assert _is_error("Error: x")
+    assert not _is_error("ok")
+    assert not _is_error({"offers": [], "best": None})
+    assert _is_error({"best": None, "errors": {"SkinBaron": "x"}})
@@ -0,0 +1,118 @@
+import pytest
+
+import primes
+from primes import PrimeCounter, SieveTimeout, _count_segment
+
+
+def naive(n):
+    return sum(all(k % d for d in range(2, int(k ** 0.5) + 1)) for k in range(2, n + 1))
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 10, 100, 1000, 7919, 10007])
+def test_count_matches_naive(n):
+    assert PrimeCounter(1).count(n) == naive(n)
+
+
+def test_known_values_across_segments(monkeypatch):
+    monkeypatch.setattr(primes, "SEGMENT_SIZE", 1000)
+    counter = PrimeCounter(1)
+    assert counter.count(10 ** 6) == 78498
+    assert counter.count(10 ** 5) == 9592
+    assert counter.count(10 ** 6 + 1000) == 78573
+
+
+def test_segment_bounds():
+    assert _count_segment(0, 3) == 1
+    assert _count_segment(2, 3) == 1
+    assert _count_segment(3, 4) == 1
+    assert _count_segment(90, 97) == 0
+    assert _count_segment(90, 98) == 1
+
+
+def test_timeout_keeps_computed_prefixes():
+    counter = PrimeCounter(1)
+    with pytest.raises(SieveTimeout):
+        counter.count(3 * 10 ** 9, timeout=0.2)
+    assert len(counter._keys) > 1
+    k, total = counter._nearest_below(3 * 10 ** 9)
+    assert total == PrimeCounter(1).count(k)
+
+
+def test_remember_drops_densest_points(monkeypatch):
+    monkeypatch.setattr(primes, "PREFIX_CACHE_SIZE", 5)
+    counter = PrimeCounter(1)
+    counter._remember([(100, 25), (1000, 168), (1010, 169), (1020, 171), (10000, 1229)])
+    # 1010 ima najbliže susjede (1000 i 1020), pa ispada prvi
+    assert counter._keys == [1, 100, 1000, 1020, 10000]
+    assert set(counter._counts) == set(counter._keys)
+    counter._remember([(10001, 1229)])
+    assert counter._keys[0] == 1 and counter._keys[-1] == 10001
+    assert len(counter._keys) == 5
+
+
+def test_pool_is_created_once(monkeypatch):
+    import threading
+    created = []
+    monkeypatch.setattr(primes, "ProcessPoolExecutor", lambda **kw: created.append(kw) or object())
+    counter = PrimeCounter(4)
+    threads = [threading.Thread(target=counter._pool) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(created) == 1
+
+
+class FakePool:
+    """Izvršava segmente odmah; prati koliko ih je predano, a još nepročitano."""
+
+    def __init__(self, broken_after=None):
+        self.broken_after = broken_after
+        self.submitted = self.read = self.max_in_flight = 0
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+        if self.broken_after is not None and self.submitted >= self.broken_after:
+            raise BrokenProcessPool("worker died")
+        self.submitted += 1
+        self.max_in_flight = max(self.max_in_flight, self.submitted - self.read)
+        pool, fut = self, Future()
+        fut.set_result(fn(*args))
+        result = fut.result
+        def read(timeout=None):
+            pool.read += 1
+            return result(timeout)
+        fut.result = read
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(primes, "SEGMENT_SIZE", 1000)
+    monkeypatch.setattr(primes, "PARALLEL_THRESHOLD", 0)
+
+
+def test_parallel_submits_bounded_window(small_segments):
+    counter = PrimeCounter(2)
+    counter._executor = pool = FakePool()
+    assert counter.count(10 ** 6) == 78498
+    assert pool.submitted == 1001
+    assert pool.max_in_flight == primes.SEGMENTS_IN_FLIGHT * 2
+
+
+def test_broken_pool_is_replaced(small_segments):
+    from concurrent.futures.process import BrokenProcessPool
+    counter = PrimeCounter(2)
+    counter._executor = broken = FakePool(broken_after=10)
+    with pytest.raises(BrokenProcessPool):
+        counter.count(10 ** 6)
+    assert broken.shut_down and counter._executor is None
+    # izračunati prefiksi ostaju, a novi pool nastavlja od njih
+    counter._executor = pool = FakePool()
+    assert counter.count(10 ** 6) == 78498
+    assert pool.submitted < 1001
@@ -0,0 +1,96 @@
+# tests/test_ratelimit.py
+
+import uuid
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import ratelimit
+from db import get_conn
+from ratelimit import HostLimiter, Throttled, host_of, retry_after_seconds
+
+
+def row(**kw):
+    r = {"host": "h", "tokens": 4.0, "concurrency": 4.0, "latency": None,
+         "base_latency": None, "blocked_until": None}
+    r.update(kw)
+    return r
+
+
+def obs(n=0, latency=0.0, errors=0, throttled=0, retry_after=0.0):
+    return {"n": n, "latency": latency, "errors": errors, "throttled": throttled,
+            "retry_after": retry_after}
+
+
+def test_host_of():
+    assert host_of(" https://User@Example.com:8080/a?b ") == "example.com"
+    assert host_of("not a url") is None
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({"Retry-After": "7"}) == 7.0
+    assert retry_after_seconds({"Retry-After": "-3"}) == 0.0
+    assert retry_after_seconds({}) is None
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= retry_after_seconds({"Retry-After": when}) <= 60
+
+
+def test_success_grows_concurrency_additively():
+    host, tokens, rate, concurrency, latency, base, blocked, throttled = \
+        HostLimiter._adapt(row(), obs(n=4, latency=2.0), now=1000.0)
+    assert concurrency == 5.0            # +n/concurrency: jedan po prozoru
+    assert latency == base == 0.5
+    assert rate == 10.0                  # Littleov zakon: concurrency / latencija
+    assert blocked is None and throttled == 0
+
+
+def test_throttle_halves_and_blocks():
+    _, tokens, _, concurrency, _, _, blocked, throttled = \
+        HostLimiter._adapt(row(concurrency=8.0, blocked_until=1005.0),
+                           obs(throttled=2, retry_after=30.0), now=1000.0)
+    assert concurrency == 4.0 and tokens == 0.0
+    assert blocked == 1030.0 and throttled == 2
+
+
+def test_errors_halve_and_slowdown_shrinks():
+    assert HostLimiter._adapt(row(concurrency=8.0), obs(errors=1), 0)[3] == 4.0
+    slow = row(concurrency=10.0, latency=1.0, base_latency=0.2)
+    assert HostLimiter._adapt(slow, obs(n=1, latency=1.0), 0)[3] == pytest.approx(8.0)
+
+
+def test_concurrency_and_rate_are_bounded(monkeypatch):
+    monkeypatch.setattr(ratelimit, "HOST_CONCURRENCY_MAX", 6.0)
+    assert HostLimiter._adapt(row(concurrency=1.0), obs(errors=1), 0)[3] == ratelimit.HOST_CONCURRENCY_MIN
+    _, _, rate, concurrency, *_ = HostLimiter._adapt(row(concurrency=6.0), obs(n=50, latency=0.5), 0)
+    assert concurrency == 6.0 and rate == ratelimit.HOST_RATE_MAX
+
+
+def test_observe_returns_throttled():
+    limiter = HostLimiter()
+    t = limiter.observe("http://a.test/x", status=429, headers={"Retry-After": "12"})
+    assert isinstance(t, Throttled) and t.retry_after == 12.0
+    assert limiter.observe("http://a.test/y", latency=0.3, status=200) is None
+    limiter.observe("http://a.test/z")
+    assert limiter._observed["a.test"] == obs(n=1, latency=0.3, errors=1, throttled=1, retry_after=12.0)
+
+
+def test_acquire_spends_tokens_and_reserves(db, monkeypatch):
+    monkeypatch.setattr(ratelimit, "HOST_CONCURRENCY_START", 2.0)
+    host = f"{uuid.uuid4().hex}.test"
+    tasks = [{"id": i, "type": "scrape_url", "parameters": f"http://{host}/{i}"} for i in range(5)]
+    tasks.append({"id": 99, "type": "reverse", "parameters": "x"})
+    try:
+        go, reserved, released = HostLimiter().acquire(tasks)
+        # 2 tokena odmah, rate 2/s: sljedeći tokeni za 0.5 s, 1 s, 1.5 s
+        assert [t["id"] for t in go] == [0, 1, 99]
+        assert sorted(reserved) == [2, 3, 4] and released == []
+        assert reserved[2] == pytest.approx(0.5, abs=0.05)
+        assert reserved[4] == pytest.approx(1.5, abs=0.05)
+    finally:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM host_limits WHERE host = %s;", (host,))
+            conn.commit()
@@ -0,0 +1,71 @@
+# tests/test_scheduler.py
+
+import time
+
+from taskqueue import FairScheduler
+
+
+POLICIES = {
+    "light": {"weight": 1, "cap": None},
+    "heavy": {"weight": 3, "cap": None},
+    "capped": {"weight": 1, "cap": 2},
+}
+
+
+def scheduler(pending, running=None, passes=None):
+    """Scheduler sa zadanim stanjem reda; bez osvježavanja iz baze."""
+    s = FairScheduler(POLICIES, refresh_interval=3600)
+    s.pending, s.running, s.passes = set(pending), dict(running or {}), dict(passes or {})
+    s.refreshed_at = time.monotonic()
+    return s
+
+
+def claimed(**counts):
+    return [{"queue_name": q} for q, n in counts.items() for _ in range(n)]
+
+
+def test_quotas_follow_weights():
+    assert scheduler({"light", "heavy"}).quotas(8) == {"heavy": 6, "light": 2}
+
+
+def test_unknown_queue_gets_default_weight():
+    assert scheduler({"light", "other"}).quotas(6) == {"light": 3, "other": 3}
+
+
+def test_cap_limits_in_progress_per_queue():
+    s = scheduler({"capped", "light"}, running={"capped": 1})
+    assert s.quotas(6) == {"capped": 1, "light": 5}
+    s = scheduler({"capped"}, running={"capped": 2})
+    assert s.quotas(6) == {}
+
+
+def test_empty_scheduler_has_no_quotas():
+    assert scheduler(set()).quotas(10) == {}
+
+
+def test_charge_advances_pass_and_drops_drained_queues():
+    s = scheduler({"light", "heavy"})
+    quotas = s.quotas(4)
+    s.charge(quotas, claimed(heavy=3))
+    assert s.passes == {"heavy": 1.0}
+    assert s.running == {"heavy": 3}
+    assert s.pending == {"heavy"}   # light nije popunio kvotu, pa je prazan
+
+
+def test_stride_evens_out_over_batches():
+    s = scheduler({"light", "heavy"})
+    totals = {"light": 0, "heavy": 0}
+    for _ in range(10):
+        quotas = s.quotas(3)
+        s.charge(quotas, claimed(**quotas))
+        for q, n in quotas.items():
+            totals[q] += n
+    assert sum(totals.values()) == 30
+    assert abs(totals["heavy"] - 3 * totals["light"]) <= 4
+
+
+def test_new_queue_starts_from_current_minimum():
+    # light je već daleko odmakao; heavy koji se tek pojavio ne dobiva
+    # nadoknadu za vrijeme dok je bio prazan
+    s = scheduler({"light", "heavy"}, passes={"light": 100.0})
+    assert s.quotas(4) == {"heavy": 3, "light": 1}
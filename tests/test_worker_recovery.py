@@ -0,0 +1,105 @@
+# tests/test_worker_recovery.py
+
+import threading
+import time
+import uuid
+
+import pytest
+
+from db import get_conn
+from executors import TaskExecutor
+from taskqueue import get_heartbeat
+from utils import HEARTBEAT_INTERVAL, WORKER_TIMEOUT
+
+
+def _task(task_id):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT status, attempts, worker_id FROM tasks WHERE id = %s;", (task_id,))
+            return cur.fetchone()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_dead_worker_task_requeued_within_worker_timeout(db, monkeypatch):
+    import main
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              INSERT INTO tasks(type, parameters, status, priority, created_at, updated_at)
+              VALUES ('reverse', 'recovery', 'pending', 1000, now(), now())
+              RETURNING id;
+            """)
+            task_id = cur.fetchone()["id"]
+        conn.commit()
+
+    # radnik pogine usred zadatka; monitor ga "pokreće" bez stvarnog threada
+    started = threading.Event()
+    def crash(self, tasks, stop_evt=None, on_progress=None):
+        on_progress(tasks[0], 0)
+        started.set()
+        raise RuntimeError("worker crashed mid-task")
+    restarted = []
+    monkeypatch.setattr(TaskExecutor, "run_batch", crash)
+    monkeypatch.setattr(main, "spawn_worker", restarted.append)
+    monkeypatch.setattr(main, "BATCH_MAX_SIZE", 1)
+
+    wid = "test-recovery"
+    evt = threading.Event()
+    thr = threading.Thread(target=main.worker_loop, args=(wid, evt), daemon=True)
+    main.worker_threads[wid], main.shutdown_flags[wid] = thr, evt
+    try:
+        begin = time.monotonic()
+        thr.start()
+        assert started.wait(10)
+        thr.join(5)
+        assert _task(task_id)["status"] == "in_progress"
+
+        main.check_workers()
+        row = _task(task_id)
+        assert restarted == [wid]
+        assert row["status"] == "pending" and row["attempts"] == 1 and row["worker_id"] is None
+        assert time.monotonic() - begin < WORKER_TIMEOUT + HEARTBEAT_INTERVAL
+    finally:
+        main.worker_threads.pop(wid, None)
+        main.shutdown_flags.pop(wid, None)
+        get_heartbeat(HEARTBEAT_INTERVAL).unregister(main.worker_name(wid))
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM tasks WHERE id = %s;", (task_id,))
+            conn.commit()
+
+
+def test_dead_process_buffered_tasks_requeued_without_attempt(db):
+    from taskqueue import requeue_lost_tasks
+
+    prefix = f"test-{uuid.uuid4().hex[:8]}/p9."
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+              INSERT INTO tasks(type, parameters, status, priority, worker_id, started_at)
+              SELECT 'reverse', 'buffered-' || n, 'in_progress', -5, %s, now()
+                FROM generate_series(1, 3) AS n
+              RETURNING id;
+            """, (prefix + "dispatch",))
+            buffered, taken, direct = [r["id"] for r in cur.fetchall()]
+            cur.execute("UPDATE tasks SET worker_id = %s WHERE id = %s;", (prefix + "w2", direct))
+            # radnik je iz buffera uzeo `taken` i prijavio ga u heartbeatu
+            cur.execute("""
+              INSERT INTO worker_status(worker_id, status, last_seen, held)
+              VALUES (%s, 'Alive', now(), %s);
+            """, (prefix + "w1", [taken]))
+        conn.commit()
+    try:
+        assert requeue_lost_tasks(3, 1, 10, worker_prefix=prefix) == {"pending": 3}
+        states = {}
+        for tid in (buffered, taken, direct):
+            row = _task(tid)
+            states[tid] = (row["status"], row["attempts"])
+        assert states == {buffered: ("pending", 0), taken: ("pending", 1), direct: ("pending", 1)}
+    finally:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM tasks WHERE id = ANY(%s);", ([buffered, taken, direct],))
+                cur.execute("DELETE FROM worker_status WHERE worker_id LIKE %s;", (prefix + "%",))
+            conn.commit()
@@ -1,13 +1,53 @@
-# utils.py
-
-# Interval (u sekundama) za slanje heartbeat-a (i od strane lidera i od strane radnika)
-HEARTBEAT_INTERVAL = 2
-
-# Ako radnik ne ažurira last_seen unutar ovih sekundi, smatramo da je pao
-WORKER_TIMEOUT = 5
-
-# Ako lider ne ažurira last_seen unutar ovih sekundi, radnici pokreću election
-LEADER_TIMEOUT = 5
-
-# Radnici će svakih 5 sekundi ispisati svoj status (“Alive/Idle”)
-STATUS_PRINT_INTERVAL = 5
+# utils.py
+
+import os
+import socket
+
+# Interval (u sekundama) za slanje heartbeat-a (i od strane lidera i od strane radnika)
+HEARTBEAT_INTERVAL = 2
+
+# Ako radnik ne ažurira last_seen unutar ovih sekundi, smatramo da je pao
+WORKER_TIMEOUT = 5
+
+# Preuzeti zadatak pripada radniku najviše ovoliko sekundi (visibility timeout);
+# nakon toga ga lider vraća u red iako radnik još šalje heartbeat
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", 900))
+
+# Zadatak vraćen u red nakon pada radnika čeka RETRY_BACKOFF_BASE * 2^(pokušaj-1)
+# sekundi (najviše RETRY_BACKOFF_MAX); nakon MAX_ATTEMPTS pokušaja ide u status 'dead'
+MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", 5))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", 5))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", 600))
+
+# Ako lider ne ažurira last_seen unutar ovih sekundi, radnici pokreću election
+LEADER_TIMEOUT = 5
+
+# Ime ove instance aplikacije u clusteru (u dockeru hostname kontejnera)
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Radnici će svakih 5 sekundi ispisati svoj status (“Alive/Idle”)
+STATUS_PRINT_INTERVAL = 5
+
+# Koliko najviše zadataka radnik preuzima odjednom (1 = stari način, zadatak po zadatak)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))
+
+# Ciljano trajanje jednog batcha (u sekundama); dugi zadaci => manji batch
+BATCH_TARGET_SECONDS = float(os.getenv("BATCH_TARGET_SECONDS", 0.5))
+
+# Bez NOTIFY obavijesti, besposleni radnik red provjerava tek svakih ovoliko sekundi
+IDLE_POLL_INTERVAL = float(os.getenv("IDLE_POLL_INTERVAL", 10))
+
+# Završeni zadaci stariji od ovoliko sati sele se u tasks_history (0 = isključeno)
+ARCHIVE_AFTER_HOURS = float(os.getenv("ARCHIVE_AFTER_HOURS", 0))
+
+# Koliko često (u sekundama) i po koliko redova se arhivira
+ARCHIVE_INTERVAL = 60
+ARCHIVE_BATCH_SIZE = 5000
+
+# Radnici: WORKER_PROCESSES procesa s po WORKER_THREADS radnika (threadova), odvojeno
+# od web procesa; 0 procesa = WORKER_THREADS radnika u samom web procesu (stari način)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", 3))
+
+# Pri gašenju se na radnike (i procese radnika) čeka najviše ovoliko sekundi
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", 30))